@@ -0,0 +1,31 @@
+"""Add two-compartment model parameters to medication.
+
+Revision ID: 8f3b2d61c4a7
+Revises: 5c3c0a4be92b
+Create Date: 2026-10-17 10:00:00.000000
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+revision: str = "8f3b2d61c4a7"
+down_revision: Union[str, Sequence[str], None] = "5c3c0a4be92b"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE IF EXISTS medication ADD COLUMN IF NOT EXISTS pk_model_type VARCHAR NULL")
+    op.execute(
+        "ALTER TABLE IF EXISTS medication "
+        "ADD COLUMN IF NOT EXISTS intercompartmental_clearance_l_per_hr NUMERIC NULL"
+    )
+    op.execute("ALTER TABLE IF EXISTS medication ADD COLUMN IF NOT EXISTS peripheral_volume_l NUMERIC NULL")
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE IF EXISTS medication DROP COLUMN IF EXISTS peripheral_volume_l")
+    op.execute("ALTER TABLE IF EXISTS medication DROP COLUMN IF EXISTS intercompartmental_clearance_l_per_hr")
+    op.execute("ALTER TABLE IF EXISTS medication DROP COLUMN IF EXISTS pk_model_type")
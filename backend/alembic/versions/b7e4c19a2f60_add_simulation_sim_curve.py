@@ -0,0 +1,24 @@
+"""Add binary curve storage to simulation.
+
+Revision ID: b7e4c19a2f60
+Revises: 8f3b2d61c4a7
+Create Date: 2026-10-17 12:00:00.000000
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+revision: str = "b7e4c19a2f60"
+down_revision: Union[str, Sequence[str], None] = "8f3b2d61c4a7"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE IF EXISTS simulation ADD COLUMN IF NOT EXISTS sim_curve BYTEA NULL")
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE IF EXISTS simulation DROP COLUMN IF EXISTS sim_curve")
@@ -1,7 +1,7 @@
 import os
 from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel, HttpUrl
-from typing import Optional
+from pydantic import BaseModel, Field, HttpUrl
+from typing import Optional, Literal
 from sqlmodel import Session, select
 from sqlalchemy import delete
 from sqlalchemy.exc import IntegrityError
@@ -34,6 +34,9 @@ class MedicationCreate(BaseModel):
     therapeutic_window_lower_mg_l: Optional[float] = None
     therapeutic_window_upper_mg_l: Optional[float] = None
     source_url: Optional[HttpUrl] = None
+    pk_model_type: Optional[Literal["one_compartment", "two_compartment"]] = None
+    intercompartmental_clearance_l_per_hr: Optional[float] = Field(None, ge=0)
+    peripheral_volume_l: Optional[float] = Field(None, gt=0)
 
 
 class MedicationUpdate(BaseModel):
@@ -47,6 +50,9 @@ class MedicationUpdate(BaseModel):
     therapeutic_window_lower_mg_l: Optional[float] = None
     therapeutic_window_upper_mg_l: Optional[float] = None
     source_url: Optional[HttpUrl] = None
+    pk_model_type: Optional[Literal["one_compartment", "two_compartment"]] = None
+    intercompartmental_clearance_l_per_hr: Optional[float] = Field(None, ge=0)
+    peripheral_volume_l: Optional[float] = Field(None, gt=0)
 
 
 _DECIMAL_FIELDS = {
@@ -56,6 +62,8 @@ _DECIMAL_FIELDS = {
     "bioavailability_f",
     "therapeutic_window_lower_mg_l",
     "therapeutic_window_upper_mg_l",
+    "intercompartmental_clearance_l_per_hr",
+    "peripheral_volume_l",
 }
 
 
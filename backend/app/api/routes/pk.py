@@ -1,8 +1,10 @@
 from __future__ import annotations
+import json
 import os
-from typing import Optional, List, Annotated, Any
+from typing import Optional, List, Annotated, Any, Literal
 
 from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from sqlmodel import Session, select
 
@@ -11,7 +13,9 @@ from ...models import Medication
 from ...pharmacokinetics import (
     TherapeuticTargets,
     compute_prediction_accuracy_metrics,
+    compute_steady_state_metrics,
     fetch_drug_pharmacokinetics,
+    iter_concentration_timecourse,
     list_supported_tdm_drugs,
     predict_concentration_timecourse,
     evaluate_therapeutic_window,
@@ -20,6 +24,13 @@ from ...pharmacokinetics import (
     upsert_window_review_proposal,
     _float_to_dec,
 )
+from ...pk_downsampling import DEFAULT_MAX_CURVE_POINTS, downsample_curve, downsample_indices
+from ...pk_population import simulate_population
+from ...pk_schedule import predict_concentration_for_schedule, simulate_adherence
+from ...pk_sensitivity import DEFAULT_SENSITIVITY_FACTORS, compute_local_sensitivity
+from ...sim_admission import SIMULATION_ADMISSION, AdmissionRejected
+from ...sim_cache import SIMULATION_CACHE
+from ...sim_executor import run_cpu_bound
 
 router = APIRouter(prefix="/pk", tags=["Pharmacokinetics"])
 
@@ -28,7 +39,9 @@ def _medication_writes_locked() -> bool:
     raw = os.getenv("DEMO_LOCK_MEDICATION_WRITES", "")
     return raw.strip().lower() in {"1", "true", "yes", "on"}
 
-class SimulateRequest(BaseModel):
+class PKParams(BaseModel):
+    # Shared by every endpoint that simulates from PK parameters: either a drug to look up,
+    # explicit values, or both (explicit values override the looked-up ones).
     drug_name: Optional[str] = Field(
         None,
         description="If provided, fetch PK params for this drug first.",
@@ -38,6 +51,12 @@ class SimulateRequest(BaseModel):
     Vd_L: Optional[float] = None
     bioavailability: Optional[float] = Field(None, ge=0.0, le=1.0)
 
+class PKModelParams(PKParams):
+    pk_model: Literal["one_compartment", "two_compartment"] = "one_compartment"
+    intercompartmental_clearance_L_per_hr: Optional[float] = Field(None, ge=0)
+    peripheral_volume_L: Optional[float] = Field(None, gt=0)
+
+class SimulateRequest(PKModelParams):
     dose_mg: float = Field(..., gt=0)
     interval_hr: float = Field(..., gt=0, description="Dosing interval τ (hours).")
     num_doses: int = Field(..., ge=1)
@@ -48,13 +67,167 @@ class SimulateRequest(BaseModel):
     )
     body_weight_kg: Optional[float] = Field(None, gt=0)
     t_end_hr: Optional[float] = Field(None, gt=0)
-    dt_hr: float = Field(0.1, gt=0, description="Simulation step (hours).")
+    dt_hr: float = Field(
+        0.1,
+        gt=0,
+        description="Euler step (hours); output sampling interval for the analytic and adaptive engines.",
+    )
+    engine: Literal["analytic", "euler", "adaptive"] = Field(
+        "analytic",
+        description=(
+            "analytic = closed-form superposition; euler = fixed-step reference integrator; "
+            "adaptive = error-controlled ODE solver with dose events."
+        ),
+    )
+    max_points: int = Field(
+        DEFAULT_MAX_CURVE_POINTS,
+        ge=10,
+        le=20000,
+        description="Upper bound on returned points; every dose's peak and trough are always kept.",
+    )
+
+class StreamSimulateRequest(SimulateRequest):
+    chunk_points: int = Field(2000, ge=100, le=20000, description="Samples per streamed chunk.")
+    format: Literal["ndjson", "sse"] = Field(
+        "ndjson",
+        description="ndjson = one JSON object per line; sse = text/event-stream events.",
+    )
 
 class SimulateResponse(BaseModel):
     times_hr: List[float]
     conc_mg_per_L: List[float]
     params_used: dict
 
+class SteadyStateRequest(PKModelParams):
+    dose_mg: float = Field(..., gt=0)
+    interval_hr: float = Field(..., gt=0, description="Dosing interval τ (hours).")
+    absorption_rate_hr: Optional[float] = Field(
+        None,
+        gt=0,
+        description="ka; if not set, treated as IV/instant.",
+    )
+    therapeutic_min_mg_per_L: Optional[float] = Field(None, ge=0)
+    therapeutic_max_mg_per_L: Optional[float] = Field(None, gt=0)
+
+class SteadyStateResponse(BaseModel):
+    css_max_mg_l: float
+    css_min_mg_l: float
+    css_avg_mg_l: float
+    auc_tau_mg_h_l: float
+    t_max_ss_hr: float
+    accumulation_factor: float
+    fluctuation_pct: float
+    time_to_steady_state_hr: float
+    within_window: Optional[bool] = None
+    params_used: dict
+
+class PopulationSimulateRequest(PKParams):
+    dose_mg: float = Field(..., gt=0)
+    interval_hr: float = Field(..., gt=0, description="Dosing interval τ (hours).")
+    num_doses: int = Field(..., ge=1)
+    absorption_rate_hr: Optional[float] = Field(
+        None,
+        gt=0,
+        description="ka; if not set, treated as IV/instant.",
+    )
+    t_end_hr: Optional[float] = Field(None, gt=0)
+    dt_hr: float = Field(0.1, gt=0, description="Output sampling interval (hours).")
+
+    n_subjects: int = Field(1000, ge=1, le=200_000)
+    cv_clearance: float = Field(0.30, ge=0, le=2.0, description="Between-subject CV of CL.")
+    cv_volume: float = Field(0.25, ge=0, le=2.0, description="Between-subject CV of Vd.")
+    cv_absorption: float = Field(0.40, ge=0, le=2.0, description="Between-subject CV of ka.")
+    cv_bioavailability: float = Field(0.10, ge=0, le=2.0, description="Between-subject CV of F.")
+    seed: int = Field(0, description="Random seed; the same seed reproduces the same population.")
+    max_points: int = Field(
+        DEFAULT_MAX_CURVE_POINTS,
+        ge=10,
+        le=20000,
+        description="Upper bound on returned points; every dose's peak and trough are always kept.",
+    )
+
+    therapeutic_min_mg_per_L: Optional[float] = Field(None, ge=0)
+    therapeutic_max_mg_per_L: Optional[float] = Field(None, gt=0)
+
+class PopulationSimulateResponse(BaseModel):
+    times_hr: List[float]
+    p05_mg_per_L: List[float]
+    p50_mg_per_L: List[float]
+    p95_mg_per_L: List[float]
+    prob_within_window: Optional[List[float]] = None
+    n_subjects: int
+    seed: int
+    sampled_parameter_medians: dict
+    params_used: dict
+
+class SensitivityRequest(PKParams):
+    dose_mg: float = Field(..., gt=0)
+    interval_hr: float = Field(..., gt=0, description="Dosing interval τ (hours).")
+    num_doses: int = Field(..., ge=1)
+    absorption_rate_hr: Optional[float] = Field(
+        None,
+        gt=0,
+        description="ka; if not set, treated as IV/instant.",
+    )
+    dt_hr: float = Field(0.1, gt=0)
+    factors: Annotated[List[float], Field(min_length=1, max_length=50)] = Field(
+        default_factory=lambda: list(DEFAULT_SENSITIVITY_FACTORS),
+        description="Multipliers applied to each parameter, e.g. 0.8 = 20% lower.",
+    )
+
+    therapeutic_min_mg_per_L: Optional[float] = Field(None, ge=0)
+    therapeutic_max_mg_per_L: Optional[float] = Field(None, gt=0)
+
+class SensitivityResponse(BaseModel):
+    baseline: dict
+    perturbations: dict
+    factors: List[float]
+    params_used: dict
+
+class AdministrationRecord(BaseModel):
+    time_hr: float = Field(..., ge=0)
+    amount_mg: float = Field(..., ge=0)
+    route: Literal["oral", "iv"] = "oral"
+
+
+class ScheduleSimulateRequest(PKParams):
+    administrations: Annotated[List[AdministrationRecord], Field(min_length=1, max_length=5000)]
+    absorption_rate_hr: Optional[float] = Field(
+        None,
+        gt=0,
+        description="ka for oral administrations.",
+    )
+    t_end_hr: Optional[float] = Field(None, gt=0)
+    dt_hr: float = Field(0.1, gt=0)
+    max_points: int = Field(
+        DEFAULT_MAX_CURVE_POINTS,
+        ge=10,
+        le=20000,
+        description="Upper bound on returned points; every dose's peak and trough are always kept.",
+    )
+
+
+class AdherenceRequest(PKParams):
+    dose_mg: float = Field(..., gt=0)
+    interval_hr: float = Field(..., gt=0, description="Dosing interval τ (hours).")
+    num_doses: int = Field(..., ge=1, le=1000)
+    absorption_rate_hr: Optional[float] = Field(
+        None,
+        gt=0,
+        description="ka; if not set, treated as IV/instant.",
+    )
+    dt_hr: float = Field(0.1, gt=0)
+    n_trials: int = Field(1000, ge=1, le=20000)
+    p_missed: float = Field(0.1, ge=0.0, le=1.0)
+    p_late: float = Field(0.0, ge=0.0, le=1.0)
+    late_max_hr: float = Field(4.0, ge=0)
+    p_double_after_miss: float = Field(0.0, ge=0.0, le=1.0)
+    seed: Optional[int] = 0
+
+    therapeutic_min_mg_per_L: float = Field(..., ge=0)
+    therapeutic_max_mg_per_L: float = Field(..., gt=0)
+
+
 class TherapeuticWindowRequest(BaseModel):
     times_hr: Annotated[List[float], Field(min_length=2)]
     conc_mg_per_L: Annotated[List[float], Field(min_length=2)]
@@ -221,8 +394,15 @@ def _summarize_source_payload(pk: dict[str, Any]) -> dict[str, Any]:
     return summary
 
 
-@router.post("/simulate", response_model=SimulateResponse, summary="Simulate")
-def simulate(req: SimulateRequest):
+def _require_ordered_window(lower: Optional[float], upper: Optional[float]) -> None:
+    if lower is not None and upper is not None and upper <= lower:
+        raise HTTPException(
+            status_code=400,
+            detail="therapeutic_max_mg_per_L must be greater than therapeutic_min_mg_per_L",
+        )
+
+
+def _resolve_request_pk_params(req: PKParams) -> dict:
     params = {
         "half_life_hr": None,
         "clearance_L_per_hr": None,
@@ -244,8 +424,24 @@ def simulate(req: SimulateRequest):
         if v is not None:
             params[k] = v
 
+    if isinstance(req, PKModelParams) and req.pk_model == "two_compartment":
+        params.update(
+            {
+                "pk_model": req.pk_model,
+                "intercompartmental_clearance_L_per_hr": req.intercompartmental_clearance_L_per_hr,
+                "peripheral_volume_L": req.peripheral_volume_L,
+            }
+        )
+    return params
+
+
+@router.post("/simulate", response_model=SimulateResponse, summary="Simulate")
+def simulate(req: SimulateRequest):
+    params = _resolve_request_pk_params(req)
+
     try:
-        times, conc = predict_concentration_timecourse(
+        times, conc = run_cpu_bound(
+            predict_concentration_timecourse,
             drug_params=params,
             dosing_mg=req.dose_mg,
             dosing_interval_hr=req.interval_hr,
@@ -254,13 +450,17 @@ def simulate(req: SimulateRequest):
             body_weight_kg=req.body_weight_kg,
             t_end_hr=req.t_end_hr,
             dt_hr=req.dt_hr,
+            engine=req.engine,
         )
     except ValueError as ve:
         raise HTTPException(status_code=400, detail=str(ve))
 
-    if len(times) > 5000:
-        times = times[:5000]
-        conc = conc[:5000]
+    times, conc = downsample_curve(
+        times,
+        conc,
+        max_points=req.max_points,
+        dose_times=[i * req.interval_hr for i in range(req.num_doses)],
+    )
 
     return SimulateResponse(
         times_hr=times,
@@ -269,6 +469,215 @@ def simulate(req: SimulateRequest):
     )
 
 
+@router.post("/simulate/stream", summary="Simulate (Streaming)")
+def simulate_stream(req: StreamSimulateRequest):
+    params = _resolve_request_pk_params(req)
+    # Each chunk is computed under a simulation admission slot, released before it is written,
+    # so a slow reader never holds one. Only the first chunk can be turned away with a 429; the
+    # rest wait for a slot like a background job.
+    try:
+        with SIMULATION_ADMISSION.admit():
+            chunks = iter_concentration_timecourse(
+                drug_params=params,
+                dosing_mg=req.dose_mg,
+                dosing_interval_hr=req.interval_hr,
+                num_doses=req.num_doses,
+                absorption_rate_hr=req.absorption_rate_hr,
+                body_weight_kg=req.body_weight_kg,
+                t_end_hr=req.t_end_hr,
+                dt_hr=req.dt_hr,
+                engine=req.engine,
+                chunk_points=req.chunk_points,
+            )
+            first = next(chunks, None)
+    except AdmissionRejected as rejected:
+        raise HTTPException(
+            status_code=429,
+            detail=rejected.reason,
+            headers={"Retry-After": str(rejected.retry_after_s)},
+        )
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+
+    def encode(event: str, data: dict) -> str:
+        if req.format == "sse":
+            return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        return json.dumps({"event": event, **data}) + "\n"
+
+    def events():
+        yield encode("meta", {"params_used": params, "engine": req.engine, "dt_hr": req.dt_hr})
+        n_points = 0
+        chunk = first
+        while chunk is not None:
+            times, conc = chunk
+            n_points += len(times)
+            yield encode("chunk", {"times_hr": times, "conc_mg_per_L": conc})
+            try:
+                with SIMULATION_ADMISSION.admit(wait=True):
+                    chunk = next(chunks, None)
+            except ValueError as ve:
+                yield encode("error", {"detail": str(ve)})
+                return
+        yield encode("end", {"n_points": n_points})
+
+    media_type = "text/event-stream" if req.format == "sse" else "application/x-ndjson"
+    return StreamingResponse(events(), media_type=media_type)
+
+
+@router.get("/cache-stats", summary="Simulation Cache Stats")
+def cache_stats():
+    return SIMULATION_CACHE.stats()
+
+
+@router.post("/steady-state", response_model=SteadyStateResponse, summary="Steady State")
+def steady_state(req: SteadyStateRequest):
+    params = _resolve_request_pk_params(req)
+    try:
+        metrics = compute_steady_state_metrics(
+            drug_params=params,
+            dosing_mg=req.dose_mg,
+            dosing_interval_hr=req.interval_hr,
+            absorption_rate_hr=req.absorption_rate_hr,
+        )
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+
+    within_window = None
+    _require_ordered_window(req.therapeutic_min_mg_per_L, req.therapeutic_max_mg_per_L)
+    if req.therapeutic_min_mg_per_L is not None and req.therapeutic_max_mg_per_L is not None:
+        within_window = (
+            metrics["css_min_mg_l"] >= req.therapeutic_min_mg_per_L
+            and metrics["css_max_mg_l"] <= req.therapeutic_max_mg_per_L
+        )
+
+    return SteadyStateResponse(**metrics, within_window=within_window, params_used=params)
+
+
+@router.post(
+    "/population-simulate",
+    response_model=PopulationSimulateResponse,
+    summary="Population Simulate",
+)
+def population_simulate(req: PopulationSimulateRequest):
+    _require_ordered_window(req.therapeutic_min_mg_per_L, req.therapeutic_max_mg_per_L)
+
+    params = _resolve_request_pk_params(req)
+    try:
+        res = run_cpu_bound(
+            simulate_population,
+            drug_params=params,
+            dosing_mg=req.dose_mg,
+            dosing_interval_hr=req.interval_hr,
+            num_doses=req.num_doses,
+            n_subjects=req.n_subjects,
+            absorption_rate_hr=req.absorption_rate_hr,
+            variability_cv={
+                "clearance": req.cv_clearance,
+                "volume": req.cv_volume,
+                "absorption": req.cv_absorption,
+                "bioavailability": req.cv_bioavailability,
+            },
+            therapeutic_min_mg_per_L=req.therapeutic_min_mg_per_L,
+            therapeutic_max_mg_per_L=req.therapeutic_max_mg_per_L,
+            t_end_hr=req.t_end_hr,
+            dt_hr=req.dt_hr,
+            seed=req.seed,
+        )
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+
+    bands = ("p05_mg_per_L", "p50_mg_per_L", "p95_mg_per_L")
+    keep = downsample_indices(
+        res["times_hr"],
+        [res[key] for key in bands],
+        max_points=req.max_points,
+        dose_times=[i * req.interval_hr for i in range(req.num_doses)],
+    )
+    for key in ("times_hr", *bands, "prob_within_window"):
+        if res[key] is not None:
+            res[key] = [res[key][i] for i in keep]
+
+    return PopulationSimulateResponse(**res, params_used=params)
+
+
+@router.post("/sensitivity", response_model=SensitivityResponse, summary="Sensitivity")
+def sensitivity(req: SensitivityRequest):
+    _require_ordered_window(req.therapeutic_min_mg_per_L, req.therapeutic_max_mg_per_L)
+
+    params = _resolve_request_pk_params(req)
+    try:
+        res = run_cpu_bound(
+            compute_local_sensitivity,
+            drug_params=params,
+            dosing_mg=req.dose_mg,
+            dosing_interval_hr=req.interval_hr,
+            num_doses=req.num_doses,
+            absorption_rate_hr=req.absorption_rate_hr,
+            factors=req.factors,
+            therapeutic_min_mg_per_L=req.therapeutic_min_mg_per_L,
+            therapeutic_max_mg_per_L=req.therapeutic_max_mg_per_L,
+            dt_hr=req.dt_hr,
+        )
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+
+    return SensitivityResponse(**res, params_used=params)
+
+
+@router.post("/simulate-schedule", response_model=SimulateResponse, summary="Simulate Schedule")
+def simulate_schedule(req: ScheduleSimulateRequest):
+    params = _resolve_request_pk_params(req)
+    administrations = [(a.time_hr, a.amount_mg, a.route) for a in req.administrations]
+    try:
+        times, conc = run_cpu_bound(
+            predict_concentration_for_schedule,
+            drug_params=params,
+            administrations=administrations,
+            absorption_rate_hr=req.absorption_rate_hr,
+            t_end_hr=req.t_end_hr,
+            dt_hr=req.dt_hr,
+        )
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+
+    times, conc = downsample_curve(
+        times,
+        conc,
+        max_points=req.max_points,
+        dose_times=[a[0] for a in administrations],
+    )
+    return SimulateResponse(times_hr=times, conc_mg_per_L=conc, params_used=params)
+
+
+@router.post("/adherence", summary="Adherence Monte Carlo")
+def adherence(req: AdherenceRequest):
+    _require_ordered_window(req.therapeutic_min_mg_per_L, req.therapeutic_max_mg_per_L)
+
+    params = _resolve_request_pk_params(req)
+    try:
+        res = run_cpu_bound(
+            simulate_adherence,
+            drug_params=params,
+            dose_mg=req.dose_mg,
+            interval_hr=req.interval_hr,
+            num_doses=req.num_doses,
+            therapeutic_min_mg_per_L=req.therapeutic_min_mg_per_L,
+            therapeutic_max_mg_per_L=req.therapeutic_max_mg_per_L,
+            absorption_rate_hr=req.absorption_rate_hr,
+            n_trials=req.n_trials,
+            p_missed=req.p_missed,
+            p_late=req.p_late,
+            late_max_hr=req.late_max_hr,
+            p_double_after_miss=req.p_double_after_miss,
+            dt_hr=req.dt_hr,
+            seed=req.seed,
+        )
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+
+    return {**res, "params_used": params}
+
+
 @router.post(
     "/therapeutic-window",
     response_model=TherapeuticWindowResponse,
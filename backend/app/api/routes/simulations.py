@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from datetime import datetime, timezone
-from typing import Optional, List, Dict, Any
+from typing import Callable, Optional, List, Dict, Any, Literal
 from uuid import UUID
 
 from fastapi import APIRouter, Body, Depends, File, Form, HTTPException, UploadFile, status
@@ -10,7 +10,7 @@ from sqlmodel import Session, select
 
 from app.models import AcceptedSimulation
 
-from ...core.db import get_session
+from ...core.db import engine, get_session
 from ...core.patient_auth import get_current_patient
 from ...core.security import decryptData
 from ...email import send_email_with_attachment
@@ -26,11 +26,21 @@ from ...models import (
     Simulation,
 )
 from ...pharmacokinetics import (
+    _estimate_active_moiety_fraction,
     evaluate_therapeutic_window,
+    load_simulation_curve,
+    simulation_curve_rederived,
+    maybe_enrich_medication_from_sources,
     resolve_therapeutic_window_for_medication,
     simulate_and_store,
 )
 from ...ade_screening import screen_medication_safety
+from ...pk_bayesian import individualize_from_levels
+from ...pk_cohort import load_cohort, persist_cohort_results, simulate_cohort
+from ...pk_downsampling import DEFAULT_MAX_CURVE_POINTS, downsample_curve
+from ...sim_admission import SIMULATION_ADMISSION, AdmissionRejected
+from ...sim_executor import run_cpu_bound
+from ...sim_jobs import SIMULATION_JOBS, JobQueueFull
 
 router = APIRouter(
     prefix="/sims",
@@ -67,7 +77,24 @@ class RunSimulationRequest(BaseModel):
         gt=0,
         description="ka; if not set, treated as IV/instant.",
     )
-    dt_hr: float = Field(0.1, gt=0, description="Simulation step (hours).")
+    dt_hr: float = Field(
+        0.1,
+        gt=0,
+        description="Euler step (hours); output sampling interval for the analytic and adaptive engines.",
+    )
+    engine: Literal["analytic", "euler", "adaptive"] = Field(
+        "analytic",
+        description=(
+            "analytic = closed-form superposition; euler = fixed-step reference integrator; "
+            "adaptive = error-controlled ODE solver with dose events."
+        ),
+    )
+    max_points: int = Field(
+        DEFAULT_MAX_CURVE_POINTS,
+        ge=10,
+        le=20000,
+        description="Upper bound on returned points; every dose's peak and trough are always kept.",
+    )
 
 
 class RunSimulationResponse(BaseModel):
@@ -95,6 +122,53 @@ class RunSimulationResponse(BaseModel):
     conc_mg_per_L: List[float]
 
 
+class CohortRegimen(BaseModel):
+    dose_mg: float = Field(..., gt=0)
+    interval_hr: float = Field(..., gt=0)
+    num_doses: int = Field(..., ge=1)
+
+
+class CohortSimulationRequest(BaseModel):
+    medication_id: str
+    regimens: List[CohortRegimen] = Field(..., min_length=1, max_length=50)
+    absorption_rate_hr: Optional[float] = Field(
+        None,
+        gt=0,
+        description="ka; if not set, treated as IV/instant.",
+    )
+    dt_hr: float = Field(0.1, gt=0)
+    include_inactive: bool = Field(False, description="Also include inactive PatientMedicationLink rows.")
+    persist: bool = Field(False, description="Store one Simulation per patient and regimen.")
+
+
+class DoseRecord(BaseModel):
+    time_hr: float = Field(..., ge=0)
+    dose_mg: float = Field(..., gt=0)
+
+
+class LevelRecord(BaseModel):
+    time_hr: float = Field(..., ge=0)
+    conc_mg_per_L: float = Field(..., ge=0)
+
+
+class IndividualizeRequest(BaseModel):
+    patient_id: str
+    medication_id: str
+    doses: List[DoseRecord] = Field(..., min_length=1)
+    levels: List[LevelRecord] = Field(..., min_length=1)
+    absorption_rate_hr: Optional[float] = Field(
+        None,
+        gt=0,
+        description="ka; if not set, treated as IV/instant.",
+    )
+    dose_mg: float = Field(..., gt=0, description="Current input dose to recommend around.")
+    interval_hr: float = Field(..., gt=0)
+    num_doses: int = Field(..., ge=1)
+    dt_hr: float = Field(0.1, gt=0)
+    prior_cv_clearance: Optional[float] = Field(None, gt=0, le=2.0)
+    prior_cv_volume: Optional[float] = Field(None, gt=0, le=2.0)
+
+
 class ShareSimulationRequest(BaseModel):
     patient_email: EmailStr
     clinician_email: EmailStr
@@ -124,6 +198,7 @@ class SharedSimulationDetail(SharedSimulationSummary):
     conc_mg_per_L: List[float]
     patient_context: Dict[str, Any]
     ade_screening: Dict[str, Any]
+    curve_rederived: bool = False
 
 
 class AcceptSimulationRequest(BaseModel):
@@ -152,8 +227,37 @@ def _find_patient_by_email(session: Session, email: str) -> Optional[Patient]:
     return None
 
 
-def _shared_payload(sim: Simulation, med_name: Optional[str]) -> SharedSimulationDetail:
+def _chart_curve(
+    times_hr: List[float],
+    conc_mg_per_L: List[float],
+    interval_hr: Optional[float],
+    num_doses: Optional[int],
+    max_points: int = DEFAULT_MAX_CURVE_POINTS,
+) -> tuple[List[float], List[float]]:
+    # Dose markers stop at the last dose, not at the end of the washout tail. Rows stored
+    # without a regimen fall back to every interval on the plotted horizon.
+    dose_times: List[float] = []
+    if interval_hr and times_hr:
+        on_horizon = int(times_hr[-1] // interval_hr) + 1
+        count = min(num_doses, on_horizon) if num_doses else on_horizon
+        dose_times = [i * interval_hr for i in range(count)]
+    return downsample_curve(times_hr, conc_mg_per_L, max_points=max_points, dose_times=dose_times)
+
+
+def _shared_payload(
+    sim: Simulation,
+    med_name: Optional[str],
+    include_curve: bool = True,
+) -> SharedSimulationDetail:
+    times_hr: List[float] = []
+    conc_mg_per_L: List[float] = []
     sim_results: Dict[str, Any] = dict(sim.sim_results or {})
+    if include_curve:
+        times_hr, conc_mg_per_L = _chart_curve(
+            *load_simulation_curve(sim),
+            _safe_float(sim.interval_hr),
+            (sim_results.get("regimen") or {}).get("num_doses"),
+        )
     shared_meta = sim_results.get("shared", {}) or {}
     return SharedSimulationDetail(
         id=str(sim.id),
@@ -172,18 +276,54 @@ def _shared_payload(sim: Simulation, med_name: Optional[str]) -> SharedSimulatio
         therapeutic_window=sim_results.get("therapeutic_window") or {},
         therapeutic_eval=sim_results.get("therapeutic_eval") or {},
         params_used=sim_results.get("params_used") or {},
-        times_hr=sim_results.get("times_hr", []) or [],
-        conc_mg_per_L=sim_results.get("conc_mg_per_L", []) or [],
+        times_hr=times_hr,
+        conc_mg_per_L=conc_mg_per_L,
+        curve_rederived=include_curve and simulation_curve_rederived(sim),
         patient_context=sim_results.get("patient_context") or {},
         ade_screening=sim_results.get("ade_screening") or {},
     )
 
 
-@router.post("/run", response_model=RunSimulationResponse)
-def run_simulation(
-    payload: RunSimulationRequest,
+@router.post("/individualize")
+def individualize(
+    payload: IndividualizeRequest,
     session: Session = Depends(get_session),
 ):
+    prior_cv: Dict[str, float] = {}
+    if payload.prior_cv_clearance is not None:
+        prior_cv["clearance"] = payload.prior_cv_clearance
+    if payload.prior_cv_volume is not None:
+        prior_cv["volume"] = payload.prior_cv_volume
+
+    try:
+        return individualize_from_levels(
+            session=session,
+            patient_id=payload.patient_id,
+            medication_id=payload.medication_id,
+            doses=[(d.time_hr, d.dose_mg) for d in payload.doses],
+            observations=[(o.time_hr, o.conc_mg_per_L) for o in payload.levels],
+            dose_mg=payload.dose_mg,
+            interval_hr=payload.interval_hr,
+            num_doses=payload.num_doses,
+            absorption_rate_hr=payload.absorption_rate_hr,
+            dt_hr=payload.dt_hr,
+            prior_cv=prior_cv or None,
+        )
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+
+
+@router.get("/admission-stats", summary="Simulation Admission Stats")
+def admission_stats():
+    return SIMULATION_ADMISSION.stats()
+
+
+def _execute_run_simulation(
+    session: Session,
+    payload: RunSimulationRequest,
+    on_stage: Callable[[str], None] = lambda stage: None,
+    wait_for_slot: bool = False,
+) -> RunSimulationResponse:
     pat = session.exec(
         select(Patient).where(Patient.id == payload.patient_id)
     ).first()
@@ -202,7 +342,7 @@ def run_simulation(
             detail="Medication not found",
         )
 
-    sim: Simulation = simulate_and_store(
+    sim, times_hr, conc_mg_per_L = simulate_and_store(
         session=session,
         patient_id=str(pat.id),
         medication_id=str(med.id),
@@ -211,11 +351,12 @@ def run_simulation(
         num_doses=payload.num_doses,
         absorption_rate_hr=payload.absorption_rate_hr,
         dt_hr=payload.dt_hr,
+        engine=payload.engine,
+        on_stage=on_stage,
+        wait_for_slot=wait_for_slot,
     )
 
     sim_results: Dict[str, Any] = sim.sim_results or {}
-    times_hr: List[float] = sim_results.get("times_hr", []) or []
-    conc_mg_per_L: List[float] = sim_results.get("conc_mg_per_L", []) or []
     params_used: Dict[str, Any] = sim_results.get("params_used", {}) or {}
     factors = session.exec(
         select(PatientClinicalFactors).where(PatientClinicalFactors.patient_id == pat.id)
@@ -268,6 +409,7 @@ def run_simulation(
         "conditions": sorted(list(set(condition_names))),
         "current_medications": sorted(list(set(current_medication_names))),
     }
+    on_stage("screen")
     ade_screening = screen_medication_safety(med.name, patient_context)
 
     sim.flag_too_high = therapeutic_eval["pct_above"] > therapeutic_eval["target_above_pct"]
@@ -283,6 +425,7 @@ def run_simulation(
     }
     sim.sim_results = sim_results
 
+    on_stage("finalize")
     session.add(sim)
     session.commit()
     session.refresh(sim)
@@ -291,8 +434,9 @@ def run_simulation(
     session.add(pat)
     session.commit()
 
-    chart_times = times_hr[:2000]
-    chart_conc = conc_mg_per_L[:2000]
+    chart_times, chart_conc = _chart_curve(
+        times_hr, conc_mg_per_L, payload.interval_hr, payload.num_doses, max_points=payload.max_points
+    )
 
     return RunSimulationResponse(
         id=str(sim.id),
@@ -320,6 +464,133 @@ def run_simulation(
     )
 
 
+RUN_SIMULATION_STAGES = ["enrich", "simulate", "store", "screen", "finalize"]
+
+
+@router.post("/run", response_model=RunSimulationResponse)
+def run_simulation(
+    payload: RunSimulationRequest,
+    session: Session = Depends(get_session),
+):
+    try:
+        # simulate_and_store takes the admission slot around the simulation itself.
+        return _execute_run_simulation(session, payload)
+    except AdmissionRejected as rejected:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=rejected.reason,
+            headers={"Retry-After": str(rejected.retry_after_s)},
+        )
+
+
+def _run_simulation_job(
+    payload: RunSimulationRequest,
+    on_stage: Callable[[str], None],
+) -> Dict[str, Any]:
+    # Jobs outlive the submitting request, so they open their own session. They share the
+    # /sims/run admission limit but wait for a slot instead of being rejected.
+    with Session(engine) as session:
+        return _execute_run_simulation(session, payload, on_stage=on_stage, wait_for_slot=True).model_dump()
+
+
+@router.post("/jobs", status_code=status.HTTP_202_ACCEPTED)
+def submit_simulation_job(payload: RunSimulationRequest):
+    try:
+        job = SIMULATION_JOBS.submit("run", RUN_SIMULATION_STAGES, _run_simulation_job, payload)
+    except JobQueueFull as full:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(full),
+            headers={"Retry-After": "5"},
+        )
+    return {"job_id": job.id, "status": job.status}
+
+
+@router.get("/jobs/{job_id}")
+def get_simulation_job(job_id: str):
+    summary = SIMULATION_JOBS.describe(job_id)
+    if summary is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return summary
+
+
+@router.get("/jobs/{job_id}/result", response_model=RunSimulationResponse)
+def get_simulation_job_result(job_id: str):
+    job = SIMULATION_JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    if job.status == "failed":
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=job.error)
+    if job.status != "succeeded":
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Job is {job.status}")
+    return job.result
+
+
+@router.post("/cohort")
+def simulate_cohort_endpoint(
+    payload: CohortSimulationRequest,
+    session: Session = Depends(get_session),
+):
+    med = session.exec(
+        select(Medication).where(Medication.id == payload.medication_id)
+    ).first()
+    if med is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Medication not found",
+        )
+
+    try:
+        maybe_enrich_medication_from_sources(session, med)
+        members = load_cohort(session, med, include_inactive=payload.include_inactive)
+        lower, upper, targets, window_source = resolve_therapeutic_window_for_medication(session, med)
+        active_fraction = _estimate_active_moiety_fraction(med.name)
+        with SIMULATION_ADMISSION.admit():
+            cohort = run_cpu_bound(
+                simulate_cohort,
+                members=members,
+                regimens=[(r.dose_mg, r.interval_hr, r.num_doses) for r in payload.regimens],
+                active_fraction=active_fraction,
+                absorption_rate_hr=payload.absorption_rate_hr,
+                dt_hr=payload.dt_hr,
+                tw_low=lower,
+                tw_high=upper,
+                tw_targets=targets,
+            )
+    except AdmissionRejected as rejected:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=rejected.reason,
+            headers={"Retry-After": str(rejected.retry_after_s)},
+        )
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+
+    simulation_ids: List[str] = []
+    if payload.persist:
+        simulation_ids = persist_cohort_results(
+            session,
+            med,
+            members,
+            cohort,
+            active_fraction=active_fraction,
+            absorption_rate_hr=payload.absorption_rate_hr,
+            dt_hr=payload.dt_hr,
+            tw_low=lower,
+            tw_high=upper,
+            tw_targets=targets,
+            tw_source=window_source,
+        )
+
+    return {
+        "medication_id": str(med.id),
+        "medication_name": med.name,
+        "therapeutic_window": {"lower_mg_l": lower, "upper_mg_l": upper, "source": window_source},
+        **cohort,
+        "simulation_ids": simulation_ids,
+    }
+
+
 @router.post("/share/{simulation_id}")
 def share_simulation(
     simulation_id: str,
@@ -399,7 +670,7 @@ def list_shared_simulations_for_patient(
         if not shared_meta.get("sent"):
             continue
         med = session.get(Medication, sim.medication_id)
-        full = _shared_payload(sim, med.name if med else None)
+        full = _shared_payload(sim, med.name if med else None, include_curve=False)
         results.append(SharedSimulationSummary(**full.model_dump()))
 
     results.sort(key=lambda row: row.shared_at or "", reverse=True)
@@ -0,0 +1,73 @@
+import time
+
+import numpy as np
+
+from app.pk_bayesian import _predict_with_gradient, cached_map_fit, fit_map_parameters
+
+
+PARAMS = {
+    "half_life_hr": 6.0,
+    "clearance_L_per_hr": 5.0,
+    "Vd_L": 43.3,
+    "bioavailability": 0.8,
+}
+DOSES = [(i * 8.0, 300.0) for i in range(6)]
+OBS_TIMES = np.array([7.9, 20.0, 30.0, 41.5])
+
+
+def _true_levels(ka, CL=3.5, V=50.0):
+    pred, _ = _predict_with_gradient(
+        np.log([CL, V]),
+        np.array([d[0] for d in DOSES]),
+        np.array([d[1] for d in DOSES]),
+        OBS_TIMES,
+        0.8,
+        ka,
+    )
+    return list(zip(OBS_TIMES.tolist(), pred.tolist()))
+
+
+def test_analytic_gradient_matches_finite_differences():
+    theta = np.log([3.5, 50.0])
+    dose_times = np.array([d[0] for d in DOSES])
+    doses = np.array([d[1] for d in DOSES])
+    for ka in (None, 1.1):
+        pred, jac = _predict_with_gradient(theta, dose_times, doses, OBS_TIMES, 0.8, ka)
+        eps = 1e-6
+        numeric = np.column_stack(
+            [
+                (_predict_with_gradient(theta + step, dose_times, doses, OBS_TIMES, 0.8, ka)[0] - pred) / eps
+                for step in np.eye(2) * eps
+            ]
+        )
+        assert np.allclose(jac, numeric, rtol=1e-4)
+
+
+def test_map_fit_recovers_individual_parameters_quickly():
+    for ka in (None, 1.1):
+        start = time.perf_counter()
+        fit = fit_map_parameters(
+            PARAMS,
+            DOSES,
+            _true_levels(ka),
+            absorption_rate_hr=ka,
+            residual_error={"additive_mg_l": 0.001, "proportional": 0.001},
+        )
+        assert time.perf_counter() - start < 0.1
+        assert fit["converged"]
+        assert abs(fit["clearance_L_per_hr"] - 3.5) / 3.5 < 0.01
+        assert abs(fit["Vd_L"] - 50.0) / 50.0 < 0.01
+
+
+def test_map_fit_without_levels_returns_prior_and_caches():
+    fit = fit_map_parameters(PARAMS, DOSES, [], absorption_rate_hr=1.1)
+    assert np.isclose(fit["clearance_L_per_hr"], 5.0)
+    assert np.isclose(fit["Vd_L"], 43.3)
+
+    levels = _true_levels(1.1)
+    first, cached = cached_map_fit("p1", "m1", PARAMS, DOSES, levels, 1.1)
+    assert not cached
+    again, cached = cached_map_fit("p1", "m1", PARAMS, DOSES, list(reversed(levels)), 1.1)
+    assert cached and again is first
+    _, cached = cached_map_fit("p1", "m1", PARAMS, DOSES, levels[:-1], 1.1)
+    assert not cached
@@ -0,0 +1,41 @@
+import numpy as np
+
+from app.pharmacokinetics import predict_concentration_timecourse
+from app.pk_downsampling import downsample_curve, downsample_indices
+
+
+PARAMS = {
+    "half_life_hr": 6.0,
+    "clearance_L_per_hr": 5.0,
+    "Vd_L": 43.3,
+    "bioavailability": 0.8,
+}
+
+
+def test_downsampling_keeps_horizon_and_every_dose_extremum():
+    dose_times = [i * 8.0 for i in range(30)]
+    times, conc = predict_concentration_timecourse(PARAMS, 300.0, 8.0, 30, absorption_rate_hr=1.1, dt_hr=0.05)
+    small_t, small_c = downsample_curve(times, conc, max_points=300, dose_times=dose_times)
+
+    assert len(small_t) <= 300
+    assert small_t[0] == times[0] and small_t[-1] == times[-1]
+    assert small_t == sorted(small_t)
+
+    t, c = np.array(times), np.array(conc)
+    for start, stop in zip(dose_times, dose_times[1:] + [times[-1]]):
+        interval = (t >= start - 1e-9) & (t <= stop + 1e-9)
+        peak_t = t[interval][np.argmax(c[interval])]
+        trough_t = t[interval][np.argmin(c[interval])]
+        assert peak_t in small_t and trough_t in small_t
+
+
+def test_short_curves_are_returned_unchanged():
+    times, conc = predict_concentration_timecourse(PARAMS, 300.0, 8.0, 2, dt_hr=1.0)
+    assert downsample_curve(times, conc, max_points=500) == (times, conc)
+
+
+def test_required_points_win_over_budget():
+    times, conc = predict_concentration_timecourse(PARAMS, 100.0, 2.0, 96, dt_hr=0.1, t_end_hr=192.0)
+    idx = downsample_indices(times, [conc], max_points=20, dose_times=[i * 2.0 for i in range(96)])
+    assert len(idx) > 20
+    assert np.all(np.diff(idx) > 0)
@@ -0,0 +1,397 @@
+import math
+import time
+
+import numpy as np
+from scipy.integrate import solve_ivp
+
+from app.pharmacokinetics import (
+    TherapeuticTargets,
+    _adaptive_timecourse,
+    _recommend_regimens_for_window,
+    _score_scaled_unit_curve,
+    _steady_state_feasible_intervals,
+    _unit_dose_curves,
+    compute_steady_state_metrics,
+    evaluate_therapeutic_window,
+    iter_concentration_timecourse,
+    predict_concentration_timecourse,
+)
+from app.pk_scoring import best_scale_for_window
+
+
+PARAMS = {
+    "half_life_hr": 6.0,
+    "clearance_L_per_hr": 5.0,
+    "Vd_L": 43.3,
+    "bioavailability": 0.8,
+}
+
+
+def test_analytic_iv_matches_closed_form():
+    times, conc = predict_concentration_timecourse(
+        drug_params=PARAMS,
+        dosing_mg=300.0,
+        dosing_interval_hr=12.0,
+        num_doses=3,
+        dt_hr=0.5,
+        engine="analytic",
+    )
+    kel = PARAMS["clearance_L_per_hr"] / PARAMS["Vd_L"]
+    for t, c in zip(times, conc):
+        expected = sum(
+            0.8 * 300.0 / PARAMS["Vd_L"] * math.exp(-kel * (t - td))
+            for td in (0.0, 12.0, 24.0)
+            if t >= td
+        )
+        assert math.isclose(c, expected, rel_tol=1e-9, abs_tol=1e-12)
+
+
+def test_analytic_is_independent_of_step_size():
+    kwargs = dict(
+        drug_params=PARAMS,
+        dosing_mg=250.0,
+        dosing_interval_hr=8.0,
+        num_doses=4,
+        absorption_rate_hr=1.2,
+        t_end_hr=48.0,
+        engine="analytic",
+    )
+    coarse_t, coarse_c = predict_concentration_timecourse(dt_hr=0.5, **kwargs)
+    fine_t, fine_c = predict_concentration_timecourse(dt_hr=0.05, **kwargs)
+    fine = dict(zip(fine_t, fine_c))
+    for t, c in zip(coarse_t, coarse_c):
+        assert math.isclose(c, fine[t], rel_tol=1e-9, abs_tol=1e-12)
+
+
+def test_euler_converges_to_analytic():
+    kwargs = dict(
+        drug_params=PARAMS,
+        dosing_mg=250.0,
+        dosing_interval_hr=8.0,
+        num_doses=4,
+        absorption_rate_hr=1.2,
+        t_end_hr=48.0,
+        dt_hr=0.01,
+    )
+    _, analytic = predict_concentration_timecourse(engine="analytic", **kwargs)
+    _, euler = predict_concentration_timecourse(engine="euler", **kwargs)
+    assert len(analytic) == len(euler)
+    assert math.isclose(max(analytic), max(euler), rel_tol=0.02)
+    assert math.isclose(analytic[-1], euler[-1], rel_tol=0.02)
+
+
+def _legacy_scan_euler(dosing_mg, dosing_interval_hr, num_doses, t_end_hr, dt_hr):
+    # Pre-scheduler Euler loop (IV): every step scans every dose time.
+    CL, Vd = PARAMS["clearance_L_per_hr"], PARAMS["Vd_L"]
+    F = PARAMS["bioavailability"]
+    dose_times = [i * dosing_interval_hr for i in range(num_doses)]
+    conc = []
+    A_central_mg = 0.0
+    step = 0
+    while step * dt_hr <= t_end_hr + 1e-9:
+        t = step * dt_hr
+        for td in dose_times:
+            if abs(t - td) < dt_hr / 2.0:
+                A_central_mg += dosing_mg * F
+        A_central_mg -= min((CL / Vd) * A_central_mg * dt_hr, A_central_mg)
+        conc.append(A_central_mg / Vd)
+        step += 1
+    return conc
+
+
+def _best_of(fn, repeats=5):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def test_euler_dose_scheduler_speedup_grows_with_num_doses():
+    dt_hr, interval = 0.05, 2.0
+    speedups = {}
+    for num_doses in (4, 24, 96):
+        t_end = num_doses * interval
+        kwargs = dict(
+            drug_params=PARAMS,
+            dosing_mg=100.0,
+            dosing_interval_hr=interval,
+            num_doses=num_doses,
+            t_end_hr=t_end,
+            dt_hr=dt_hr,
+            engine="euler",
+        )
+        _, conc = predict_concentration_timecourse(**kwargs)
+        legacy = _legacy_scan_euler(100.0, interval, num_doses, t_end, dt_hr)
+        assert len(conc) == len(legacy)
+        assert all(math.isclose(a, b, rel_tol=1e-12, abs_tol=1e-15) for a, b in zip(conc, legacy))
+
+        uncached = predict_concentration_timecourse.__wrapped__
+        scheduled = _best_of(lambda: uncached(**kwargs))
+        scanned = _best_of(lambda: _legacy_scan_euler(100.0, interval, num_doses, t_end, dt_hr))
+        speedups[num_doses] = scanned / scheduled
+
+    assert speedups[4] < speedups[24] < speedups[96]
+    assert speedups[96] > 3.0 * speedups[4]
+
+
+
+def test_scaled_unit_curve_scoring_matches_scalar_ranking():
+    # The recommender scores every dose of an (interval, num_doses) pair off one unit-dose curve.
+    doses = [200.0, 300.0, 400.0, 600.0]
+    pairs = [(interval, n_doses) for interval in (6.0, 8.0, 12.0, 24.0) for n_doses in (2, 6, 12)]
+    regimens = [(interval, n_doses, dose) for interval, n_doses in pairs for dose in doses]
+    batched = []
+    for (interval, n_doses), (times, unit_conc) in zip(pairs, _unit_dose_curves(PARAMS, pairs, 0.9, 0.1)):
+        batched.extend(
+            _score_scaled_unit_curve(
+                times, unit_conc, interval, n_doses, doses, 1.0, 4.0, 12.0, TherapeuticTargets(), 96.0
+            )
+        )
+
+    scalar = []
+    for interval, n_doses, dose in regimens:
+        times, conc = predict_concentration_timecourse(
+            drug_params=PARAMS,
+            dosing_mg=dose,
+            dosing_interval_hr=interval,
+            num_doses=n_doses,
+            absorption_rate_hr=0.9,
+            dt_hr=0.1,
+        )
+        res = evaluate_therapeutic_window(
+            times, conc, 4.0, 12.0, t_start_hr=0.0, t_end_hr=interval * n_doses
+        )
+        scalar.append(res)
+
+    for cand, res in zip(batched, scalar):
+        assert math.isclose(cand["pct_within"], res["pct_within"], abs_tol=1e-9)
+        assert math.isclose(cand["pct_above"], res["pct_above"], abs_tol=1e-9)
+        assert math.isclose(cand["pct_below"], res["pct_below"], abs_tol=1e-9)
+        assert cand["risk"] == res["ade_risk_level"]
+
+    def rank(rows):
+        order = sorted(
+            range(len(rows)),
+            key=lambda i: (
+                rows[i]["pct_within"] >= 96.0,
+                round(rows[i]["pct_within"], 9),
+                -round(rows[i]["pct_above"], 9),
+                -round(rows[i]["pct_below"], 9),
+            ),
+            reverse=True,
+        )
+        return [regimens[i] for i in order]
+
+    assert rank(batched) == rank(scalar)
+
+
+def test_unit_dose_curve_scales_linearly():
+    (times, unit_conc), = _unit_dose_curves(PARAMS, [(8.0, 5)], 1.1, 0.1)
+    _, direct = predict_concentration_timecourse(
+        drug_params=PARAMS,
+        dosing_mg=350.0,
+        dosing_interval_hr=8.0,
+        num_doses=5,
+        absorption_rate_hr=1.1,
+        t_end_hr=float(times[-1]),
+        dt_hr=0.1,
+    )
+    assert len(direct) == len(unit_conc)
+    for scaled, expected in zip(350.0 * unit_conc, direct):
+        assert math.isclose(scaled, expected, rel_tol=1e-9, abs_tol=1e-12)
+
+
+def test_best_scale_beats_fixed_dose_grid():
+    (times, unit_conc), = _unit_dose_curves(PARAMS, [(12.0, 8)], 0.9, 0.1)
+    best = best_scale_for_window(times, unit_conc, 4.0, 12.0, t_start_hr=0.0, t_end_hr=96.0)
+    assert best is not None
+
+    def pct_within(dose):
+        res = evaluate_therapeutic_window(
+            times.tolist(), (dose * unit_conc).tolist(), 4.0, 12.0, t_start_hr=0.0, t_end_hr=96.0
+        )
+        return res["pct_within"]
+
+    best_pct = pct_within(best)
+    for dose in (200.0, 300.0, 400.0, 500.0, 600.0, 0.99 * best, 1.01 * best):
+        assert best_pct >= pct_within(dose) - 1e-9
+
+
+def test_steady_state_metrics_match_long_simulation():
+    for ka in (None, 1.3):
+        ss = compute_steady_state_metrics(PARAMS, 300.0, 8.0, absorption_rate_hr=ka)
+        times, conc = predict_concentration_timecourse(
+            drug_params=PARAMS,
+            dosing_mg=300.0,
+            dosing_interval_hr=8.0,
+            num_doses=40,
+            absorption_rate_hr=ka,
+            t_end_hr=40 * 8.0,
+            dt_hr=0.01,
+        )
+        last = [c for t, c in zip(times, conc) if 39 * 8.0 <= t <= 40 * 8.0]
+        assert math.isclose(ss["css_max_mg_l"], max(last), rel_tol=1e-3)
+        assert math.isclose(ss["css_min_mg_l"], min(last), rel_tol=1e-3)
+        auc = sum(0.5 * (a + b) * 0.01 for a, b in zip(last, last[1:]))
+        assert math.isclose(ss["auc_tau_mg_h_l"], auc, rel_tol=1e-3)
+
+
+def test_recommender_skips_intervals_whose_steady_state_swing_exceeds_the_window():
+    # Half-life 6 h and a 3x window: 24 h dosing swings ~14x at steady state.
+    feasible = _steady_state_feasible_intervals(PARAMS, [6.0, 8.0, 12.0, 24.0], 0.9, 4.0, 12.0)
+    assert 24.0 not in feasible and 6.0 in feasible
+
+    rows = _recommend_regimens_for_window.__wrapped__(
+        PARAMS, 1.0, 300.0, 8.0, 6, 0.9, 70.0, 0.1, 4.0, 12.0, TherapeuticTargets()
+    )
+    assert rows and all(row["interval_hr"] < 16.0 for row in rows)
+
+
+def test_steady_state_prefilter_leaves_short_course_rankings_unchanged(monkeypatch):
+    import app.pharmacokinetics as pk
+
+    # Half-life 150 h: even 24 doses every 24 h stay short of steady state, so 24 h dosing is
+    # still ranked although its steady-state swing is wider than the 1.05x window.
+    slow = {**PARAMS, "half_life_hr": 150.0, "clearance_L_per_hr": None}
+    args = (slow, 1.0, 300.0, 12.0, 2, 0.9, 70.0, 0.1, 10.0, 10.5, TherapeuticTargets())
+    assert 24.0 not in _steady_state_feasible_intervals(slow, [12.0, 24.0], 0.9, 10.0, 10.5)
+
+    filtered = _recommend_regimens_for_window.__wrapped__(*args)
+    monkeypatch.setattr(pk, "_steady_state_feasible_intervals", lambda params, intervals, *rest: intervals)
+    assert filtered == _recommend_regimens_for_window.__wrapped__(*args)
+
+
+def test_adaptive_engine_matches_analytic_with_few_evaluations():
+    kwargs = dict(
+        drug_params=PARAMS,
+        dosing_mg=250.0,
+        dosing_interval_hr=12.0,
+        num_doses=6,
+        absorption_rate_hr=2.5,
+        dt_hr=0.05,
+    )
+    times, analytic = predict_concentration_timecourse(engine="analytic", **kwargs)
+    _, adaptive = predict_concentration_timecourse(engine="adaptive", **kwargs)
+    assert len(adaptive) == len(analytic)
+    peak = max(analytic)
+    for a, b in zip(analytic, adaptive):
+        assert abs(a - b) <= 1e-4 * peak
+
+    # Long half-life: the solver takes long steps through the elimination tail.
+    slow_kel = 0.693 / 60.0
+    long_times = np.round(np.arange(0.0, 372.0, 0.05), 6)
+    _, n_evaluations = _adaptive_timecourse(
+        long_times, [i * 12.0 for i in range(6)], 250.0, slow_kel, 43.3, 0.8, 0.5
+    )
+    assert n_evaluations < len(long_times) / 5
+
+
+TWO_COMPARTMENT = {
+    **PARAMS,
+    "Vd_L": 20.0,
+    "pk_model": "two_compartment",
+    "intercompartmental_clearance_L_per_hr": 8.0,
+    "peripheral_volume_L": 40.0,
+}
+
+
+def _two_compartment_reference(times, dose_times, dose_mg, ka):
+    k10, k12, k21 = 5.0 / 20.0, 8.0 / 20.0, 8.0 / 40.0
+
+    def rhs(_t, y):
+        absorbed = (ka or 0.0) * y[0]
+        return [-absorbed, absorbed - (k10 + k12) * y[1] + k21 * y[2], k12 * y[1] - k21 * y[2]]
+
+    dose = np.array([0.8 * dose_mg, 0.0, 0.0] if ka else [0.0, 0.8 * dose_mg, 0.0])
+    bounds = list(dose_times) + [times[-1] + 1e-6]
+    out = np.zeros(len(times))
+    state = np.zeros(3)
+    for start, stop in zip(bounds, bounds[1:]):
+        state = state + dose
+        sol = solve_ivp(rhs, (start, stop), state, dense_output=True, rtol=1e-10, atol=1e-12)
+        mask = (times >= start - 1e-9) & (times < stop - 1e-9)
+        out[mask] = sol.sol(times[mask])[1] / 20.0
+        state = sol.y[:, -1]
+    return out
+
+
+def test_two_compartment_matches_ode_reference():
+    for ka in (None, 1.2):
+        times, conc = predict_concentration_timecourse(
+            drug_params=TWO_COMPARTMENT,
+            dosing_mg=300.0,
+            dosing_interval_hr=7.33,
+            num_doses=5,
+            absorption_rate_hr=ka,
+            t_end_hr=60.0,
+            dt_hr=0.1,
+        )
+        expected = _two_compartment_reference(
+            np.array(times), [i * 7.33 for i in range(5)], 300.0, ka
+        )
+        assert np.max(np.abs(np.array(conc) - expected)) <= 1e-7 * max(conc)
+
+
+def test_two_compartment_without_distribution_is_one_compartment():
+    kwargs = dict(dosing_mg=300.0, dosing_interval_hr=8.0, num_doses=3, t_end_hr=40.0, dt_hr=0.1)
+    _, two = predict_concentration_timecourse(
+        drug_params={**TWO_COMPARTMENT, "Vd_L": 43.3, "intercompartmental_clearance_L_per_hr": 0.0},
+        **kwargs,
+    )
+    _, one = predict_concentration_timecourse(drug_params=PARAMS, **kwargs)
+    for a, b in zip(two, one):
+        assert math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-12)
+
+
+def test_two_compartment_steady_state_matches_long_simulation():
+    ss = compute_steady_state_metrics(TWO_COMPARTMENT, 300.0, 8.0, absorption_rate_hr=1.2)
+    times, conc = predict_concentration_timecourse(
+        drug_params=TWO_COMPARTMENT,
+        dosing_mg=300.0,
+        dosing_interval_hr=8.0,
+        num_doses=60,
+        absorption_rate_hr=1.2,
+        t_end_hr=60 * 8.0,
+        dt_hr=0.01,
+    )
+    last = [c for t, c in zip(times, conc) if 59 * 8.0 <= t <= 60 * 8.0]
+    assert math.isclose(ss["css_max_mg_l"], max(last), rel_tol=1e-3)
+    assert math.isclose(ss["css_min_mg_l"], min(last), rel_tol=1e-3)
+
+
+def test_streamed_chunks_match_full_timecourse():
+    for engine in ("analytic", "euler", "adaptive"):
+        kwargs = dict(
+            drug_params=PARAMS,
+            dosing_mg=300.0,
+            dosing_interval_hr=8.0,
+            num_doses=5,
+            absorption_rate_hr=1.1,
+            dt_hr=0.1,
+            engine=engine,
+        )
+        times, conc = predict_concentration_timecourse(**kwargs)
+        chunks = list(iter_concentration_timecourse(chunk_points=97, **kwargs))
+        assert all(len(t) == 97 for t, _ in chunks[:-1])
+        assert [x for t, _ in chunks for x in t] == times
+        assert [x for _, c in chunks for x in c] == conc
+
+
+def test_recommended_dose_is_rounded_toward_the_window():
+    rows = _recommend_regimens_for_window.__wrapped__(
+        PARAMS, 0.7, 300.0, 8.0, 6, 0.9, 70.0, 0.1, 4.0, 12.0, TherapeuticTargets()
+    )
+    for row in rows:
+        (times, unit_conc), = _unit_dose_curves(PARAMS, [(row["interval_hr"], row["num_doses"])], 0.9, 0.1)
+        best = best_scale_for_window(
+            times, unit_conc, 4.0, 12.0, t_start_hr=0.0, t_end_hr=row["interval_hr"] * row["num_doses"]
+        )
+        # Rounding never costs time in window relative to either neighbouring 0.1 mg step.
+        for neighbour in (math.floor(best / 0.7 * 10) / 10, math.ceil(best / 0.7 * 10) / 10):
+            other = evaluate_therapeutic_window(
+                times.tolist(), (unit_conc * neighbour * 0.7).tolist(), 4.0, 12.0,
+                t_start_hr=0.0, t_end_hr=row["interval_hr"] * row["num_doses"],
+            )
+            assert row["pct_within"] >= other["pct_within"] - 1e-9
@@ -0,0 +1,78 @@
+import time
+
+import numpy as np
+
+from app.pharmacokinetics import predict_concentration_timecourse
+from app.pk_population import sample_population_parameters, simulate_population
+
+
+PARAMS = {
+    "half_life_hr": 6.0,
+    "clearance_L_per_hr": 5.0,
+    "Vd_L": 43.3,
+    "bioavailability": 0.8,
+}
+NO_VARIABILITY = {"clearance": 0.0, "volume": 0.0, "absorption": 0.0, "bioavailability": 0.0}
+
+
+def test_population_without_variability_matches_deterministic_curve():
+    for ka in (None, 1.1):
+        res = simulate_population(
+            PARAMS, 300.0, 8.0, 6, n_subjects=20, absorption_rate_hr=ka, variability_cv=NO_VARIABILITY
+        )
+        times, conc = predict_concentration_timecourse(PARAMS, 300.0, 8.0, 6, absorption_rate_hr=ka)
+        assert res["times_hr"] == times
+        for key in ("p05_mg_per_L", "p50_mg_per_L", "p95_mg_per_L"):
+            assert np.allclose(res[key], conc, rtol=1e-9, atol=1e-12)
+
+
+def test_population_is_seeded():
+    kwargs = dict(
+        drug_params=PARAMS,
+        dosing_mg=300.0,
+        dosing_interval_hr=8.0,
+        num_doses=6,
+        n_subjects=3000,
+        absorption_rate_hr=1.1,
+        therapeutic_min_mg_per_L=4.0,
+        therapeutic_max_mg_per_L=12.0,
+        seed=7,
+    )
+    first = simulate_population(**kwargs)
+    assert simulate_population(**kwargs) == first
+    assert simulate_population(**{**kwargs, "seed": 8})["p50_mg_per_L"] != first["p50_mg_per_L"]
+
+    p05, p50, p95 = (np.array(first[k]) for k in ("p05_mg_per_L", "p50_mg_per_L", "p95_mg_per_L"))
+    assert np.all(p05 <= p50) and np.all(p50 <= p95)
+    prob = np.array(first["prob_within_window"])
+    assert np.all((prob >= 0.0) & (prob <= 1.0))
+
+
+def test_ten_thousand_subjects_under_a_second():
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        simulate_population(
+            PARAMS,
+            300.0,
+            8.0,
+            6,
+            n_subjects=10_000,
+            absorption_rate_hr=1.1,
+            therapeutic_min_mg_per_L=4.0,
+            therapeutic_max_mg_per_L=12.0,
+        )
+        best = min(best, time.perf_counter() - start)
+    assert best < 1.0
+
+
+def test_bioavailability_stays_bounded_around_its_typical_value():
+    sampled = sample_population_parameters(
+        {**PARAMS, "bioavailability": 0.95}, 20_000, variability_cv={"bioavailability": 0.10}, seed=3
+    )
+    F = sampled["bioavailability"]
+    assert np.all((F > 0.0) & (F < 1.0))
+    assert abs(np.median(F) - 0.95) < 0.005
+
+    iv = sample_population_parameters({**PARAMS, "bioavailability": 1.0}, 100, seed=3)
+    assert np.all(iv["bioavailability"] == 1.0)
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from app.pharmacokinetics import predict_concentration_timecourse
+from app.pk_schedule import ScheduledTimecourse, predict_concentration_for_schedule, simulate_adherence
+
+
+PARAMS = {"half_life_hr": 6.0, "clearance_L_per_hr": None, "Vd_L": 40.0, "bioavailability": 0.8}
+
+
+def test_regular_schedule_matches_fixed_interval_engine():
+    times, conc = predict_concentration_timecourse(PARAMS, 250.0, 8.0, 5, absorption_rate_hr=1.3)
+    sched_times, sched_conc = predict_concentration_for_schedule(
+        PARAMS, [(i * 8.0, 250.0, "oral") for i in range(5)], absorption_rate_hr=1.3, t_end_hr=times[-1]
+    )
+    assert sched_times == times
+    assert np.allclose(sched_conc, conc, rtol=1e-12, atol=1e-12)
+
+
+def test_editing_one_dose_matches_full_recompute():
+    schedule = [(0.0, 250.0, "oral"), (8.0, 250.0, "oral"), (16.0, 250.0, "oral"), (30.0, 500.0, "iv")]
+    course = ScheduledTimecourse(PARAMS, schedule, absorption_rate_hr=1.3, t_end_hr=60.0)
+    course.replace(1, (10.5, 125.0, "oral"))
+    course.remove(2)
+    course.add((40.0, 80.0, "iv"))
+    edited = [(0.0, 250.0, "oral"), (10.5, 125.0, "oral"), (30.0, 500.0, "iv"), (40.0, 80.0, "iv")]
+    _, expected = predict_concentration_for_schedule(PARAMS, edited, absorption_rate_hr=1.3, t_end_hr=60.0)
+    assert np.allclose(course.timecourse()[1], expected, rtol=1e-10, atol=1e-10)
+
+
+def test_iv_dose_ignores_bioavailability_and_oral_needs_ka():
+    _, iv = predict_concentration_for_schedule(PARAMS, [(0.0, 400.0, "iv")], t_end_hr=1.0)
+    assert iv[0] == pytest.approx(10.0)
+    with pytest.raises(ValueError):
+        predict_concentration_for_schedule(PARAMS, [(0.0, 400.0, "oral")])
+
+
+def test_adherence_monte_carlo():
+    kwargs = dict(
+        drug_params=PARAMS, dose_mg=250.0, interval_hr=8.0, num_doses=21,
+        therapeutic_min_mg_per_L=3.0, therapeutic_max_mg_per_L=9.0, absorption_rate_hr=1.3, n_trials=400,
+    )
+    perfect = simulate_adherence(p_missed=0.0, **kwargs)
+    assert perfect["mean_doses_missed"] == 0.0
+    assert perfect["pct_within_distribution"]["p5"] == pytest.approx(perfect["perfect_adherence_pct_within"])
+
+    poor = simulate_adherence(p_missed=0.3, p_late=0.3, **kwargs)
+    assert poor["mean_doses_missed"] == pytest.approx(0.3 * 21, rel=0.15)
+    assert poor["mean_pct_within_shift"] < 0
+    assert poor == simulate_adherence(p_missed=0.3, p_late=0.3, **kwargs)
+
+
+def test_adherence_batch_matches_explicit_schedules():
+    from app.pk_schedule import _adherence_concentrations, sample_adherence
+
+    times = np.round(np.arange(0, 24 * 7 + 1e-9, 0.5), 6)
+    dose_times, multiplier = sample_adherence(14, 12.0, 5, p_missed=0.3, p_late=0.5, p_double_after_miss=0.5, seed=3)
+    kel = 0.693 / 6.0
+    batch = _adherence_concentrations(times, dose_times, multiplier, 12.0, 250.0, kel, 40.0, 0.8, 1.3)
+    for row in range(5):
+        schedule = [(t, 250.0 * m, "oral") for t, m in zip(dose_times[row], multiplier[row])]
+        _, expected = predict_concentration_for_schedule(
+            PARAMS, schedule, absorption_rate_hr=1.3, t_end_hr=times[-1], dt_hr=0.5
+        )
+        assert np.allclose(batch[row], expected, rtol=1e-8, atol=1e-10)
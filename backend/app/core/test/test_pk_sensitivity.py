@@ -0,0 +1,51 @@
+import math
+
+from app.pharmacokinetics import evaluate_therapeutic_window, predict_concentration_timecourse
+from app.pk_sensitivity import compute_local_sensitivity
+
+
+PARAMS = {
+    "half_life_hr": 6.0,
+    "clearance_L_per_hr": 5.0,
+    "Vd_L": 43.3,
+    "bioavailability": 0.8,
+}
+
+
+def test_perturbations_match_individual_simulations():
+    res = compute_local_sensitivity(
+        PARAMS,
+        300.0,
+        8.0,
+        6,
+        absorption_rate_hr=1.1,
+        factors=(0.8, 1.2),
+        therapeutic_min_mg_per_L=4.0,
+        therapeutic_max_mg_per_L=12.0,
+    )
+    lower_cl = res["perturbations"]["clearance_L_per_hr"][0]
+    times, conc = predict_concentration_timecourse(
+        {**PARAMS, "clearance_L_per_hr": 4.0, "half_life_hr": None},
+        300.0,
+        8.0,
+        6,
+        absorption_rate_hr=1.1,
+        t_end_hr=48.0,
+    )
+    assert math.isclose(lower_cl["cmax_mg_l"], max(conc), rel_tol=1e-9)
+    assert math.isclose(lower_cl["cmin_mg_l"], conc[-1], rel_tol=1e-9)
+    window = evaluate_therapeutic_window(times, conc, 4.0, 12.0, t_start_hr=0.0, t_end_hr=48.0)
+    assert math.isclose(lower_cl["pct_within"], window["pct_within"], abs_tol=1e-9)
+
+
+def test_elasticities_have_expected_signs():
+    res = compute_local_sensitivity(PARAMS, 300.0, 8.0, 6, absorption_rate_hr=1.1)
+    for entry in res["perturbations"]["bioavailability"]:
+        for metric in ("cmax_mg_l", "cmin_mg_l", "auc_mg_h_l"):
+            assert math.isclose(entry[f"elasticity_{metric}"], 1.0, rel_tol=1e-9)
+    assert all(e["elasticity_auc_mg_h_l"] < 0 for e in res["perturbations"]["clearance_L_per_hr"])
+    assert all(e["elasticity_cmin_mg_l"] > 0 for e in res["perturbations"]["half_life_hr"])
+    assert "pct_within" not in res["baseline"]
+
+    iv = compute_local_sensitivity(PARAMS, 300.0, 8.0, 6)
+    assert "absorption_rate_hr" not in iv["perturbations"]
@@ -0,0 +1,93 @@
+import asyncio
+import time
+
+import httpx
+
+from app.pharmacokinetics import _fetch_all_sources
+from app.source_http import SourceHttpClient
+
+
+LABEL_TEXT = "The elimination half-life is 6 hours."
+
+
+async def _handler(request: httpx.Request) -> httpx.Response:
+    await asyncio.sleep(0.2)
+    url = str(request.url)
+    if "dailymed" in url and url.split("?")[0].endswith("spls.json"):
+        return httpx.Response(200, json={"data": [{"setid": "abc"}]})
+    if "dailymed" in url:
+        return httpx.Response(200, json={"data": {"sections": [{"title": "Pharmacokinetics", "text": LABEL_TEXT}]}})
+    if "api.fda.gov" in url:
+        return httpx.Response(200, json={"results": [{"pharmacokinetics": [LABEL_TEXT]}]})
+    if "/cids/" in url:
+        return httpx.Response(200, json={"IdentifierList": {"CID": [1]}})
+    return httpx.Response(404)
+
+
+def test_sources_are_fetched_concurrently():
+    client = SourceHttpClient(transport=httpx.MockTransport(_handler), retries=0)
+    try:
+        started = time.perf_counter()
+        values, report = client.run(_fetch_all_sources("examplemab", client))
+        elapsed = time.perf_counter() - started
+    finally:
+        client.close()
+
+    # Sequentially this is four 0.2 s requests; concurrently the longest chain is two.
+    assert elapsed < 0.8
+    assert set(values) == {"dailymed", "openfda", "pubchem"}
+    assert values["dailymed"]["raw"] == LABEL_TEXT
+    assert values["openfda"]["raw"] == LABEL_TEXT
+    assert values["pubchem"]["raw"] is None
+    assert {name: r["status"] for name, r in report.items()} == {
+        "dailymed": "ok",
+        "openfda": "ok",
+        "pubchem": "no_data",
+    }
+
+
+def test_slow_source_is_reported_as_timed_out():
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if "api.fda.gov" in str(request.url):
+            await asyncio.sleep(2.0)
+        return await _handler(request)
+
+    client = SourceHttpClient(transport=httpx.MockTransport(handler), retries=0)
+    try:
+        started = time.perf_counter()
+        values, report = client.run(_fetch_all_sources("examplemab", client, deadline_s=0.6))
+        elapsed = time.perf_counter() - started
+    finally:
+        client.close()
+
+    assert elapsed < 1.0
+    assert "openfda" not in values
+    assert report["openfda"]["status"] == "timed_out"
+    assert report["dailymed"]["status"] == "ok"
+
+
+def test_openfda_prefers_brand_then_generic_then_substance():
+    from app.pharmacokinetics import fetch_from_openfda_async
+
+    searches = []
+
+    def label(half_life_hr, **names):
+        return {"openfda": names, "pharmacokinetics": [f"Half-life is {half_life_hr} hours."]}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        searches.append(request.url.params["search"])
+        # Relevance order puts the substance-only match first.
+        return httpx.Response(200, json={"results": [
+            label(9, substance_name=["EXAMPLEMAB"]),
+            label(6, generic_name=["EXAMPLEMAB-ABCD"], substance_name=["EXAMPLEMAB"]),
+            label(4, brand_name=["OTHERBRAND"]),
+        ]})
+
+    client = SourceHttpClient(transport=httpx.MockTransport(handler), retries=0)
+    try:
+        values = client.run(fetch_from_openfda_async(client, "Examplemab"))
+    finally:
+        client.close()
+    assert len(searches) == 1 and " OR " in searches[0]
+    # No brand match, so the generic-name label outranks the more relevant substance match.
+    assert values["raw"] == "Half-life is 6 hours."
@@ -0,0 +1,73 @@
+import threading
+import time
+
+import pytest
+
+from app.sim_admission import AdmissionController, AdmissionRejected
+
+
+def _hold(controller, started, release):
+    with controller.admit():
+        started.set()
+        release.wait(5)
+
+
+def test_rejects_when_queue_is_full():
+    controller = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout_s=5)
+    started, release = threading.Event(), threading.Event()
+    runner = threading.Thread(target=_hold, args=(controller, started, release))
+    runner.start()
+    assert started.wait(5)
+
+    queued = threading.Thread(target=_hold, args=(controller, threading.Event(), release))
+    queued.start()
+    deadline = time.monotonic() + 5
+    while controller.stats()["queue_depth"] < 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    with pytest.raises(AdmissionRejected) as excinfo:
+        with controller.admit():
+            pass
+    assert excinfo.value.retry_after_s >= 1
+
+    release.set()
+    runner.join(5)
+    queued.join(5)
+    stats = controller.stats()
+    assert stats["admitted"] == 2
+    assert stats["rejected_queue_full"] == 1
+    assert stats["peak_queue_depth"] == 1
+    assert stats["in_flight"] == 0 and stats["queue_depth"] == 0
+    assert stats["wait_s_max"] > 0
+
+
+def test_queue_wait_times_out():
+    controller = AdmissionController(max_concurrent=1, max_queue=4, queue_timeout_s=0.05)
+    started, release = threading.Event(), threading.Event()
+    runner = threading.Thread(target=_hold, args=(controller, started, release))
+    runner.start()
+    assert started.wait(5)
+    with pytest.raises(AdmissionRejected):
+        with controller.admit():
+            pass
+    release.set()
+    runner.join(5)
+    assert controller.stats()["rejected_timeout"] == 1
+    with controller.admit() as waited:
+        assert waited == 0.0
+
+
+def test_waiting_admission_is_neither_rejected_nor_timed_out():
+    controller = AdmissionController(max_concurrent=1, max_queue=0, queue_timeout_s=0.01)
+    started, release = threading.Event(), threading.Event()
+    runner = threading.Thread(target=_hold, args=(controller, started, release))
+    runner.start()
+    assert started.wait(5)
+    with pytest.raises(AdmissionRejected):
+        with controller.admit():
+            pass
+
+    threading.Timer(0.1, release.set).start()
+    with controller.admit(wait=True) as waited:
+        assert waited >= 0.05
+    runner.join(5)
@@ -0,0 +1,68 @@
+from app.pharmacokinetics import TherapeuticTargets
+from app.sim_cache import SimulationCache, cache_key, memoize
+
+
+def test_cache_key_is_canonical():
+    a = cache_key("predict", {"dose": 300, "params": {"Vd_L": 43.3, "F": 0.8}})
+    b = cache_key("predict", {"params": {"F": 0.8, "Vd_L": 43.3}, "dose": 300.0})
+    assert a == b
+    assert a != cache_key("predict", {"dose": 300.1, "params": {"Vd_L": 43.3, "F": 0.8}})
+    assert a != cache_key("recommend", {"dose": 300, "params": {"Vd_L": 43.3, "F": 0.8}})
+    assert cache_key("x", TherapeuticTargets()) == cache_key("x", TherapeuticTargets())
+
+
+def test_lru_eviction_respects_memory_budget():
+    # Each entry is ~16 KB, so four fit.
+    cache = SimulationCache(max_bytes=70_000)
+    for i in range(10):
+        cache.put(str(i), [float(i)] * 500)
+    stats = cache.stats()
+    assert stats["bytes"] <= 70_000
+    assert stats["entries"] == 4 and stats["evictions"] == 6
+    assert not cache.get("5")[0]
+
+    assert cache.get("6")[0]
+    cache.put("10", [1.0] * 500)
+    assert cache.get("6")[0]
+    assert not cache.get("7")[0]
+
+
+def test_memoize_counts_hits_and_returns_copies():
+    cache = SimulationCache()
+    calls = []
+
+    @memoize(cache, "curve", copy_result=list)
+    def curve(dose, n=3):
+        calls.append(dose)
+        return [dose] * n
+
+    first = curve(2.0)
+    first.append(99.0)
+    assert curve(2, n=3) == [2.0, 2.0, 2.0]
+    assert calls == [2.0]
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_persistent_tier_survives_restart(tmp_path):
+    SimulationCache(persist_dir=str(tmp_path)).put("k", ([0.0, 0.1], [1.0, 2.0]))
+    restarted = SimulationCache(persist_dir=str(tmp_path))
+    hit, value = restarted.get("k")
+    assert hit and value == ([0.0, 0.1], [1.0, 2.0])
+    assert restarted.stats()["disk_hits"] == 1
+
+
+def test_disk_tier_is_bounded_and_evicts_least_recently_used(tmp_path):
+    # A memory tier too small to hold anything, so every get reads the disk tier.
+    cache = SimulationCache(max_bytes=1, persist_dir=str(tmp_path), disk_max_entries=3)
+    for key in "abc":
+        cache.put(key, [1.0] * 100)
+    assert cache.get("a")[0]
+    cache.put("d", [1.0] * 100)
+
+    assert sorted(p.name[0] for p in tmp_path.glob("*.pkl.z")) == ["a", "c", "d"]
+    stats = cache.stats()
+    assert stats["disk_entries"] == 3 and stats["disk_evictions"] == 1
+
+    small = SimulationCache(persist_dir=str(tmp_path), disk_max_bytes=1)
+    small.put("e", [1.0] * 100)
+    assert not (tmp_path / "e.pkl.z").exists()
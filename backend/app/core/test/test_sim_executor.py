@@ -0,0 +1,65 @@
+from app.pharmacokinetics import predict_concentration_timecourse, run_simulation_pipeline
+from app.pk_scoring import TherapeuticTargets
+from app.sim_cache import SIMULATION_CACHE
+from app.sim_executor import run_cpu_bound, shutdown_simulation_pool, start_simulation_pool
+
+
+DRUG = {"half_life_hr": 8.0, "Vd_L": 50.0, "bioavailability": 0.9}
+
+
+def test_run_cpu_bound_inline_without_pool():
+    shutdown_simulation_pool()
+    direct = predict_concentration_timecourse(DRUG, 250.0, 12.0, 6, absorption_rate_hr=1.2)
+    assert run_cpu_bound(predict_concentration_timecourse, DRUG, 250.0, 12.0, 6, absorption_rate_hr=1.2) == direct
+
+
+def test_pool_matches_inline_results():
+    kwargs = dict(
+        drug_params={**DRUG, "clearance_L_per_hr": None},
+        active_fraction=1.0,
+        dose_mg=250.0,
+        interval_hr=12.0,
+        num_doses=6,
+        absorption_rate_hr=1.2,
+        weight_kg=70.0,
+        dt_hr=0.1,
+        engine="analytic",
+        tw_low=5.0,
+        tw_high=15.0,
+        tw_targets=TherapeuticTargets(),
+    )
+    inline = run_simulation_pipeline(**kwargs)
+    try:
+        assert start_simulation_pool(workers=2) is not None
+        before = SIMULATION_CACHE.counters()
+        pooled = run_cpu_bound(run_simulation_pipeline, **kwargs)
+        after = SIMULATION_CACHE.counters()
+    finally:
+        shutdown_simulation_pool()
+    # The worker's cache lookups show up in the parent's stats.
+    assert after["hits"] + after["misses"] > before["hits"] + before["misses"]
+    assert pooled["times"] == inline["times"]
+    assert pooled["conc"] == inline["conc"]
+    assert pooled["eval_res"] == inline["eval_res"]
+    assert pooled["recommended_regimens"] == inline["recommended_regimens"]
+
+
+def _die_once(marker):
+    import os
+
+    if not os.path.exists(marker):
+        open(marker, "w").close()
+        os._exit(1)
+    return os.getpid()
+
+
+def test_broken_pool_is_replaced_and_the_task_retried(tmp_path):
+    from app import sim_executor
+
+    try:
+        start_simulation_pool(workers=1)
+        broken = sim_executor._pool
+        assert run_cpu_bound(_die_once, str(tmp_path / "died")) > 0
+        assert sim_executor._pool is not None and sim_executor._pool is not broken
+    finally:
+        shutdown_simulation_pool()
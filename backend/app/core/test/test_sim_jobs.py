@@ -0,0 +1,78 @@
+import threading
+import time
+
+import pytest
+
+from app.sim_jobs import JobQueue, JobQueueFull
+
+
+def _wait_finished(queue, job_id):
+    deadline = time.monotonic() + 5
+    while queue.describe(job_id)["finished_at"] is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return queue.describe(job_id)
+
+
+def test_job_reports_stages_and_result():
+    queue = JobQueue(workers=1)
+    gate = threading.Event()
+
+    def work(x, on_stage):
+        on_stage("load")
+        gate.wait(5)
+        on_stage("compute")
+        return x * 2
+
+    job = queue.submit("test", ["load", "compute"], work, 21)
+    deadline = time.monotonic() + 5
+    while queue.describe(job.id)["stages"][0]["status"] != "running" and time.monotonic() < deadline:
+        time.sleep(0.01)
+    running = queue.describe(job.id)
+    assert running["status"] == "running"
+    assert [s["status"] for s in running["stages"]] == ["running", "pending"]
+
+    gate.set()
+    done = _wait_finished(queue, job.id)
+    assert done["status"] == "succeeded"
+    assert [s["status"] for s in done["stages"]] == ["done", "done"]
+    assert queue.get(job.id).result == 42
+    queue.shutdown()
+
+
+def test_failed_job_and_full_queue():
+    queue = JobQueue(workers=1, max_pending=1)
+    gate = threading.Event()
+
+    def fail(on_stage):
+        on_stage("load")
+        gate.wait(5)
+        raise ValueError("missing PK parameters")
+
+    job = queue.submit("test", ["load"], fail)
+    with pytest.raises(JobQueueFull):
+        queue.submit("test", ["load"], fail)
+    gate.set()
+    failed = _wait_finished(queue, job.id)
+    assert failed["status"] == "failed"
+    assert failed["error"] == "missing PK parameters"
+    assert failed["stages"][0]["status"] == "failed"
+    queue.shutdown()
+
+
+def test_concurrent_first_submits_share_one_executor():
+    queue = JobQueue(workers=2)
+    barrier = threading.Barrier(8)
+    executors = []
+
+    def submit():
+        barrier.wait()
+        queue.submit("test", [], lambda on_stage: None)
+        executors.append(queue._executor)
+
+    threads = [threading.Thread(target=submit) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len({id(e) for e in executors}) == 1
+    queue.shutdown()
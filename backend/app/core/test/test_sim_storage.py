@@ -0,0 +1,117 @@
+import json
+
+from app.models import Simulation
+from app.pharmacokinetics import (
+    SIMULATION_ENGINE_VERSION,
+    load_simulation_curve,
+    materialize_lazy_curves,
+    predict_concentration_timecourse,
+    simulation_curve_rederived,
+)
+from app.sim_storage import decode_curve, encode_curve, load_curve, store_curve
+
+
+PARAMS = {
+    "half_life_hr": 6.0,
+    "clearance_L_per_hr": 5.0,
+    "Vd_L": 43.3,
+    "bioavailability": 0.8,
+}
+
+
+def test_uniform_curve_round_trips_exactly_and_compactly():
+    times, conc = predict_concentration_timecourse(PARAMS, 300.0, 8.0, 12, absorption_rate_hr=1.1)
+    blob = encode_curve(times, conc)
+    assert decode_curve(blob) == (times, conc)
+    json_size = len(json.dumps({"times_hr": times, "conc_mg_per_L": conc}))
+    assert len(blob) < json_size / 3
+
+    t32, c32 = decode_curve(encode_curve(times, conc, use_float32=True))
+    assert t32 == times
+    assert max(abs(a - b) for a, b in zip(c32, conc)) <= 1e-6 * max(conc)
+
+
+def test_irregular_times_are_stored_explicitly():
+    times = [0.0, 0.5, 0.7, 3.0, 10.25]
+    conc = [0.0, 1.5, 2.25, 1.0, 0.125]
+    assert decode_curve(encode_curve(times, conc)) == (times, conc)
+    assert decode_curve(encode_curve([], [])) == ([], [])
+
+
+def test_load_curve_reads_binary_and_legacy_rows():
+    times, conc = [0.0, 0.1, 0.2], [1.0, 0.9, 0.8]
+    legacy = Simulation(sim_results={"times_hr": times, "conc_mg_per_L": conc, "params_used": {}})
+    assert load_curve(legacy) == (times, conc)
+
+    encoded = Simulation(sim_results={"params_used": {}})
+    store_curve(encoded, times, conc)
+    assert "times_hr" not in encoded.sim_results
+    assert load_curve(encoded) == (times, conc)
+
+
+def _lazy_simulation(engine_version):
+    return Simulation(
+        sim_results={
+            "engine_version": engine_version,
+            "curve_encoding": "lazy",
+            "regimen": {
+                "dose_modeled_mg": 300.0,
+                "interval_hr": 8.0,
+                "num_doses": 4,
+                "absorption_rate_hr": 1.1,
+                "body_weight_kg": 70.0,
+                "dt_hr": 0.1,
+            },
+            "params_used": {**PARAMS, "pk_model": "one_compartment", "engine": "analytic"},
+        }
+    )
+
+
+def test_lazy_simulation_is_regenerated_on_read():
+    expected = predict_concentration_timecourse(
+        {**PARAMS, "pk_model": "one_compartment"}, 300.0, 8.0, 4, absorption_rate_hr=1.1
+    )
+    sim = _lazy_simulation(SIMULATION_ENGINE_VERSION)
+    assert load_simulation_curve(sim) == expected
+    assert sim.sim_curve is None
+    assert not simulation_curve_rederived(sim)
+
+    # Another engine version: replayed with the current engine, flagged, and never persisted.
+    stale = _lazy_simulation("0")
+    assert load_simulation_curve(stale) == expected
+    assert stale.sim_curve is None
+    assert simulation_curve_rederived(stale)
+
+
+class _RowsSession:
+    # Stand-in for the sqlite test database, which cannot create the JSONB simulation table.
+    def __init__(self, rows):
+        self.rows = rows
+
+    def exec(self, statement):
+        return self
+
+    def all(self):
+        return [row for row in self.rows if row.sim_curve is None]
+
+    def add(self, row):
+        pass
+
+    def commit(self):
+        pass
+
+
+def test_startup_materialises_only_lazy_rows_from_other_engine_versions():
+    expected = predict_concentration_timecourse(
+        {**PARAMS, "pk_model": "one_compartment"}, 300.0, 8.0, 4, absorption_rate_hr=1.1
+    )
+    current, stale = _lazy_simulation(SIMULATION_ENGINE_VERSION), _lazy_simulation("0")
+    session = _RowsSession([current, stale])
+    assert materialize_lazy_curves(session, stale_only=True) == 1
+    assert materialize_lazy_curves(session, stale_only=True) == 0
+
+    assert stale.sim_curve is not None and current.sim_curve is None
+    # The stored replay is what every later read returns, and it stays flagged.
+    assert load_simulation_curve(stale) == expected
+    assert simulation_curve_rederived(stale)
+    assert not simulation_curve_rederived(current)
@@ -0,0 +1,60 @@
+import json
+import pickle
+import time
+import zlib
+
+from app.source_cache import SourceResponseCache
+
+
+def _fill(cache, count, size=1000):
+    for i in range(count):
+        cache.put(f"key{i}", 200, {}, bytes([i % 251]) * size + str(i).encode())
+
+
+def test_entry_budget_evicts_oldest_first(tmp_path):
+    cache = SourceResponseCache(directory=str(tmp_path), max_entries=3)
+    _fill(cache, 5)
+    assert [cache.get(f"key{i}") is not None for i in range(5)] == [False, False, True, True, True]
+    assert len(list(tmp_path.glob("*.resp.z"))) == 3
+    assert cache.stats()["evictions"] == 2
+
+
+def test_byte_budget_in_memory():
+    cache = SourceResponseCache(max_bytes=200)
+    _fill(cache, 10, size=5000)
+    stats = cache.stats()
+    assert stats["bytes"] <= 200 and stats["entries"] >= 1
+    assert cache.get("key9") is not None and cache.get("key0") is None
+
+
+def test_entries_past_max_age_are_pruned(tmp_path):
+    cache = SourceResponseCache(directory=str(tmp_path), ttl_s=0.01, max_age_s=0.05)
+    cache.put("old", 200, {}, b"label")
+    assert cache.get("old") is not None
+    time.sleep(0.06)
+    assert cache.get("old") is None
+    assert not list(tmp_path.glob("*.resp.z"))
+
+
+def test_existing_directory_counts_against_the_budget(tmp_path):
+    _fill(SourceResponseCache(directory=str(tmp_path)), 4)
+    cache = SourceResponseCache(directory=str(tmp_path), max_entries=2)
+    cache.put("new", 200, {}, b"label")
+    assert len(list(tmp_path.glob("*.resp.z"))) == 2
+    assert cache.get("new") is not None
+
+
+def test_entries_are_stored_as_json_in_a_private_directory(tmp_path):
+    directory = tmp_path / "cache"
+    cache = SourceResponseCache(directory=str(directory))
+    cache.put("label", 200, {"ETag": '"v1"', "Set-Cookie": "x"}, b"\x00\xffbody")
+    assert directory.stat().st_mode & 0o777 == 0o700
+
+    (path,) = directory.glob("*.resp.z")
+    payload = json.loads(zlib.decompress(path.read_bytes()))
+    assert payload["headers"] == {"ETag": '"v1"'}
+    assert cache.get("label")["body"] == b"\x00\xffbody"
+
+    # Anything that is not a JSON entry (an old pickle, a planted file) is a miss, never loaded.
+    path.write_bytes(zlib.compress(pickle.dumps({"status_code": 200})))
+    assert cache.get("label") is None
@@ -0,0 +1,196 @@
+import asyncio
+
+import httpx
+
+import pytest
+
+from app.source_http import (
+    CircuitOpenError,
+    DeadlineExceeded,
+    SourceHttpClient,
+    _parse_retry_after,
+    deadline_scope,
+)
+
+
+def _client(handler, **kwargs):
+    return SourceHttpClient(transport=httpx.MockTransport(handler), backoff_s=0.01, **kwargs)
+
+
+def test_retries_transient_errors_and_honours_retry_after():
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        if len(calls) == 1:
+            return httpx.Response(503)
+        if len(calls) == 2:
+            return httpx.Response(429, headers={"Retry-After": "0"})
+        return httpx.Response(200, json={"ok": True})
+
+    client = _client(handler, retries=3)
+    try:
+        response = client.run(client.get("https://example.org/label"))
+        assert response is not None and response.json() == {"ok": True}
+        assert len(calls) == 3
+        assert client.stats()["retried"] == 2
+    finally:
+        client.close()
+
+
+def test_client_errors_and_long_retry_after_are_not_retried():
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        if request.url.path == "/missing":
+            return httpx.Response(404)
+        return httpx.Response(429, headers={"Retry-After": "120"})
+
+    client = _client(handler, retries=3, max_retry_after_s=5)
+    try:
+        assert client.run(client.get("https://example.org/missing")) is None
+        assert client.run(client.get("https://example.org/busy")) is None
+        assert calls == ["/missing", "/busy"]
+    finally:
+        client.close()
+
+
+def test_per_host_concurrency_limit():
+    active = {"now": 0, "peak": 0}
+
+    async def handler(request):
+        active["now"] += 1
+        active["peak"] = max(active["peak"], active["now"])
+        await asyncio.sleep(0.02)
+        active["now"] -= 1
+        return httpx.Response(200)
+
+    client = _client(handler, per_host_limit=2)
+
+    async def burst():
+        return await asyncio.gather(*(client.get(f"https://example.org/{i}") for i in range(8)))
+
+    try:
+        assert all(r is not None for r in client.run(burst()))
+        assert active["peak"] == 2
+    finally:
+        client.close()
+
+
+def test_parse_retry_after():
+    assert _parse_retry_after("7") == 7.0
+    assert _parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert _parse_retry_after("soon") is None
+    assert _parse_retry_after(None) is None
+
+
+def test_cache_serves_stale_then_revalidates_in_background(tmp_path):
+    from app.source_cache import SourceResponseCache
+
+    seen = []
+
+    def handler(request):
+        seen.append(dict(request.headers))
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304, headers={"ETag": '"v1"'})
+        return httpx.Response(200, headers={"ETag": '"v1"'}, json={"label": "half-life 6 hours"})
+
+    cache = SourceResponseCache(directory=str(tmp_path), ttl_s=3600)
+    client = _client(handler, cache=cache)
+    try:
+        first = client.run(client.get("https://example.org/spls.json", params={"search": "Lithium"}))
+        second = client.run(client.get("https://example.org/spls.json", params={"search": " lithium "}))
+        assert first.json() == second.json() == {"label": "half-life 6 hours"}
+        assert len(seen) == 1
+
+        cache.ttl_s = 0.000001
+        stale = client.run(client.get("https://example.org/spls.json", params={"search": "lithium"}))
+        assert stale.json() == {"label": "half-life 6 hours"}
+        client.run(client.drain())
+        assert len(seen) == 2 and seen[1]["if-none-match"] == '"v1"'
+        assert client.stats()["revalidations"] == 1
+        assert list(tmp_path.glob("*.resp.z"))
+    finally:
+        client.close()
+
+
+def test_not_found_is_cached_with_a_shorter_ttl(tmp_path):
+    from app.source_cache import SourceResponseCache
+
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        if request.url.path == "/broken":
+            return httpx.Response(400)
+        return httpx.Response(404)
+
+    cache = SourceResponseCache(directory=str(tmp_path), ttl_s=3600, negative_ttl_s=60)
+    client = _client(handler, cache=cache)
+    try:
+        for _ in range(3):
+            assert client.run(client.get("https://example.org/missing")) is None
+            assert client.run(client.get("https://example.org/broken")) is None
+        # The 404 is answered from the cache; other client errors are not cached.
+        assert calls.count("/missing") == 1 and calls.count("/broken") == 3
+
+        cache.negative_ttl_s = 0.000001
+        assert client.run(client.get("https://example.org/missing")) is None
+        client.run(client.drain())
+        assert calls.count("/missing") == 2
+    finally:
+        client.close()
+
+
+def test_circuit_opens_after_failures_and_recovers_half_open():
+    calls = []
+    healthy = {"up": False}
+
+    def handler(request):
+        calls.append(request.url.path)
+        if not healthy["up"]:
+            raise httpx.ConnectError("refused", request=request)
+        return httpx.Response(200)
+
+    client = _client(handler, retries=0, breaker_threshold=2, breaker_cooldown_s=60)
+    try:
+        assert client.run(client.get("https://example.org/a")) is None
+        assert client.run(client.get("https://example.org/b")) is None
+        with pytest.raises(CircuitOpenError):
+            client.run(client.get("https://example.org/c"))
+        assert len(calls) == 2
+        assert client.stats()["circuits"] == {"example.org": "open"}
+
+        # Cool-down elapsed: one trial request goes through and closes the circuit.
+        client.breaker("example.org").cooldown_s = 0
+        healthy["up"] = True
+        assert client.run(client.get("https://example.org/d")) is not None
+        assert client.stats()["circuits"] == {"example.org": "closed"}
+    finally:
+        client.close()
+
+
+def test_deadline_caps_call_timeouts_and_skips_retries():
+    timeouts = []
+
+    async def handler(request):
+        # MockTransport does not enforce timeouts, so emulate a host that never answers.
+        read_timeout = request.extensions["timeout"]["read"]
+        timeouts.append(read_timeout)
+        await asyncio.sleep(read_timeout)
+        raise httpx.ReadTimeout("no answer", request=request)
+
+    client = _client(handler, retries=3)
+
+    async def fetch():
+        with deadline_scope(0.2):
+            return await client.get("https://example.org/slow", timeout=5)
+
+    try:
+        with pytest.raises(DeadlineExceeded):
+            client.run(fetch())
+        assert timeouts and all(t <= 0.2 for t in timeouts)
+        assert client.breaker("example.org").failures == 1
+    finally:
+        client.close()
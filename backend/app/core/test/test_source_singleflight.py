@@ -0,0 +1,131 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import pytest
+from sqlmodel import create_engine
+
+from app.source_singleflight import SingleFlight, advisory_lock
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"half_life_hr": 6.0, "sources": {}}
+
+    results = []
+
+    def caller(name):
+        results.append(flight.do(name, fetch))
+
+    threads = [threading.Thread(target=caller, args=(name,)) for name in ("Lithium", " lithium", "LITHIUM ", "lithium")]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert flight.stats()["coalesced"] == 3
+    assert all(r == {"half_life_hr": 6.0, "sources": {}} for r in results)
+    # Every caller gets its own copy to mutate.
+    results[0]["sources"]["x"] = 1
+    assert results[1]["sources"] == {}
+
+
+def test_errors_reach_every_waiter_and_are_not_cached():
+    flight = SingleFlight()
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        time.sleep(0.1)
+        raise RuntimeError("upstream down")
+
+    errors = []
+
+    def follower():
+        started.wait()
+        try:
+            flight.do("warfarin", failing)
+        except RuntimeError as exc:
+            errors.append(exc)
+
+    t = threading.Thread(target=follower)
+    t.start()
+    with pytest.raises(RuntimeError):
+        flight.do("warfarin", failing)
+    t.join()
+
+    assert len(errors) == 1
+    assert flight.do("warfarin", lambda: "ok") == "ok"
+
+
+def test_cross_worker_lock_wraps_the_leader_only():
+    held = []
+
+    @contextmanager
+    def lock(key):
+        held.append(key)
+        yield True
+
+    flight = SingleFlight(cross_worker_lock=lock)
+    assert flight.do("Vancomycin ", lambda: 1) == 1
+    assert held == ["vancomycin"]
+
+
+def test_advisory_lock_is_a_no_op_off_postgres():
+    with advisory_lock(create_engine("sqlite://"), "lithium", wait_s=1) as acquired:
+        assert acquired is False
+
+
+class _FakeConnection:
+    def __init__(self, fail_lock=False):
+        self.fail_lock = fail_lock
+        self.statements = []
+        self.closed = False
+
+    def execute(self, statement, params=None):
+        sql = str(statement)
+        self.statements.append(sql)
+        if self.fail_lock and "pg_advisory_lock" in sql:
+            from sqlalchemy.exc import DBAPIError
+
+            raise DBAPIError(sql, params, Exception("canceling statement due to lock timeout"))
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        self.statements.append("ROLLBACK")
+
+    def close(self):
+        self.closed = True
+
+
+class _FakePostgresEngine:
+    def __init__(self, conn):
+        self.conn = conn
+        self.dialect = type("Dialect", (), {"name": "postgresql"})()
+
+    def connect(self):
+        return self.conn
+
+
+def test_advisory_lock_waits_server_side_with_lock_timeout():
+    conn = _FakeConnection()
+    with advisory_lock(_FakePostgresEngine(conn), "lithium", wait_s=2.5) as acquired:
+        assert acquired is True
+    assert conn.statements[0] == "SET LOCAL lock_timeout = '2500ms'"
+    assert "pg_advisory_lock" in conn.statements[1]
+    assert "pg_advisory_unlock" in conn.statements[-1]
+    assert conn.closed
+
+    timed_out = _FakeConnection(fail_lock=True)
+    with advisory_lock(_FakePostgresEngine(timed_out), "lithium", wait_s=0.1) as acquired:
+        assert acquired is False
+    assert not any("unlock" in sql for sql in timed_out.statements)
+    assert timed_out.closed
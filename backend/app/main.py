@@ -4,8 +4,13 @@ from dotenv import load_dotenv
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from sqlmodel import Session
 
-from app.core.db import create_tables
+from app.core.db import create_tables, engine
+from app.pharmacokinetics import materialize_lazy_curves
+from app.sim_executor import shutdown_simulation_pool, start_simulation_pool
+from app.sim_jobs import SIMULATION_JOBS
+from app.source_http import SOURCE_HTTP
 from app.api.routes import clinicians, patients, simulations, login, medications, pk, patient_login, it
 
 load_dotenv()
@@ -28,7 +33,14 @@ def get_cors_origins() -> list[str]:
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     create_tables()
+    # Lazy simulations from a previous engine version are pinned to a stored curve once.
+    with Session(engine) as session:
+        materialize_lazy_curves(session, stale_only=True)
+    start_simulation_pool()
     yield
+    SIMULATION_JOBS.shutdown()
+    shutdown_simulation_pool()
+    SOURCE_HTTP.close()
 
 
 app = FastAPI(title="Capstone Backend", lifespan=lifespan)
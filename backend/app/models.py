@@ -7,7 +7,7 @@ from decimal import Decimal
 from sqlmodel import SQLModel, Field, Column, Relationship
 from pydantic import EmailStr, BaseModel
 from sqlalchemy.dialects.postgresql import JSONB
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, LargeBinary
 
 
 class Test(SQLModel, table=True):
@@ -129,6 +129,10 @@ class Medication(SQLModel, table=True):
     therapeutic_window_upper_mg_l: Decimal | None = None
     source_url: str | None = None
 
+    pk_model_type: str | None = None
+    intercompartmental_clearance_l_per_hr: Decimal | None = None
+    peripheral_volume_l: Decimal | None = None
+
     patients: list[Patient] | None = Relationship(
         back_populates="medications",
         link_model=PatientMedicationLink
@@ -155,6 +159,7 @@ class Simulation(SQLModel, table=True):
     dosage_mg: Decimal | None = Field(default=None, max_digits=6, decimal_places=3)
     interval_hours: int | None = None
     sim_results: dict[str, Any] = Field(default_factory=dict, sa_column=Column(JSONB))
+    sim_curve: bytes | None = Field(default=None, sa_column=Column(LargeBinary))
 
     dose_mg: Decimal | None = None
     interval_hr: Decimal | None = None
@@ -1,28 +1,88 @@
+import asyncio
+import contextvars
+import math
+import os
 import re
+import time
 from decimal import Decimal
 from datetime import datetime
-from typing import Dict, Tuple, List, Any, Optional
+from typing import Callable, Dict, Tuple, List, Any, Iterator, Optional
 
+import numpy as np
 import requests
+from scipy.integrate import solve_ivp
+from scipy.linalg import expm
 from sqlmodel import Session, select
 
 from .models import Patient, Medication, MedicationTherapeuticWindowReview, Simulation
 from .pk_scoring import (
     TherapeuticTargets,
+    best_scale_for_window,
+    classify_window_exposure,
     evaluate_therapeutic_window as score_therapeutic_window,
+    evaluate_therapeutic_window_batch,
+)
+from .sim_admission import SIMULATION_ADMISSION
+from .sim_cache import SIMULATION_CACHE, memoize
+from .sim_executor import run_cpu_bound
+from .sim_storage import load_curve, store_curve
+from .source_cache import normalize_lookup_value
+from .source_singleflight import SOURCE_FETCHES
+from .source_http import (
+    SOURCE_HTTP,
+    CircuitOpenError,
+    DeadlineExceeded,
+    SourceHttpClient,
+    deadline_scope,
+    remaining_budget,
 )
 
 DEFAULT_HTTP_TIMEOUT = 8
+# Wall-clock budget for one fetch_drug_pharmacokinetics call across every source and retry.
+SOURCE_FETCH_DEADLINE_S = float(os.getenv("SOURCE_FETCH_DEADLINE_S", "12"))
 USER_AGENT = "Capstone-Crew-Pharmaco/1.0 (+https://github.com/Whit3KD35/Capstone-Crew)"
 SOURCE_WEIGHTS = {
     "dailymed": 3.0,
     "openfda": 2.5,
     "pubchem": 2.0,
 }
+SIMULATION_ENGINES = ("analytic", "euler", "adaptive")
+PK_MODEL_TYPES = ("one_compartment", "two_compartment")
+DEFAULT_SIMULATION_ENGINE = "analytic"
+# Bump whenever a change alters simulated curves, so cached and persisted results are not reused.
+# On startup, lazy simulations from any other version are materialised once (flagged as
+# re-derived) so their curve stops changing; materialize_lazy_curves() run on the old version
+# before deploying keeps the original curves instead.
+SIMULATION_ENGINE_VERSION = "1"
+# Bump when regimen ranking changes without the curves changing, so cached rankings are dropped.
+RECOMMENDER_VERSION = "4"
+# "binary" persists every curve; "lazy" persists only the inputs and regenerates on read.
+SIM_CURVE_STORAGE = os.getenv("SIM_CURVE_STORAGE", "binary").strip().lower()
+_DRUG_PARAM_KEYS = (
+    "half_life_hr",
+    "clearance_L_per_hr",
+    "Vd_L",
+    "bioavailability",
+    "pk_model",
+    "intercompartmental_clearance_L_per_hr",
+    "peripheral_volume_L",
+)
+ADAPTIVE_RTOL = 1e-5
+# Courses at least this many half-lives long are treated as reaching steady state.
+_STEADY_STATE_HALF_LIVES = 5.0
+# Upper bound on (rows x samples) materialised at once by batched evaluation.
+_BATCH_MAX_CELLS = 2_000_000
 
 
 # Network utilities
-def _safe_get(
+# Per-source outcome for the fetch report; each source runs in its own task and context.
+_SOURCE_STATUS: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar(
+    "source_status", default=None
+)
+
+
+async def _safe_get(
+    client: SourceHttpClient,
     url: str,
     params: dict | None = None,
     headers: dict | None = None,
@@ -30,11 +90,16 @@ def _safe_get(
 ):
     headers = headers or {}
     headers.setdefault("User-Agent", USER_AGENT)
+    status = _SOURCE_STATUS.get()
     try:
-        r = requests.get(url, params=params, headers=headers, timeout=timeout)
-        r.raise_for_status()
-        return r
-    except Exception:
+        return await client.get(url, params=params, headers=headers, timeout=timeout)
+    except CircuitOpenError:
+        if status is not None:
+            status["status"] = "skipped"
+        return None
+    except DeadlineExceeded:
+        if status is not None:
+            status["status"] = "timed_out"
         return None
 
 
@@ -87,10 +152,9 @@ def _estimate_active_moiety_fraction(med_name: str) -> float:
     return 1.0
 
 
-def _estimate_input_dose_for_target_window(
+def _mid_window_modeled_dose(
     drug_params: Dict[str, Optional[float]],
     interval_hr: float,
-    active_fraction: float,
     target_low_mg_l: float,
     target_high_mg_l: float,
 ) -> Optional[float]:
@@ -98,17 +162,59 @@ def _estimate_input_dose_for_target_window(
     f = drug_params.get("bioavailability")
     if cl is None or cl <= 0 or interval_hr <= 0:
         return None
-    if active_fraction <= 0:
-        return None
     if f is None or f <= 0:
         f = 1.0
     target_mid = (target_low_mg_l + target_high_mg_l) / 2.0
     modeled_dose = target_mid * cl * interval_hr / f
     if modeled_dose <= 0:
         return None
-    return modeled_dose / active_fraction
+    return modeled_dose
+
 
+def _estimate_input_dose_for_target_window(
+    drug_params: Dict[str, Optional[float]],
+    interval_hr: float,
+    active_fraction: float,
+    target_low_mg_l: float,
+    target_high_mg_l: float,
+    num_doses: Optional[int] = None,
+    absorption_rate_hr: Optional[float] = None,
+    dt_hr: float = 0.1,
+    engine: str = DEFAULT_SIMULATION_ENGINE,
+) -> Optional[float]:
+    if active_fraction <= 0:
+        return None
+    mid_dose = _mid_window_modeled_dose(drug_params, interval_hr, target_low_mg_l, target_high_mg_l)
+    if mid_dose is None:
+        return None
+    if num_doses is None:
+        return mid_dose / active_fraction
 
+    # Scale one unit-dose curve to the dose that keeps the regimen in the window longest,
+    # preferring the average-concentration (mid-window) dose among equally good ones.
+    try:
+        times, unit_conc = _unit_dose_curves(
+            drug_params, [(interval_hr, num_doses)], absorption_rate_hr, dt_hr, engine
+        )[0]
+    except (ValueError, ZeroDivisionError):
+        return mid_dose / active_fraction
+    best = best_scale_for_window(
+        times,
+        unit_conc,
+        target_low_mg_l,
+        target_high_mg_l,
+        t_start_hr=0.0,
+        t_end_hr=interval_hr * num_doses,
+        reference_scale=mid_dose,
+    )
+    return (best if best is not None else mid_dose) / active_fraction
+
+
+@memoize(
+    SIMULATION_CACHE,
+    f"recommend:{SIMULATION_ENGINE_VERSION}:{RECOMMENDER_VERSION}",
+    copy_result=lambda rows: [dict(row) for row in rows],
+)
 def _recommend_regimens_for_window(
     drug_params: Dict[str, Optional[float]],
     active_fraction: float,
@@ -122,8 +228,9 @@ def _recommend_regimens_for_window(
     tw_high: float,
     tw_targets: TherapeuticTargets,
     goal_pct_within: float = 96.0,
+    engine: str = DEFAULT_SIMULATION_ENGINE,
 ) -> list[Dict[str, Any]]:
-    if current_input_dose_mg <= 0 or current_interval_hr <= 0:
+    if current_input_dose_mg <= 0 or current_interval_hr <= 0 or active_fraction <= 0:
         return []
 
     interval_candidates = sorted(
@@ -138,6 +245,12 @@ def _recommend_regimens_for_window(
             24.0,
         }
     )
+    # An interval whose steady-state swing cannot fit the window is not simulated for courses
+    # long enough to reach steady state; shorter courses are ranked on their own time course.
+    feasible = set(
+        _steady_state_feasible_intervals(drug_params, interval_candidates, absorption_rate_hr, tw_low, tw_high)
+    )
+    settle_hr = _steady_state_onset_hr(drug_params, absorption_rate_hr)
     dose_count_candidates = sorted(
         {
             max(2, int(num_doses)),
@@ -148,70 +261,215 @@ def _recommend_regimens_for_window(
             24,
         }
     )
+    pairs = [
+        (interval, n_doses)
+        for interval in interval_candidates
+        for n_doses in dose_count_candidates
+        if interval in feasible or settle_hr is None or interval * n_doses < settle_hr
+    ]
 
-    dose_candidates = sorted(
-        {
-            round(max(25.0, current_input_dose_mg * 0.5), 1),
-            round(current_input_dose_mg * 0.75, 1),
-            round(current_input_dose_mg, 1),
-            round(current_input_dose_mg * 1.25, 1),
-            round(current_input_dose_mg * 1.5, 1),
-        }
-    )
+    # The model is linear in dose: simulate one unit-dose curve per (interval, num_doses)
+    # and solve for the best dose on it instead of re-simulating a fixed dose grid.
+    try:
+        curves = _unit_dose_curves(drug_params, pairs, absorption_rate_hr, dt_hr, engine)
+    except (ValueError, ZeroDivisionError):
+        return []
 
     candidates: list[Dict[str, Any]] = []
-    for interval in interval_candidates:
-        for n_doses in dose_count_candidates:
-            for input_dose in dose_candidates:
-                modeled_dose = input_dose * active_fraction
-                try:
-                    times, conc = predict_concentration_timecourse(
-                        drug_params=drug_params,
-                        dosing_mg=modeled_dose,
-                        dosing_interval_hr=interval,
-                        num_doses=n_doses,
-                        absorption_rate_hr=absorption_rate_hr,
-                        body_weight_kg=body_weight_kg,
-                        dt_hr=dt_hr,
-                    )
-                    eval_res = evaluate_therapeutic_window(
-                        times,
-                        conc,
-                        tw_low,
-                        tw_high,
-                        t_start_hr=0.0,
-                        t_end_hr=interval * n_doses,
-                        targets=tw_targets,
-                    )
-                except Exception:
-                    continue
-                candidates.append(
-                    {
-                        "dose_mg": input_dose,
-                        "interval_hr": interval,
-                        "num_doses": n_doses,
-                        "pct_within": float(eval_res["pct_within"]),
-                        "pct_below": float(eval_res["pct_below"]),
-                        "pct_above": float(eval_res["pct_above"]),
-                        "risk": str(eval_res["ade_risk_level"]),
-                        "meets_goal_96pct": float(eval_res["pct_within"]) >= goal_pct_within,
-                    }
-                )
+    for (interval, n_doses), (times, unit_conc) in zip(pairs, curves):
+        reference = _mid_window_modeled_dose(drug_params, interval, tw_low, tw_high)
+        best = best_scale_for_window(
+            times,
+            unit_conc,
+            tw_low,
+            tw_high,
+            t_start_hr=0.0,
+            t_end_hr=interval * n_doses,
+            reference_scale=reference,
+        )
+        if best is None:
+            continue
+        # The optimum often sits on a window edge, where rounding the wrong way pushes the peak
+        # over (or the trough under) the limit. Score the 0.1 mg values either side and keep
+        # the better one.
+        exact = best / active_fraction
+        input_doses = sorted({math.floor(exact * 10) / 10, math.ceil(exact * 10) / 10})
+        input_doses = [dose for dose in input_doses if dose > 0]
+        if not input_doses:
+            continue
+        scored = _score_scaled_unit_curve(
+            times,
+            unit_conc,
+            interval,
+            n_doses,
+            input_doses,
+            active_fraction,
+            tw_low,
+            tw_high,
+            tw_targets,
+            goal_pct_within,
+        )
+        candidates.append(max(scored, key=_regimen_rank_key))
 
-    # Rank by highest within-target %, then lower high-risk exposure, then lower low-risk exposure.
-    ranked = sorted(
-        candidates,
-        key=lambda x: (
-            x["meets_goal_96pct"],
-            x["pct_within"],
-            -x["pct_above"],
-            -x["pct_below"],
-        ),
-        reverse=True,
-    )
+    ranked = sorted(candidates, key=_regimen_rank_key, reverse=True)
     return ranked[:5]
 
 
+def _regimen_rank_key(row: Dict[str, Any]) -> tuple:
+    # Highest within-target %, then lower high-risk exposure, then lower low-risk exposure.
+    return (row["meets_goal_96pct"], row["pct_within"], -row["pct_above"], -row["pct_below"])
+
+
+def _steady_state_feasible_intervals(
+    drug_params: Dict[str, Optional[float]],
+    intervals: list[float],
+    absorption_rate_hr: Optional[float],
+    tw_low: float,
+    tw_high: float,
+) -> list[float]:
+    # Css,max / Css,min does not depend on dose, so an interval whose steady-state swing is wider
+    # than the window can never hold steady state inside it. Keep every interval if none can.
+    if tw_low <= 0 or tw_high <= tw_low:
+        return intervals
+    feasible: list[float] = []
+    for interval in intervals:
+        try:
+            ss = compute_steady_state_metrics(drug_params, 1.0, interval, absorption_rate_hr)
+        except (ValueError, ZeroDivisionError):
+            return intervals
+        if ss["css_min_mg_l"] > 0 and ss["css_max_mg_l"] / ss["css_min_mg_l"] <= tw_high / tw_low:
+            feasible.append(interval)
+    return feasible or intervals
+
+
+def _steady_state_onset_hr(
+    drug_params: Dict[str, Optional[float]],
+    absorption_rate_hr: Optional[float],
+) -> Optional[float]:
+    # About five elimination (terminal, for two compartments) half-lives; with flip-flop
+    # kinetics the slower absorption half-life governs instead.
+    try:
+        if _is_two_compartment(drug_params):
+            half = _resolve_two_compartment_params(drug_params, absorption_rate_hr)[-1]
+        else:
+            half = _resolve_one_compartment_params(drug_params, absorption_rate_hr)[-1]
+    except (ValueError, ZeroDivisionError):
+        return None
+    if absorption_rate_hr:
+        half = max(half, 0.693 / absorption_rate_hr)
+    return _STEADY_STATE_HALF_LIVES * half
+
+
+def _unit_dose_curves(
+    drug_params: Dict[str, Optional[float]],
+    pairs: list[tuple[float, int]],
+    absorption_rate_hr: Optional[float],
+    dt_hr: float,
+    engine: str = DEFAULT_SIMULATION_ENGINE,
+) -> list[tuple[np.ndarray, np.ndarray]]:
+    # (times, concentration per 1 mg modeled dose) for each (interval, num_doses), sampled
+    # through the end of therapy, which is all the window scoring looks at.
+    CL, Vd, F, _ = _resolve_one_compartment_params(drug_params, absorption_rate_hr)
+    curves: list[tuple[np.ndarray, np.ndarray]] = [(np.zeros(0), np.zeros(0))] * len(pairs)
+    if not pairs:
+        return curves
+
+    if engine != "analytic" or _is_two_compartment(drug_params):
+        for i, (interval, n_doses) in enumerate(pairs):
+            times, conc = predict_concentration_timecourse(
+                drug_params=drug_params,
+                dosing_mg=1.0,
+                dosing_interval_hr=interval,
+                num_doses=n_doses,
+                absorption_rate_hr=absorption_rate_hr,
+                t_end_hr=interval * n_doses + dt_hr,
+                dt_hr=dt_hr,
+                engine=engine,
+            )
+            curves[i] = (np.asarray(times), np.asarray(conc))
+        return curves
+
+    intervals = np.array([p[0] for p in pairs], dtype=float)
+    dose_counts = np.array([p[1] for p in pairs], dtype=int)
+    therapy_ends = intervals * dose_counts
+
+    # Group rows of similar horizon so short regimens are not evaluated on the longest grid,
+    # and cap each chunk's cell count so the working set stays bounded.
+    order = np.argsort(therapy_ends, kind="stable")
+    start = 0
+    while start < len(order):
+        horizon = float(therapy_ends[order[start]])
+        stop = start + 1
+        while stop < len(order) and therapy_ends[order[stop]] <= 2.0 * horizon:
+            stop += 1
+        rows = order[start:stop]
+        times = _sample_times(float(therapy_ends[rows].max()) + dt_hr, dt_hr)
+        rows_per_chunk = max(1, _BATCH_MAX_CELLS // len(times))
+        for chunk_start in range(0, len(rows), rows_per_chunk):
+            chunk = rows[chunk_start:chunk_start + rows_per_chunk]
+            conc = _multiple_dose_batch(
+                times,
+                intervals[chunk],
+                dose_counts[chunk],
+                np.ones(len(chunk)),
+                CL / Vd,
+                Vd,
+                F,
+                absorption_rate_hr,
+            )
+            for row, idx in enumerate(chunk):
+                curves[idx] = (times, conc[row])
+        start = stop
+    return curves
+
+
+def _score_scaled_unit_curve(
+    times: np.ndarray,
+    unit_conc: np.ndarray,
+    interval: float,
+    n_doses: int,
+    input_doses: list[float],
+    active_fraction: float,
+    tw_low: float,
+    tw_high: float,
+    tw_targets: TherapeuticTargets,
+    goal_pct_within: float,
+) -> list[Dict[str, Any]]:
+    modeled_doses = np.asarray(input_doses, dtype=float) * active_fraction
+    scored = evaluate_therapeutic_window_batch(
+        times,
+        modeled_doses[:, None] * unit_conc[None, :],
+        tw_low,
+        tw_high,
+        t_start_hr=0.0,
+        t_end_hr=interval * n_doses,
+        targets=tw_targets,
+    )
+    out: list[Dict[str, Any]] = []
+    for i, input_dose in enumerate(input_doses):
+        within = float(scored["pct_within"][i])
+        below = float(scored["pct_below"][i])
+        above = float(scored["pct_above"][i])
+        risk = (
+            classify_window_exposure(below, within, above, tw_targets)["ade_risk_level"]
+            if scored["evaluable"][i]
+            else "UNKNOWN"
+        )
+        out.append(
+            {
+                "dose_mg": input_dose,
+                "interval_hr": interval,
+                "num_doses": n_doses,
+                "pct_within": within,
+                "pct_below": below,
+                "pct_above": above,
+                "risk": risk,
+                "meets_goal_96pct": within >= goal_pct_within,
+            }
+        )
+    return out
+
+
 def _convert_concentration_to_mg_per_l(
     value: float,
     unit: str,
@@ -720,7 +978,7 @@ def ensure_patient_crcl(session: Session, patient: Patient) -> None:
 
 
 # Drug fetching
-def fetch_from_pubchem(drug_name: str) -> Dict[str, Any]:
+async def fetch_from_pubchem_async(client: SourceHttpClient, drug_name: str) -> Dict[str, Any]:
     out: Dict[str, Any] = {
         "raw": None,
         "half_life_hr": None,
@@ -740,7 +998,7 @@ def fetch_from_pubchem(drug_name: str) -> Dict[str, Any]:
         "https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/name/"
         f"{requests.utils.requote_uri(drug_name)}/cids/JSON"
     )
-    r1 = _safe_get(url_cid)
+    r1 = await _safe_get(client, url_cid)
     if not r1:
         return out
 
@@ -753,7 +1011,7 @@ def fetch_from_pubchem(drug_name: str) -> Dict[str, Any]:
         return out
 
     url_view = f"https://pubchem.ncbi.nlm.nih.gov/rest/pug_view/data/compound/{cid}/JSON"
-    r2 = _safe_get(url_view)
+    r2 = await _safe_get(client, url_view)
     if not r2:
         return out
 
@@ -793,7 +1051,7 @@ def fetch_from_pubchem(drug_name: str) -> Dict[str, Any]:
     return out
 
 
-def fetch_from_dailymed(drug_name: str) -> Dict[str, Any]:
+async def fetch_from_dailymed_async(client: SourceHttpClient, drug_name: str) -> Dict[str, Any]:
     out: Dict[str, Any] = {
         "raw": None,
         "half_life_hr": None,
@@ -810,9 +1068,9 @@ def fetch_from_dailymed(drug_name: str) -> Dict[str, Any]:
     }
 
     search_url = "https://dailymed.nlm.nih.gov/dailymed/services/v2/spls.json"
-    r = _safe_get(search_url, params={"drug_label_name": drug_name})
+    r = await _safe_get(client, search_url, params={"drug_label_name": drug_name})
     if not r:
-        r = _safe_get(search_url, params={"search": drug_name})
+        r = await _safe_get(client, search_url, params={"search": drug_name})
         if not r:
             return out
 
@@ -826,7 +1084,7 @@ def fetch_from_dailymed(drug_name: str) -> Dict[str, Any]:
             return out
 
         spl_url = f"https://dailymed.nlm.nih.gov/dailymed/services/v2/spls/{setid}.json"
-        r2 = _safe_get(spl_url, headers={"Accept": "application/json"})
+        r2 = await _safe_get(client, spl_url, headers={"Accept": "application/json"})
         if not r2:
             return out
 
@@ -864,7 +1122,22 @@ def fetch_from_dailymed(drug_name: str) -> Dict[str, Any]:
     return out
 
 
-def fetch_from_openfda(drug_name: str) -> Dict[str, Any]:
+_OPENFDA_NAME_FIELDS = ("brand_name", "generic_name", "substance_name")
+# Labels fetched per lookup, enough for the preferred name match to be among them.
+_OPENFDA_CANDIDATES = 10
+
+
+def _pick_openfda_label(results: List[Dict[str, Any]], drug_name: str) -> Dict[str, Any]:
+    name = normalize_lookup_value(drug_name)
+    for field in _OPENFDA_NAME_FIELDS:
+        for label in results:
+            values = (label.get("openfda") or {}).get(field) or []
+            if any(name in normalize_lookup_value(v) for v in values):
+                return label
+    return results[0]
+
+
+async def fetch_from_openfda_async(client: SourceHttpClient, drug_name: str) -> Dict[str, Any]:
     out: Dict[str, Any] = {
         "raw": None,
         "half_life_hr": None,
@@ -880,18 +1153,11 @@ def fetch_from_openfda(drug_name: str) -> Dict[str, Any]:
         "Vd_raw_unit": None,
     }
 
-    search_terms = [
-        f'openfda.brand_name:"{drug_name}"',
-        f'openfda.generic_name:"{drug_name}"',
-        f'openfda.substance_name:"{drug_name}"',
-    ]
-
+    # One OR query instead of three round trips; openFDA orders the hits by relevance, so the
+    # brand > generic > substance name precedence is applied to the returned labels here.
     base_url = "https://api.fda.gov/drug/label.json"
-    resp = None
-    for q in search_terms:
-        resp = _safe_get(base_url, params={"search": q, "limit": 1})
-        if resp:
-            break
+    search = " OR ".join(f'openfda.{field}:"{drug_name}"' for field in _OPENFDA_NAME_FIELDS)
+    resp = await _safe_get(client, base_url, params={"search": search, "limit": _OPENFDA_CANDIDATES})
     if not resp:
         return out
 
@@ -899,7 +1165,7 @@ def fetch_from_openfda(drug_name: str) -> Dict[str, Any]:
         results = resp.json().get("results", [])
         if not results:
             return out
-        label = results[0]
+        label = _pick_openfda_label(results, drug_name)
         texts: List[str] = []
         for key in (
             "clinical_pharmacology",
@@ -933,7 +1199,72 @@ def fetch_from_openfda(drug_name: str) -> Dict[str, Any]:
     return out
 
 
+SOURCE_FETCHERS = {
+    "dailymed": fetch_from_dailymed_async,
+    "openfda": fetch_from_openfda_async,
+    "pubchem": fetch_from_pubchem_async,
+}
+
+
+async def _fetch_source_with_report(
+    source_name: str,
+    client: SourceHttpClient,
+    drug_name: str,
+) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+    status: Dict[str, Any] = {"status": "ok"}
+    _SOURCE_STATUS.set(status)
+    started = time.monotonic()
+    budget = remaining_budget()
+    result: Optional[Dict[str, Any]] = None
+    try:
+        # wait_for is the hard stop; per-call timeouts already shrink to the remaining budget.
+        result = await asyncio.wait_for(SOURCE_FETCHERS[source_name](client, drug_name), budget)
+    except asyncio.TimeoutError:
+        status["status"] = "timed_out"
+    except Exception as exc:
+        status["status"] = "error"
+        status["error"] = str(exc) or exc.__class__.__name__
+    if status["status"] == "ok" and result is not None and not result.get("raw"):
+        status["status"] = "no_data"
+    status["elapsed_s"] = round(time.monotonic() - started, 3)
+    return (result if status["status"] in ("ok", "no_data") else None), status
+
+
+async def _fetch_all_sources(
+    drug_name: str,
+    client: SourceHttpClient = SOURCE_HTTP,
+    deadline_s: Optional[float] = None,
+) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+    # All sources run concurrently (requests within one source stay chained) under one shared
+    # deadline, so a cold lookup takes as long as the slowest source, capped at the budget.
+    # Returns (values per source, status report per source).
+    with deadline_scope(SOURCE_FETCH_DEADLINE_S if deadline_s is None else deadline_s):
+        outcomes = await asyncio.gather(
+            *(_fetch_source_with_report(name, client, drug_name) for name in SOURCE_FETCHERS)
+        )
+    values = {name: result for name, (result, _) in zip(SOURCE_FETCHERS, outcomes) if result is not None}
+    report = {name: status for name, (_, status) in zip(SOURCE_FETCHERS, outcomes)}
+    return values, report
+
+
+def fetch_from_pubchem(drug_name: str) -> Dict[str, Any]:
+    return SOURCE_HTTP.run(fetch_from_pubchem_async(SOURCE_HTTP, drug_name))
+
+
+def fetch_from_dailymed(drug_name: str) -> Dict[str, Any]:
+    return SOURCE_HTTP.run(fetch_from_dailymed_async(SOURCE_HTTP, drug_name))
+
+
+def fetch_from_openfda(drug_name: str) -> Dict[str, Any]:
+    return SOURCE_HTTP.run(fetch_from_openfda_async(SOURCE_HTTP, drug_name))
+
+
 def fetch_drug_pharmacokinetics(drug_name: str) -> Dict[str, Any]:
+    # Concurrent lookups of the same (normalized) name share one upstream fetch.
+    return SOURCE_FETCHES.do(drug_name, lambda: _fetch_drug_pharmacokinetics_uncoalesced(drug_name))
+
+
+def _fetch_drug_pharmacokinetics_uncoalesced(drug_name: str) -> Dict[str, Any]:
     pk: Dict[str, Any] = {
         "half_life_hr": None,
         "clearance_L_per_hr": None,
@@ -949,28 +1280,12 @@ def fetch_drug_pharmacokinetics(drug_name: str) -> Dict[str, Any]:
         "consensus": {},
     }
 
-    source_values: Dict[str, Dict[str, Any]] = {}
-
-    try:
-        dm = fetch_from_dailymed(drug_name)
-        pk["sources"]["dailymed"] = dm.get("raw")
-        source_values["dailymed"] = dm
-    except Exception:
-        pass
-
-    try:
-        ofda = fetch_from_openfda(drug_name)
-        pk["sources"]["openfda"] = ofda.get("raw")
-        source_values["openfda"] = ofda
-    except Exception:
-        pass
-
-    try:
-        pc = fetch_from_pubchem(drug_name)
-        pk["sources"]["pubchem"] = pc.get("raw")
-        source_values["pubchem"] = pc
-    except Exception:
-        pass
+    source_values, source_report = SOURCE_HTTP.run(_fetch_all_sources(drug_name))
+    for source_name, values in source_values.items():
+        pk["sources"][source_name] = values.get("raw")
+    pk["source_status"] = source_report
+    pk["skipped_sources"] = [n for n, r in source_report.items() if r["status"] == "skipped"]
+    pk["timed_out_sources"] = [n for n, r in source_report.items() if r["status"] == "timed_out"]
 
     for field in (
         "half_life_hr",
@@ -1065,16 +1380,10 @@ def fetch_drug_pharmacokinetics(drug_name: str) -> Dict[str, Any]:
 
 
 # Simulation core
-def predict_concentration_timecourse(
+def _resolve_one_compartment_params(
     drug_params: Dict[str, Optional[float]],
-    dosing_mg: float,
-    dosing_interval_hr: float,
-    num_doses: int,
-    absorption_rate_hr: Optional[float] = None,
-    body_weight_kg: Optional[float] = None,
-    t_end_hr: Optional[float] = None,
-    dt_hr: float = 0.1,
-) -> Tuple[List[float], List[float]]:
+    absorption_rate_hr: Optional[float],
+) -> Tuple[float, float, float, float]:
     half = drug_params.get("half_life_hr")
     CL = drug_params.get("clearance_L_per_hr")
     Vd = drug_params.get("Vd_L")
@@ -1101,28 +1410,352 @@ def predict_concentration_timecourse(
     kel = CL / Vd
     if half is None:
         half = 0.693 / kel
+    return CL, Vd, F, half
+
+
+def _sample_times(t_end_hr: float, dt_hr: float) -> np.ndarray:
+    n_samples = int((t_end_hr + 1e-9) // dt_hr) + 1
+    return np.round(np.arange(n_samples) * dt_hr, 6)
+
+
+def _single_dose_concentration(
+    tau_hr: np.ndarray,
+    dose_mg: float,
+    kel: float,
+    Vd: float,
+    F: float,
+    ka: Optional[float],
+) -> np.ndarray:
+    # IV bolus: C = F*D/Vd * e^(-kel*t); first-order oral: Bateman function.
+    if ka is None:
+        return (F * dose_mg / Vd) * np.exp(-kel * tau_hr)
+    if abs(ka - kel) <= 1e-9 * max(ka, kel):
+        return (F * dose_mg / Vd) * ka * tau_hr * np.exp(-kel * tau_hr)
+    coef = F * dose_mg * ka / (Vd * (ka - kel))
+    return coef * (np.exp(-kel * tau_hr) - np.exp(-ka * tau_hr))
+
+
+def _superposition_timecourse(
+    times: np.ndarray,
+    dose_times: List[float],
+    dose_mg: float,
+    kel: float,
+    Vd: float,
+    F: float,
+    ka: Optional[float],
+) -> np.ndarray:
+    conc = np.zeros_like(times, dtype=float)
+    for td in dose_times:
+        start = int(np.searchsorted(times, td - 1e-9))
+        if start >= len(times):
+            continue
+        tau = np.maximum(times[start:] - td, 0.0)
+        conc[start:] += _single_dose_concentration(tau, dose_mg, kel, Vd, F, ka)
+    return conc
+
+
+def _multiple_dose_batch(
+    times: np.ndarray,
+    intervals_hr: np.ndarray,
+    dose_counts: np.ndarray,
+    doses_mg: np.ndarray,
+    kel: float,
+    Vd: float,
+    F: float,
+    ka: Optional[float],
+) -> np.ndarray:
+    # Row r receives dose_counts[r] doses of doses_mg[r] every intervals_hr[r]. Each exponential
+    # is summed over the doses given so far as a geometric series, so cost is O(rows x samples).
+    tau_grid = intervals_hr[:, None]
+    given = np.clip(np.floor((times[None, :] + 1e-9) / tau_grid) + 1, 0, dose_counts[:, None])
+    since_last = np.maximum(times[None, :] - (given - 1) * tau_grid, 0.0)
+
+    def accumulated(k: float) -> np.ndarray:
+        return np.expm1(-k * given * tau_grid) / np.expm1(-k * tau_grid) * np.exp(-k * since_last)
+
+    scale = F * doses_mg[:, None] / Vd
+    if ka is None:
+        return scale * accumulated(kel)
+    if abs(ka - kel) <= 1e-9 * max(ka, kel):
+        conc = np.zeros((len(doses_mg), len(times)), dtype=float)
+        for r in range(len(doses_mg)):
+            dose_times = [i * float(intervals_hr[r]) for i in range(int(dose_counts[r]))]
+            conc[r] = _superposition_timecourse(times, dose_times, float(doses_mg[r]), kel, Vd, F, ka)
+        return conc
+    return scale * ka / (ka - kel) * (accumulated(kel) - accumulated(ka))
+
+
+def _adaptive_timecourse(
+    times: np.ndarray,
+    dose_times: List[float],
+    dose_mg: float,
+    kel: float,
+    Vd: float,
+    F: float,
+    ka: Optional[float],
+    rtol: float = ADAPTIVE_RTOL,
+) -> Tuple[np.ndarray, int]:
+    # Integrate each inter-dose segment with an error-controlled solver. Doses are
+    # discontinuities, so they are applied between segments instead of inside the RHS.
+    if ka is None:
+        def rhs(_t, y):
+            return [-kel * y[0]]
+        dose_vector = np.array([dose_mg * F])
+    else:
+        def rhs(_t, y):
+            absorbed = ka * y[0]
+            return [-absorbed, F * absorbed - kel * y[1]]
+        dose_vector = np.array([dose_mg, 0.0])
+
+    fastest = max(kel, ka or 0.0)
+    first_step = 0.1 / fastest if fastest > 0 else None
+    atol = 1e-6 * max(dose_mg, 1e-12)
+
+    conc = np.zeros_like(times, dtype=float)
+    state = np.zeros_like(dose_vector)
+    n_evaluations = 0
+    bounds = sorted(td for td in dose_times if td <= times[-1] + 1e-9) if len(times) else []
+    for k, seg_start in enumerate(bounds):
+        state = state + dose_vector
+        seg_end = bounds[k + 1] if k + 1 < len(bounds) else float(times[-1])
+        first = int(np.searchsorted(times, seg_start - 1e-9))
+        last = int(np.searchsorted(times, seg_end - 1e-9)) if k + 1 < len(bounds) else len(times)
+        if seg_end <= seg_start:
+            if last > first:
+                conc[first:last] = state[-1] / Vd
+            continue
+        sol = solve_ivp(
+            rhs,
+            (seg_start, seg_end),
+            state,
+            method="LSODA",
+            dense_output=True,
+            rtol=rtol,
+            atol=atol,
+            first_step=min(first_step, seg_end - seg_start) if first_step else None,
+        )
+        n_evaluations += int(sol.nfev)
+        if last > first:
+            conc[first:last] = np.maximum(sol.sol(times[first:last])[-1], 0.0) / Vd
+        state = sol.y[:, -1]
+    return conc, n_evaluations
+
+
+def _is_two_compartment(drug_params: Dict[str, Any]) -> bool:
+    return drug_params.get("pk_model") == "two_compartment"
+
+
+def _resolve_two_compartment_params(
+    drug_params: Dict[str, Optional[float]],
+    absorption_rate_hr: Optional[float],
+) -> Tuple[float, float, float, float, float, float]:
+    # Vd_L is the central volume (V1); half_life_hr, when given, only back-fills CL.
+    CL, V1, F, _ = _resolve_one_compartment_params(drug_params, absorption_rate_hr)
+    Q = drug_params.get("intercompartmental_clearance_L_per_hr")
+    V2 = drug_params.get("peripheral_volume_L")
+    if Q is None or V2 is None or Q < 0 or V2 <= 0:
+        raise ValueError(
+            "Two-compartment model needs intercompartmental_clearance_L_per_hr (>= 0) "
+            "and peripheral_volume_L (> 0)"
+        )
+    A = _two_compartment_matrix(CL, V1, Q, V2, None)
+    beta = -float(np.max(np.linalg.eigvals(A[1:, 1:]).real))
+    terminal_half = 0.693 / beta if beta > 0 else float("inf")
+    return CL, V1, Q, V2, F, terminal_half
+
+
+def _two_compartment_matrix(
+    CL: float, V1: float, Q: float, V2: float, ka: Optional[float]
+) -> np.ndarray:
+    # Amounts in [depot, central, peripheral]; dA/dt = A @ amounts.
+    k10, k12, k21 = CL / V1, Q / V1, Q / V2
+    ka = ka or 0.0
+    return np.array(
+        [
+            [-ka, 0.0, 0.0],
+            [ka, -(k10 + k12), k21],
+            [0.0, k12, -k21],
+        ]
+    )
+
+
+def _matrix_powers(phi: np.ndarray, count: int) -> np.ndarray:
+    # phi^0 .. phi^(count-1) by repeated doubling: O(log count) batched matmuls.
+    powers = np.empty((max(count, 1),) + phi.shape)
+    powers[0] = np.eye(phi.shape[0])
+    filled, block = 1, phi
+    while filled < count:
+        take = min(filled, count - filled)
+        powers[filled:filled + take] = powers[:take] @ block
+        filled += take
+        block = block @ block
+    return powers[:count]
+
+
+def _two_compartment_timecourse(
+    times: np.ndarray,
+    dose_times: List[float],
+    dose_mg: float,
+    CL: float,
+    V1: float,
+    Q: float,
+    V2: float,
+    F: float,
+    ka: Optional[float],
+) -> np.ndarray:
+    # Exact propagation on a uniform grid: one expm(A*dt) for every step, plus one expm per
+    # distinct sub-step offset to carry off-grid doses forward to the next sample.
+    conc = np.zeros_like(times, dtype=float)
+    if not len(times):
+        return conc
+    A = _two_compartment_matrix(CL, V1, Q, V2, ka)
+    dose_vector = np.array([F * dose_mg, 0.0, 0.0]) if ka is not None else np.array([0.0, F * dose_mg, 0.0])
+
+    offset_propagators: Dict[float, np.ndarray] = {}
+    injections: Dict[int, np.ndarray] = {}
+    for td in dose_times:
+        k = int(np.searchsorted(times, td - 1e-9))
+        if k >= len(times):
+            continue
+        offset = round(float(times[k]) - td, 9)
+        if offset > 0:
+            if offset not in offset_propagators:
+                offset_propagators[offset] = expm(A * offset)
+            vec = offset_propagators[offset] @ dose_vector
+        else:
+            vec = dose_vector
+        injections[k] = injections.get(k, 0.0) + vec
+    if not injections:
+        return conc
+
+    starts = sorted(injections)
+    bounds = starts + [len(times)]
+    dt_hr = float(times[1] - times[0]) if len(times) > 1 else 0.0
+    longest = max(stop - start for start, stop in zip(bounds, bounds[1:]))
+    powers = _matrix_powers(expm(A * dt_hr), longest + 1)
+
+    state = np.zeros(3)
+    for start, stop in zip(bounds, bounds[1:]):
+        state = state + injections[start]
+        span = stop - start
+        conc[start:stop] = powers[:span, 1, :] @ state / V1
+        state = powers[span] @ state
+    return np.maximum(conc, 0.0)
+
+
+def _schedule_doses_by_step(dose_times: List[float], dt_hr: float) -> Dict[int, int]:
+    # Snap each dose to the step whose time is within dt/2, so the loop does O(1) dosing work.
+    doses_by_step: Dict[int, int] = {}
+    for td in dose_times:
+        step = int(round(td / dt_hr))
+        if step < 0 or abs(step * dt_hr - td) >= dt_hr / 2.0:
+            continue
+        doses_by_step[step] = doses_by_step.get(step, 0) + 1
+    return doses_by_step
+
+
+@memoize(
+    SIMULATION_CACHE,
+    f"predict:{SIMULATION_ENGINE_VERSION}",
+    copy_result=lambda result: (list(result[0]), list(result[1])),
+)
+def predict_concentration_timecourse(
+    drug_params: Dict[str, Optional[float]],
+    dosing_mg: float,
+    dosing_interval_hr: float,
+    num_doses: int,
+    absorption_rate_hr: Optional[float] = None,
+    body_weight_kg: Optional[float] = None,
+    t_end_hr: Optional[float] = None,
+    dt_hr: float = 0.1,
+    engine: str = DEFAULT_SIMULATION_ENGINE,
+    rtol: float = ADAPTIVE_RTOL,
+) -> Tuple[List[float], List[float]]:
+    if engine not in SIMULATION_ENGINES:
+        raise ValueError(
+            f"Unknown simulation engine '{engine}' (expected one of {', '.join(SIMULATION_ENGINES)})"
+        )
+
+    if _is_two_compartment(drug_params):
+        # The matrix-exponential propagator is exact at every sample, so it serves all engines.
+        CL, V1, Q, V2, F, terminal_half = _resolve_two_compartment_params(
+            drug_params, absorption_rate_hr
+        )
+        if t_end_hr is None:
+            t_end_hr = (num_doses * dosing_interval_hr) + (5.0 * terminal_half)
+        sample_times = _sample_times(t_end_hr, dt_hr)
+        sample_conc = _two_compartment_timecourse(
+            sample_times,
+            [i * dosing_interval_hr for i in range(num_doses)],
+            dosing_mg,
+            CL,
+            V1,
+            Q,
+            V2,
+            F,
+            absorption_rate_hr,
+        )
+        return sample_times.tolist(), sample_conc.tolist()
+
+    CL, Vd, F, half = _resolve_one_compartment_params(drug_params, absorption_rate_hr)
 
     # simulate through dosing + ~5 half-lives
     if t_end_hr is None:
         t_end_hr = (num_doses * dosing_interval_hr) + (5.0 * half)
 
+    dose_times = [i * dosing_interval_hr for i in range(num_doses)]
+    ka = absorption_rate_hr if absorption_rate_hr is not None else None
+
+    if engine == "analytic":
+        # Closed-form superposition of per-dose exponentials, exact at every sample time.
+        sample_times = _sample_times(t_end_hr, dt_hr)
+        sample_conc = _superposition_timecourse(
+            sample_times, dose_times, dosing_mg, CL / Vd, Vd, F, ka
+        )
+        return sample_times.tolist(), sample_conc.tolist()
+
+    if engine == "adaptive":
+        # Solver picks its own steps from ka/kel and rtol; dt_hr only sets the output grid.
+        sample_times = _sample_times(t_end_hr, dt_hr)
+        sample_conc, _ = _adaptive_timecourse(
+            sample_times, dose_times, dosing_mg, CL / Vd, Vd, F, ka, rtol=rtol
+        )
+        return sample_times.tolist(), sample_conc.tolist()
+
+    # Explicit Euler reference path; error depends on dt_hr.
+    n_steps = int((t_end_hr + 1e-9) // dt_hr) + 1
+    times, conc = next(
+        _euler_chunks(n_steps, dt_hr, dose_times, dosing_mg, CL, Vd, F, ka, chunk_points=n_steps)
+    )
+    return times, conc
+
+
+def _euler_chunks(
+    n_steps: int,
+    dt_hr: float,
+    dose_times: List[float],
+    dosing_mg: float,
+    CL: float,
+    Vd: float,
+    F: float,
+    ka: Optional[float],
+    chunk_points: int,
+) -> Iterator[Tuple[List[float], List[float]]]:
     times: List[float] = []
     conc: List[float] = []
 
-    dose_times = [i * dosing_interval_hr for i in range(num_doses)]
+    doses_by_step = _schedule_doses_by_step(dose_times, dt_hr)
     A_central_mg = 0.0
     A_gut_mg = 0.0
-    ka = absorption_rate_hr if absorption_rate_hr is not None else None
 
-    t = 0.0
-    while t <= t_end_hr + 1e-9:
+    for step in range(n_steps):
         # dosing
-        for td in dose_times:
-            if abs(t - td) < dt_hr / 2.0:
-                if ka is not None:
-                    A_gut_mg += dosing_mg
-                else:
-                    A_central_mg += dosing_mg * F
+        doses_due = doses_by_step.get(step)
+        if doses_due:
+            if ka is not None:
+                A_gut_mg += dosing_mg * doses_due
+            else:
+                A_central_mg += dosing_mg * F * doses_due
 
         # absorption
         if ka is not None:
@@ -1139,11 +1772,175 @@ def predict_concentration_timecourse(
         A_central_mg -= elim
 
         C = (A_central_mg / Vd) if Vd > 0 else 0.0
-        times.append(round(t, 6))
+        times.append(round(step * dt_hr, 6))
         conc.append(C)
-        t += dt_hr
 
-    return times, conc
+        if len(times) == chunk_points:
+            yield times, conc
+            times, conc = [], []
+
+    if times or n_steps == 0:
+        yield times, conc
+
+
+def iter_concentration_timecourse(
+    drug_params: Dict[str, Optional[float]],
+    dosing_mg: float,
+    dosing_interval_hr: float,
+    num_doses: int,
+    absorption_rate_hr: Optional[float] = None,
+    body_weight_kg: Optional[float] = None,
+    t_end_hr: Optional[float] = None,
+    dt_hr: float = 0.1,
+    engine: str = DEFAULT_SIMULATION_ENGINE,
+    rtol: float = ADAPTIVE_RTOL,
+    chunk_points: int = 2000,
+) -> Iterator[Tuple[List[float], List[float]]]:
+    # Generator form of predict_concentration_timecourse yielding consecutive (times, conc)
+    # chunks. Inputs are validated before the first chunk so callers can fail fast.
+    if engine not in SIMULATION_ENGINES:
+        raise ValueError(
+            f"Unknown simulation engine '{engine}' (expected one of {', '.join(SIMULATION_ENGINES)})"
+        )
+    if chunk_points < 1:
+        raise ValueError("chunk_points must be >= 1")
+
+    if _is_two_compartment(drug_params) or engine == "adaptive":
+        # These solve the whole horizon in one pass; the result is still sent in chunks.
+        times, conc = predict_concentration_timecourse(
+            drug_params,
+            dosing_mg,
+            dosing_interval_hr,
+            num_doses,
+            absorption_rate_hr=absorption_rate_hr,
+            body_weight_kg=body_weight_kg,
+            t_end_hr=t_end_hr,
+            dt_hr=dt_hr,
+            engine=engine,
+            rtol=rtol,
+        )
+        return (
+            (times[i:i + chunk_points], conc[i:i + chunk_points])
+            for i in range(0, len(times), chunk_points)
+        )
+
+    CL, Vd, F, half = _resolve_one_compartment_params(drug_params, absorption_rate_hr)
+    if t_end_hr is None:
+        t_end_hr = (num_doses * dosing_interval_hr) + (5.0 * half)
+    dose_times = [i * dosing_interval_hr for i in range(num_doses)]
+    n_steps = int((t_end_hr + 1e-9) // dt_hr) + 1
+
+    if engine == "euler":
+        return _euler_chunks(
+            n_steps, dt_hr, dose_times, dosing_mg, CL, Vd, F, absorption_rate_hr, chunk_points
+        )
+
+    def analytic_chunks() -> Iterator[Tuple[List[float], List[float]]]:
+        for start in range(0, n_steps, chunk_points):
+            chunk_times = np.round(np.arange(start, min(start + chunk_points, n_steps)) * dt_hr, 6)
+            chunk_conc = _superposition_timecourse(
+                chunk_times, dose_times, dosing_mg, CL / Vd, Vd, F, absorption_rate_hr
+            )
+            yield chunk_times.tolist(), chunk_conc.tolist()
+
+    return analytic_chunks()
+
+
+def compute_steady_state_metrics(
+    drug_params: Dict[str, Optional[float]],
+    dosing_mg: float,
+    dosing_interval_hr: float,
+    absorption_rate_hr: Optional[float] = None,
+) -> Dict[str, float]:
+    if dosing_interval_hr <= 0:
+        raise ValueError("dosing_interval_hr must be > 0")
+    if _is_two_compartment(drug_params):
+        return _two_compartment_steady_state(
+            drug_params, dosing_mg, dosing_interval_hr, absorption_rate_hr
+        )
+    CL, Vd, F, half = _resolve_one_compartment_params(drug_params, absorption_rate_hr)
+    kel = CL / Vd
+    tau = dosing_interval_hr
+    accumulation = 1.0 / -np.expm1(-kel * tau)
+
+    if absorption_rate_hr is None:
+        t_max = 0.0
+        css_max = F * dosing_mg / Vd * accumulation
+        css_min = css_max * np.exp(-kel * tau)
+    else:
+        ka = absorption_rate_hr
+        if abs(ka - kel) <= 1e-9 * max(ka, kel):
+            # The Bateman form is singular at ka == kel; its limit is reached by a tiny offset.
+            ka = kel * (1.0 + 1e-6)
+        acc_ka = 1.0 / -np.expm1(-ka * tau)
+        coef = F * dosing_mg * ka / (Vd * (ka - kel))
+
+        def css_at(t: float) -> float:
+            return coef * (np.exp(-kel * t) * accumulation - np.exp(-ka * t) * acc_ka)
+
+        t_max = float(np.log((ka * acc_ka) / (kel * accumulation)) / (ka - kel))
+        t_max = min(max(t_max, 0.0), tau)
+        css_max = css_at(t_max)
+        css_min = css_at(tau)
+
+    auc_tau = F * dosing_mg / CL
+    css_avg = auc_tau / tau
+    return {
+        "css_max_mg_l": float(css_max),
+        "css_min_mg_l": float(css_min),
+        "css_avg_mg_l": float(css_avg),
+        "auc_tau_mg_h_l": float(auc_tau),
+        "t_max_ss_hr": float(t_max),
+        "accumulation_factor": float(accumulation),
+        "fluctuation_pct": float(100.0 * (css_max - css_min) / css_avg) if css_avg > 0 else 0.0,
+        "time_to_steady_state_hr": float(5.0 * half),
+    }
+
+
+def _two_compartment_steady_state(
+    drug_params: Dict[str, Optional[float]],
+    dosing_mg: float,
+    dosing_interval_hr: float,
+    absorption_rate_hr: Optional[float] = None,
+    samples_per_interval: int = 2000,
+) -> Dict[str, float]:
+    CL, V1, Q, V2, F, terminal_half = _resolve_two_compartment_params(
+        drug_params, absorption_rate_hr
+    )
+    tau = dosing_interval_hr
+    A = _two_compartment_matrix(CL, V1, Q, V2, absorption_rate_hr)
+    if absorption_rate_hr is not None:
+        dose_vector = np.array([F * dosing_mg, 0.0, 0.0])
+    else:
+        dose_vector = np.array([0.0, F * dosing_mg, 0.0])
+
+    # Post-dose steady state is the fixed point x = expm(A*tau) @ x + dose. The depot is
+    # left out for IV dosing, where it is empty and would make the system singular.
+    active = slice(0, 3) if absorption_rate_hr is not None else slice(1, 3)
+    post_dose = np.zeros(3)
+    post_dose[active] = np.linalg.solve(
+        np.eye(3)[active, active] - expm(A * tau)[active, active], dose_vector[active]
+    )
+    step = tau / samples_per_interval
+    central_rows = _matrix_powers(expm(A * step), samples_per_interval + 1)[:, 1, :]
+    css = np.maximum(central_rows @ post_dose / V1, 0.0)
+
+    peak = int(np.argmax(css))
+    css_max = float(css[peak])
+    css_min = float(css.min())
+    auc_tau = F * dosing_mg / CL
+    css_avg = auc_tau / tau
+    accumulation = 1.0 / -np.expm1(-0.693 / terminal_half * tau)
+    return {
+        "css_max_mg_l": css_max,
+        "css_min_mg_l": css_min,
+        "css_avg_mg_l": float(css_avg),
+        "auc_tau_mg_h_l": float(auc_tau),
+        "t_max_ss_hr": float(peak * step),
+        "accumulation_factor": float(accumulation),
+        "fluctuation_pct": float(100.0 * (css_max - css_min) / css_avg) if css_avg > 0 else 0.0,
+        "time_to_steady_state_hr": float(5.0 * terminal_half),
+    }
 
 
 def evaluate_therapeutic_window(
@@ -1279,6 +2076,11 @@ def build_drug_params_from_db(
         "clearance_L_per_hr": cl,
         "Vd_L": vd,
         "bioavailability": f,
+        "pk_model": med.pk_model_type or "one_compartment",
+        "intercompartmental_clearance_L_per_hr": _dec_to_float(
+            med.intercompartmental_clearance_l_per_hr
+        ),
+        "peripheral_volume_L": _dec_to_float(med.peripheral_volume_l),
     }
 
 
@@ -1312,59 +2114,33 @@ def maybe_enrich_medication_from_sources(session: Session, med: Medication) -> N
 
 
 # Simulation storage
-def simulate_and_store(
-    session: Session,
-    patient_id: str,
-    medication_id: str,
+def run_simulation_pipeline(
+    drug_params: Dict[str, Optional[float]],
+    active_fraction: float,
     dose_mg: float,
     interval_hr: float,
     num_doses: int,
-    absorption_rate_hr: Optional[float] = None,
-    dt_hr: float = 0.1,
-) -> Simulation:
-    pat = session.exec(select(Patient).where(Patient.id == patient_id)).first()
-    med = session.exec(select(Medication).where(Medication.id == medication_id)).first()
-    if not pat or not med:
-        raise ValueError("Patient or Medication not found")
-
-    ensure_patient_crcl(session, pat)
-    maybe_enrich_medication_from_sources(session, med)
-
-    weight_kg = _dec_to_float(pat.weight_kg) or (
-        float(getattr(pat, "weight")) if getattr(pat, "weight", None) is not None else None
-    )
-    drug_params = build_drug_params_from_db(med, fallback_weight_kg=weight_kg)
-
-    half = drug_params["half_life_hr"]
-    cl = drug_params["clearance_L_per_hr"]
-    vd = drug_params["Vd_L"]
-
-    missing_msgs: List[str] = []
-    if vd is None:
-        missing_msgs.append(
-            "- Vd_L (volume_of_distribution_raw_value + volume_of_distribution_raw_unit)"
-        )
-    if cl is None and half is None:
-        missing_msgs.append(
-            "- clearance or half_life_hr "
-            "(clearance_raw_value + clearance_raw_unit, or half_life_hr)"
-        )
-
-    if missing_msgs:
-        raise ValueError(
-            f"Missing PK parameters for medication '{med.name}'.\n"
-            "Required fields:\n" + "\n".join(missing_msgs)
-        )
-
-    active_fraction = _estimate_active_moiety_fraction(med.name)
+    absorption_rate_hr: Optional[float],
+    weight_kg: Optional[float],
+    dt_hr: float,
+    engine: str,
+    tw_low: float,
+    tw_high: float,
+    tw_targets: TherapeuticTargets,
+) -> Dict[str, Any]:
+    # The CPU-bound part of simulate_and_store. Takes and returns plain picklable values so
+    # it can run in the simulation process pool; no DB access here.
     modeled_dose_mg = dose_mg * active_fraction
-    tw_low, tw_high, tw_targets, tw_source = resolve_therapeutic_window_for_medication(session, med)
     suggested_input_dose_mg = _estimate_input_dose_for_target_window(
         drug_params=drug_params,
         interval_hr=interval_hr,
         active_fraction=active_fraction,
         target_low_mg_l=tw_low,
         target_high_mg_l=tw_high,
+        num_doses=num_doses,
+        absorption_rate_hr=absorption_rate_hr,
+        dt_hr=dt_hr,
+        engine=engine,
     )
     recommended_regimens = _recommend_regimens_for_window(
         drug_params=drug_params,
@@ -1379,6 +2155,7 @@ def simulate_and_store(
         tw_high=tw_high,
         tw_targets=tw_targets,
         goal_pct_within=96.0,
+        engine=engine,
     )
 
     times, conc = predict_concentration_timecourse(
@@ -1389,8 +2166,16 @@ def simulate_and_store(
         absorption_rate_hr=absorption_rate_hr,
         body_weight_kg=weight_kg,
         dt_hr=dt_hr,
+        engine=engine,
     )
 
+    try:
+        steady_state = compute_steady_state_metrics(
+            drug_params, modeled_dose_mg, interval_hr, absorption_rate_hr
+        )
+    except (ValueError, ZeroDivisionError):
+        steady_state = None
+
     therapy_end = interval_hr * num_doses
     eval_res = evaluate_therapeutic_window(
         times,
@@ -1409,6 +2194,95 @@ def simulate_and_store(
         dt = times[i + 1] - times[i]
         auc += 0.5 * (conc[i] + conc[i + 1]) * dt
 
+    return {
+        "times": times,
+        "conc": conc,
+        "suggested_input_dose_mg": suggested_input_dose_mg,
+        "recommended_regimens": recommended_regimens,
+        "steady_state": steady_state,
+        "eval_res": eval_res,
+        "cmax": cmax,
+        "cmin": cmin,
+        "auc": auc,
+    }
+
+
+def simulate_and_store(
+    session: Session,
+    patient_id: str,
+    medication_id: str,
+    dose_mg: float,
+    interval_hr: float,
+    num_doses: int,
+    absorption_rate_hr: Optional[float] = None,
+    dt_hr: float = 0.1,
+    engine: str = DEFAULT_SIMULATION_ENGINE,
+    on_stage: Callable[[str], None] = lambda stage: None,
+    wait_for_slot: bool = False,
+) -> Tuple[Simulation, List[float], List[float]]:
+    # The curve computed in the pool comes back with the row, so callers never replay it
+    # in-process (with lazy storage the row itself holds no curve).
+    pat = session.exec(select(Patient).where(Patient.id == patient_id)).first()
+    med = session.exec(select(Medication).where(Medication.id == medication_id)).first()
+    if not pat or not med:
+        raise ValueError("Patient or Medication not found")
+
+    on_stage("enrich")
+    ensure_patient_crcl(session, pat)
+    maybe_enrich_medication_from_sources(session, med)
+
+    weight_kg = _dec_to_float(pat.weight_kg) or (
+        float(getattr(pat, "weight")) if getattr(pat, "weight", None) is not None else None
+    )
+    drug_params = build_drug_params_from_db(med, fallback_weight_kg=weight_kg)
+
+    half = drug_params["half_life_hr"]
+    cl = drug_params["clearance_L_per_hr"]
+    vd = drug_params["Vd_L"]
+
+    missing_msgs: List[str] = []
+    if vd is None:
+        missing_msgs.append(
+            "- Vd_L (volume_of_distribution_raw_value + volume_of_distribution_raw_unit)"
+        )
+    if cl is None and half is None:
+        missing_msgs.append(
+            "- clearance or half_life_hr "
+            "(clearance_raw_value + clearance_raw_unit, or half_life_hr)"
+        )
+
+    if missing_msgs:
+        raise ValueError(
+            f"Missing PK parameters for medication '{med.name}'.\n"
+            "Required fields:\n" + "\n".join(missing_msgs)
+        )
+
+    active_fraction = _estimate_active_moiety_fraction(med.name)
+    modeled_dose_mg = dose_mg * active_fraction
+    tw_low, tw_high, tw_targets, tw_source = resolve_therapeutic_window_for_medication(session, med)
+    on_stage("simulate")
+    # Only the CPU-bound pipeline holds an admission slot; enrichment (network) and the DB
+    # work around it do not count against simulation capacity.
+    with SIMULATION_ADMISSION.admit(wait=wait_for_slot):
+        result = run_cpu_bound(
+            run_simulation_pipeline,
+            drug_params=drug_params,
+            active_fraction=active_fraction,
+            dose_mg=dose_mg,
+            interval_hr=interval_hr,
+            num_doses=num_doses,
+            absorption_rate_hr=absorption_rate_hr,
+            weight_kg=weight_kg,
+            dt_hr=dt_hr,
+            engine=engine,
+            tw_low=tw_low,
+            tw_high=tw_high,
+            tw_targets=tw_targets,
+        )
+    times, conc = result["times"], result["conc"]
+    eval_res = result["eval_res"]
+    cmax, cmin, auc = result["cmax"], result["cmin"], result["auc"]
+
     sim = Simulation(
         patient_id=pat.id,
         medication_id=med.id,
@@ -1421,24 +2295,98 @@ def simulate_and_store(
         flag_too_high=eval_res["pct_above"] > 5.0,
         flag_too_low=eval_res["pct_below"] > 20.0,
         sim_results={
-            "times_hr": times,
-            "conc_mg_per_L": conc,
+            "engine_version": SIMULATION_ENGINE_VERSION,
+            "regimen": {
+                "dose_modeled_mg": modeled_dose_mg,
+                "interval_hr": interval_hr,
+                "num_doses": num_doses,
+                "absorption_rate_hr": absorption_rate_hr,
+                "body_weight_kg": weight_kg,
+                "dt_hr": dt_hr,
+            },
             "therapeutic_eval": eval_res,
             "params_used": {
                 **drug_params,
                 "dose_input_mg": dose_mg,
                 "dose_modeled_mg": modeled_dose_mg,
                 "active_moiety_fraction": active_fraction,
+                "engine": engine,
                 "therapeutic_window_source": tw_source,
                 "therapeutic_window_lower_mg_l": tw_low,
                 "therapeutic_window_upper_mg_l": tw_high,
-                "suggested_input_dose_mg_for_mid_window": suggested_input_dose_mg,
-                "recommended_regimens": recommended_regimens,
+                "suggested_input_dose_mg_for_mid_window": result["suggested_input_dose_mg"],
+                "recommended_regimens": result["recommended_regimens"],
+                "steady_state": result["steady_state"],
             },
         },
     )
+    on_stage("store")
+    if SIM_CURVE_STORAGE == "lazy":
+        sim.sim_results = {**sim.sim_results, "curve_encoding": "lazy"}
+    else:
+        store_curve(sim, times, conc)
 
     session.add(sim)
     session.commit()
     session.refresh(sim)
-    return sim
+    return sim, times, conc
+
+
+def _regenerate_curve(sim_results: Dict[str, Any]) -> Tuple[List[float], List[float]]:
+    # Replays the exact predict call made by simulate_and_store. With a process pool that call
+    # ran in a worker, so only the shared disk tier (SIM_CACHE_DIR) can serve it here.
+    params_used = sim_results.get("params_used") or {}
+    regimen = sim_results["regimen"]
+    return predict_concentration_timecourse(
+        drug_params={k: params_used.get(k) for k in _DRUG_PARAM_KEYS},
+        dosing_mg=regimen["dose_modeled_mg"],
+        dosing_interval_hr=regimen["interval_hr"],
+        num_doses=regimen["num_doses"],
+        absorption_rate_hr=regimen["absorption_rate_hr"],
+        body_weight_kg=regimen["body_weight_kg"],
+        dt_hr=regimen["dt_hr"],
+        engine=params_used.get("engine", DEFAULT_SIMULATION_ENGINE),
+    )
+
+
+def simulation_curve_rederived(sim: Simulation) -> bool:
+    # A lazy simulation created by another engine version can only be replayed with the current
+    # engine; the replay is served but flagged, never persisted as the original result.
+    sim_results: Dict[str, Any] = sim.sim_results or {}
+    if sim_results.get("curve_rederived"):
+        return True
+    return (
+        sim.sim_curve is None
+        and bool(sim_results.get("regimen"))
+        and sim_results.get("engine_version") != SIMULATION_ENGINE_VERSION
+    )
+
+
+def load_simulation_curve(sim: Simulation) -> Tuple[List[float], List[float]]:
+    times, conc = load_curve(sim)
+    sim_results: Dict[str, Any] = sim.sim_results or {}
+    if times or not sim_results.get("regimen"):
+        return times, conc
+    return _regenerate_curve(sim_results)
+
+
+def materialize_lazy_curves(session: Session, stale_only: bool = False) -> int:
+    # stale_only limits this to rows from other engine versions; their curves come from the
+    # current engine, so they stay flagged as re-derived once stored.
+    count = 0
+    for sim in session.exec(select(Simulation).where(Simulation.sim_curve.is_(None))).all():
+        sim_results: Dict[str, Any] = sim.sim_results or {}
+        if sim_results.get("curve_encoding") != "lazy" or not sim_results.get("regimen"):
+            continue
+        stale = sim_results.get("engine_version") != SIMULATION_ENGINE_VERSION
+        if stale_only and not stale:
+            continue
+        times, conc = _regenerate_curve(sim_results)
+        if stale:
+            sim.sim_results = {**sim_results, "curve_rederived": True}
+        store_curve(sim, times, conc)
+        session.add(sim)
+        count += 1
+    session.commit()
+    return count
+
@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy.optimize import minimize
+from sqlmodel import Session, select
+
+from .models import Medication, Patient
+from .pharmacokinetics import (
+    _dec_to_float,
+    _estimate_active_moiety_fraction,
+    _is_two_compartment,
+    _recommend_regimens_for_window,
+    _resolve_one_compartment_params,
+    build_drug_params_from_db,
+    ensure_patient_crcl,
+    maybe_enrich_medication_from_sources,
+    resolve_therapeutic_window_for_medication,
+)
+from .sim_executor import run_cpu_bound
+
+
+DEFAULT_PRIOR_CV = {"clearance": 0.30, "volume": 0.25}
+# Combined residual error: sd = sqrt(additive^2 + (proportional * observed)^2).
+DEFAULT_RESIDUAL_ERROR = {"additive_mg_l": 0.1, "proportional": 0.15}
+FIT_CACHE_SIZE = 256
+
+_fit_cache: "OrderedDict[Tuple[str, str, str], Dict[str, Any]]" = OrderedDict()
+_fit_cache_lock = threading.Lock()
+
+
+def _predict_with_gradient(
+    log_params: np.ndarray,
+    dose_times: np.ndarray,
+    doses_mg: np.ndarray,
+    obs_times: np.ndarray,
+    F: float,
+    ka: Optional[float],
+) -> Tuple[np.ndarray, np.ndarray]:
+    # Closed-form one-compartment superposition at the observation times and its
+    # derivatives with respect to (ln CL, ln V). Since k = CL/V, dk/dlnCL = k and dk/dlnV = -k.
+    CL, V = np.exp(log_params)
+    k = CL / V
+    tau = obs_times[:, None] - dose_times[None, :]
+    given = tau >= 0
+    tau = np.where(given, tau, 0.0)
+    amount = np.where(given, F * doses_mg[None, :] / V, 0.0)
+
+    if ka is None:
+        shape = np.exp(-k * tau)
+        dshape_dk = -tau * shape
+    else:
+        if abs(ka - k) <= 1e-9 * max(ka, k):
+            ka = k * (1.0 + 1e-6)
+        e_k, e_ka = np.exp(-k * tau), np.exp(-ka * tau)
+        shape = ka / (ka - k) * (e_k - e_ka)
+        dshape_dk = ka / (ka - k) ** 2 * (e_k - e_ka) - ka / (ka - k) * tau * e_k
+
+    pred = np.sum(amount * shape, axis=1)
+    dpred_dk = np.sum(amount * dshape_dk, axis=1)
+    jac = np.column_stack([k * dpred_dk, -pred - k * dpred_dk])
+    return pred, jac
+
+
+def fit_map_parameters(
+    drug_params: Dict[str, Optional[float]],
+    doses: List[Tuple[float, float]],
+    observations: List[Tuple[float, float]],
+    absorption_rate_hr: Optional[float] = None,
+    prior_cv: Optional[Dict[str, float]] = None,
+    residual_error: Optional[Dict[str, float]] = None,
+) -> Dict[str, Any]:
+    # doses: (time_hr, modeled dose mg); observations: (time_hr, conc mg/L).
+    # Minimizes the negative log posterior in log-parameter space:
+    #   sum(((y - f) / sd)^2) + sum(((theta - theta_pop) / omega)^2)
+    if _is_two_compartment(drug_params):
+        raise ValueError("MAP individualization supports one-compartment medications only")
+    if not doses:
+        raise ValueError("At least one dose is required")
+    CL_pop, V_pop, F, _ = _resolve_one_compartment_params(drug_params, absorption_rate_hr)
+    cv = {**DEFAULT_PRIOR_CV, **(prior_cv or {})}
+    err = {**DEFAULT_RESIDUAL_ERROR, **(residual_error or {})}
+
+    dose_times = np.array([d[0] for d in doses], dtype=float)
+    doses_mg = np.array([d[1] for d in doses], dtype=float)
+    obs_times = np.array([o[0] for o in observations], dtype=float)
+    observed = np.array([o[1] for o in observations], dtype=float)
+
+    prior_mean = np.log([CL_pop, V_pop])
+    omega = np.sqrt(np.log1p(np.array([cv["clearance"], cv["volume"]]) ** 2))
+    if np.any(omega <= 0):
+        raise ValueError("Prior CVs must be > 0")
+    weights = 1.0 / (err["additive_mg_l"] ** 2 + (err["proportional"] * observed) ** 2)
+
+    def objective(theta: np.ndarray) -> Tuple[float, np.ndarray]:
+        pred, jac = _predict_with_gradient(theta, dose_times, doses_mg, obs_times, F, absorption_rate_hr)
+        resid = observed - pred
+        prior_resid = (theta - prior_mean) / omega
+        value = float(np.sum(weights * resid ** 2) + np.sum(prior_resid ** 2))
+        grad = -2.0 * jac.T @ (weights * resid) + 2.0 * prior_resid / omega
+        return value, grad
+
+    result = minimize(objective, prior_mean, jac=True, method="BFGS")
+    theta = result.x
+    CL, V = (float(v) for v in np.exp(theta))
+
+    # Gauss-Newton approximation of the posterior covariance of (ln CL, ln V).
+    pred, jac = _predict_with_gradient(theta, dose_times, doses_mg, obs_times, F, absorption_rate_hr)
+    information = jac.T @ (weights[:, None] * jac) + np.diag(1.0 / omega ** 2)
+    log_sd = np.sqrt(np.diag(np.linalg.inv(information)))
+
+    return {
+        "clearance_L_per_hr": CL,
+        "Vd_L": V,
+        "half_life_hr": 0.693 * V / CL,
+        "bioavailability": F,
+        "population_clearance_L_per_hr": float(CL_pop),
+        "population_Vd_L": float(V_pop),
+        "posterior_cv_clearance": float(np.sqrt(np.expm1(log_sd[0] ** 2))),
+        "posterior_cv_volume": float(np.sqrt(np.expm1(log_sd[1] ** 2))),
+        "objective": float(result.fun),
+        "iterations": int(result.nit),
+        "converged": bool(result.success),
+        "predicted_at_observations_mg_l": pred.tolist(),
+    }
+
+
+def observation_set_key(
+    drug_params: Dict[str, Any],
+    doses: List[Tuple[float, float]],
+    observations: List[Tuple[float, float]],
+    absorption_rate_hr: Optional[float],
+    prior_cv: Optional[Dict[str, float]] = None,
+) -> str:
+    # Everything the fit depends on, so an edited level, dose or prior yields a new key.
+    payload = {
+        "drug_params": drug_params,
+        "doses": sorted([float(t), float(d)] for t, d in doses),
+        "observations": sorted([float(t), float(c)] for t, c in observations),
+        "absorption_rate_hr": absorption_rate_hr,
+        "prior_cv": prior_cv or {},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def cached_map_fit(
+    patient_id: str,
+    medication_id: str,
+    drug_params: Dict[str, Optional[float]],
+    doses: List[Tuple[float, float]],
+    observations: List[Tuple[float, float]],
+    absorption_rate_hr: Optional[float] = None,
+    prior_cv: Optional[Dict[str, float]] = None,
+) -> Tuple[Dict[str, Any], bool]:
+    key = (
+        str(patient_id),
+        str(medication_id),
+        observation_set_key(drug_params, doses, observations, absorption_rate_hr, prior_cv),
+    )
+    with _fit_cache_lock:
+        hit = _fit_cache.get(key)
+        if hit is not None:
+            _fit_cache.move_to_end(key)
+            return hit, True
+
+    # The cache stays in this process; only the BFGS fit itself goes to the simulation pool.
+    fit = run_cpu_bound(fit_map_parameters, drug_params, doses, observations, absorption_rate_hr, prior_cv)
+    with _fit_cache_lock:
+        _fit_cache[key] = fit
+        _fit_cache.move_to_end(key)
+        while len(_fit_cache) > FIT_CACHE_SIZE:
+            _fit_cache.popitem(last=False)
+    return fit, False
+
+
+def individualize_from_levels(
+    session: Session,
+    patient_id: str,
+    medication_id: str,
+    doses: List[Tuple[float, float]],
+    observations: List[Tuple[float, float]],
+    dose_mg: float,
+    interval_hr: float,
+    num_doses: int,
+    absorption_rate_hr: Optional[float] = None,
+    dt_hr: float = 0.1,
+    prior_cv: Optional[Dict[str, float]] = None,
+) -> Dict[str, Any]:
+    pat = session.exec(select(Patient).where(Patient.id == patient_id)).first()
+    med = session.exec(select(Medication).where(Medication.id == medication_id)).first()
+    if not pat or not med:
+        raise ValueError("Patient or Medication not found")
+
+    ensure_patient_crcl(session, pat)
+    maybe_enrich_medication_from_sources(session, med)
+    weight_kg = _dec_to_float(pat.weight_kg)
+    population_params = build_drug_params_from_db(med, fallback_weight_kg=weight_kg)
+
+    # Doses are recorded as input amounts; the model works in active-moiety amounts.
+    active_fraction = _estimate_active_moiety_fraction(med.name)
+    modeled_doses = [(t, amount * active_fraction) for t, amount in doses]
+    fit, cached = cached_map_fit(
+        str(pat.id),
+        str(med.id),
+        population_params,
+        modeled_doses,
+        observations,
+        absorption_rate_hr,
+        prior_cv,
+    )
+
+    individual_params = {
+        **population_params,
+        "half_life_hr": fit["half_life_hr"],
+        "clearance_L_per_hr": fit["clearance_L_per_hr"],
+        "Vd_L": fit["Vd_L"],
+    }
+    tw_low, tw_high, tw_targets, tw_source = resolve_therapeutic_window_for_medication(session, med)
+    recommended_regimens = run_cpu_bound(
+        _recommend_regimens_for_window,
+        drug_params=individual_params,
+        active_fraction=active_fraction,
+        current_input_dose_mg=dose_mg,
+        current_interval_hr=interval_hr,
+        num_doses=num_doses,
+        absorption_rate_hr=absorption_rate_hr,
+        body_weight_kg=weight_kg,
+        dt_hr=dt_hr,
+        tw_low=tw_low,
+        tw_high=tw_high,
+        tw_targets=tw_targets,
+        goal_pct_within=96.0,
+    )
+    return {
+        "patient_id": str(pat.id),
+        "medication_id": str(med.id),
+        "fit": fit,
+        "cached": cached,
+        "population_params": population_params,
+        "individual_params": individual_params,
+        "therapeutic_window": {
+            "lower_mg_l": tw_low,
+            "upper_mg_l": tw_high,
+            "source": tw_source,
+        },
+        "recommended_regimens": recommended_regimens,
+    }
@@ -0,0 +1,281 @@
+from __future__ import annotations
+
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlmodel import Session, select
+
+from .models import Medication, Patient, PatientMedicationLink, Simulation
+from .pharmacokinetics import (
+    DEFAULT_SIMULATION_ENGINE,
+    SIMULATION_ENGINE_VERSION,
+    _BATCH_MAX_CELLS,
+    _dec_to_float,
+    _float_to_dec,
+    _is_two_compartment,
+    _resolve_one_compartment_params,
+    _sample_times,
+    build_drug_params_from_db,
+    predict_concentration_timecourse,
+)
+from .pk_population import batch_concentrations
+from .pk_scoring import (
+    TherapeuticTargets,
+    classify_window_exposure,
+    evaluate_therapeutic_window_batch,
+    summarize_distribution,
+)
+
+
+RISK_LEVELS = ("NONE", "LOW", "MODERATE", "HIGH", "UNKNOWN")
+
+
+def load_cohort(
+    session: Session,
+    med: Medication,
+    include_inactive: bool = False,
+) -> List[Dict[str, Any]]:
+    # One joined query for every linked patient; per-patient drug params only differ by weight.
+    statement = (
+        select(Patient)
+        .join(PatientMedicationLink, PatientMedicationLink.patient_id == Patient.id)
+        .where(PatientMedicationLink.medication_id == med.id)
+    )
+    if not include_inactive:
+        statement = statement.where(PatientMedicationLink.is_active == True)  # noqa: E712
+
+    members: List[Dict[str, Any]] = []
+    seen = set()
+    for pat in session.exec(statement).all():
+        if pat.id in seen:
+            continue
+        seen.add(pat.id)
+        weight_kg = _dec_to_float(pat.weight_kg)
+        members.append(
+            {
+                "patient_id": str(pat.id),
+                "weight_kg": weight_kg,
+                "drug_params": build_drug_params_from_db(med, fallback_weight_kg=weight_kg),
+            }
+        )
+    return members
+
+
+def _cohort_curves(
+    members: List[Dict[str, Any]],
+    sampled: Optional[Dict[str, np.ndarray]],
+    halves: np.ndarray,
+    modeled_dose_mg: float,
+    interval_hr: float,
+    num_doses: int,
+    absorption_rate_hr: Optional[float],
+    dt_hr: float,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # (patient x time) on one grid long enough for everyone, plus each patient's own sample
+    # count. Each patient's horizon is the one simulate_and_store (and the lazy replay) uses:
+    # dosing plus the elimination tail. One-compartment cohorts are one closed-form batch;
+    # anything else (two-compartment medications) goes through the regular engine per patient.
+    if sampled is not None:
+        horizons = interval_hr * num_doses + 5.0 * halves
+        lengths = ((horizons + 1e-9) // dt_hr).astype(int) + 1
+        times = _sample_times(float(horizons.max()), dt_hr)
+        conc = np.empty((len(members), len(times)))
+        cols = max(1, _BATCH_MAX_CELLS // len(times))
+        for start in range(0, len(members), cols):
+            block = {k: v[start:start + cols] for k, v in sampled.items()}
+            conc[start:start + cols] = batch_concentrations(times, block, modeled_dose_mg, interval_hr, num_doses).T
+        return times, conc, lengths
+    curves = [
+        predict_concentration_timecourse(
+            drug_params=m["drug_params"],
+            dosing_mg=modeled_dose_mg,
+            dosing_interval_hr=interval_hr,
+            num_doses=num_doses,
+            absorption_rate_hr=absorption_rate_hr,
+            body_weight_kg=m["weight_kg"],
+            dt_hr=dt_hr,
+        )
+        for m in members
+    ]
+    lengths = np.asarray([len(t) for t, _ in curves])
+    times = np.asarray(max(curves, key=lambda curve: len(curve[0]))[0])
+    conc = np.zeros((len(members), len(times)))
+    for i, (_, c) in enumerate(curves):
+        conc[i, :len(c)] = c
+    return times, conc, lengths
+
+
+def _horizon_metrics(
+    times: np.ndarray,
+    conc: np.ndarray,
+    lengths: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    # Cmax, Cmin, AUC and duration over each patient's own horizon, as simulate_and_store
+    # computes them for a single curve.
+    inside = np.arange(len(times))[None, :] < lengths[:, None]
+    cmax = np.where(inside, conc, -np.inf).max(axis=1)
+    cmin = np.where(inside, conc, np.inf).min(axis=1)
+    segments = 0.5 * (conc[:, 1:] + conc[:, :-1]) * np.diff(times)[None, :]
+    auc = np.where(inside[:, 1:], segments, 0.0).sum(axis=1)
+    return cmax, cmin, auc, times[lengths - 1]
+
+
+def simulate_cohort(
+    members: List[Dict[str, Any]],
+    regimens: List[Tuple[float, float, int]],
+    active_fraction: float,
+    absorption_rate_hr: Optional[float],
+    dt_hr: float,
+    tw_low: float,
+    tw_high: float,
+    tw_targets: TherapeuticTargets,
+) -> Dict[str, Any]:
+    # Pure compute over plain values, so it can run in the simulation process pool.
+    usable: List[Dict[str, Any]] = []
+    skipped: List[Dict[str, str]] = []
+    resolved = []
+    for m in members:
+        try:
+            resolved.append(_resolve_one_compartment_params(m["drug_params"], absorption_rate_hr))
+            usable.append(m)
+        except ValueError as ve:
+            skipped.append({"patient_id": m["patient_id"], "reason": str(ve)})
+
+    sampled: Optional[Dict[str, np.ndarray]] = None
+    halves = np.asarray([half for *_, half in resolved], dtype=float)
+    if usable and not any(_is_two_compartment(m["drug_params"]) for m in usable):
+        CL, Vd, F, _ = (np.asarray(col, dtype=float) for col in zip(*resolved))
+        sampled = {"clearance_L_per_hr": CL, "Vd_L": Vd, "bioavailability": F}
+        if absorption_rate_hr is not None:
+            sampled["absorption_rate_hr"] = np.full(len(usable), absorption_rate_hr)
+
+    results: List[Dict[str, Any]] = []
+    for dose_mg, interval_hr, num_doses in regimens:
+        therapy_end = interval_hr * num_doses
+        summary: Dict[str, Any] = {
+            "dose_mg": dose_mg,
+            "interval_hr": interval_hr,
+            "num_doses": num_doses,
+            "patients": [],
+        }
+        if not usable:
+            summary.update(
+                pct_within_distribution=summarize_distribution(np.zeros(0)),
+                risk_counts={level: 0 for level in RISK_LEVELS},
+                fraction_meeting_target=None,
+            )
+            results.append(summary)
+            continue
+
+        times, conc, lengths = _cohort_curves(
+            usable, sampled, halves, dose_mg * active_fraction, interval_hr, num_doses, absorption_rate_hr, dt_hr
+        )
+        scored = evaluate_therapeutic_window_batch(
+            times, conc, tw_low, tw_high, t_start_hr=0.0, t_end_hr=therapy_end, targets=tw_targets
+        )
+        last_interval = (times >= therapy_end - interval_hr - 1e-9) & (times <= therapy_end + 1e-9)
+        trough = conc[:, last_interval].min(axis=1)
+        cmax, cmin, auc, duration = _horizon_metrics(times, conc, lengths)
+
+        risk_counts = {level: 0 for level in RISK_LEVELS}
+        for i, m in enumerate(usable):
+            below, within, above = (float(scored[k][i]) for k in ("pct_below", "pct_within", "pct_above"))
+            risk = (
+                classify_window_exposure(below, within, above, tw_targets)["ade_risk_level"]
+                if scored["evaluable"][i]
+                else "UNKNOWN"
+            )
+            risk_counts[risk] += 1
+            summary["patients"].append(
+                {
+                    "patient_id": m["patient_id"],
+                    "weight_kg": m["weight_kg"],
+                    "pct_within": within,
+                    "pct_below": below,
+                    "pct_above": above,
+                    "risk": risk,
+                    "cmax_mg_l": float(cmax[i]),
+                    "cmin_mg_l": float(cmin[i]),
+                    "trough_mg_l": float(trough[i]),
+                    "auc_mg_h_l": float(auc[i]),
+                    "duration_hr": float(duration[i]),
+                }
+            )
+        summary.update(
+            pct_within_distribution=summarize_distribution(scored["pct_within"][scored["evaluable"]]),
+            risk_counts=risk_counts,
+            fraction_meeting_target=float(np.mean(scored["pct_within"] >= tw_targets.min_pct_within)),
+        )
+        results.append(summary)
+
+    return {"n_patients": len(usable), "skipped": skipped, "regimens": results}
+
+
+def persist_cohort_results(
+    session: Session,
+    med: Medication,
+    members: List[Dict[str, Any]],
+    cohort: Dict[str, Any],
+    active_fraction: float,
+    absorption_rate_hr: Optional[float],
+    dt_hr: float,
+    tw_low: float,
+    tw_high: float,
+    tw_targets: TherapeuticTargets,
+    tw_source: str,
+) -> List[str]:
+    # One row per patient and regimen in a single commit. Curves are not stored; the regimen
+    # inputs are, so load_simulation_curve regenerates them on demand like SIM_CURVE_STORAGE=lazy.
+    by_id = {m["patient_id"]: m for m in members}
+    rows: List[Simulation] = []
+    for regimen in cohort["regimens"]:
+        for patient in regimen["patients"]:
+            member = by_id[patient["patient_id"]]
+            modeled_dose_mg = regimen["dose_mg"] * active_fraction
+            rows.append(
+                Simulation(
+                    patient_id=uuid.UUID(patient["patient_id"]),
+                    medication_id=med.id,
+                    dose_mg=_float_to_dec(regimen["dose_mg"]),
+                    interval_hr=_float_to_dec(regimen["interval_hr"]),
+                    duration_hr=_float_to_dec(patient["duration_hr"]),
+                    cmax_mg_l=_float_to_dec(patient["cmax_mg_l"]),
+                    cmin_mg_l=_float_to_dec(patient["cmin_mg_l"]),
+                    auc_mg_h_l=_float_to_dec(patient["auc_mg_h_l"]),
+                    flag_too_high=patient["pct_above"] > tw_targets.max_pct_above,
+                    flag_too_low=patient["pct_below"] > tw_targets.max_pct_below,
+                    sim_results={
+                        "source": "cohort",
+                        "curve_encoding": "lazy",
+                        "engine_version": SIMULATION_ENGINE_VERSION,
+                        "regimen": {
+                            "dose_modeled_mg": modeled_dose_mg,
+                            "interval_hr": regimen["interval_hr"],
+                            "num_doses": regimen["num_doses"],
+                            "absorption_rate_hr": absorption_rate_hr,
+                            "body_weight_kg": member["weight_kg"],
+                            "dt_hr": dt_hr,
+                        },
+                        "therapeutic_eval": {
+                            k: patient[k] for k in ("pct_within", "pct_below", "pct_above")
+                        },
+                        "params_used": {
+                            **member["drug_params"],
+                            "dose_input_mg": regimen["dose_mg"],
+                            "dose_modeled_mg": modeled_dose_mg,
+                            "active_moiety_fraction": active_fraction,
+                            "engine": DEFAULT_SIMULATION_ENGINE,
+                            "therapeutic_window_source": tw_source,
+                            "therapeutic_window_lower_mg_l": tw_low,
+                            "therapeutic_window_upper_mg_l": tw_high,
+                        },
+                    },
+                )
+            )
+    # Ids come from the model's default factory; reading them after commit would expire and
+    # re-select every row.
+    ids = [str(row.id) for row in rows]
+    session.add_all(rows)
+    session.commit()
+    return ids
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+
+DEFAULT_MAX_CURVE_POINTS = 500
+
+
+def dose_extrema_indices(times: np.ndarray, conc: np.ndarray, dose_times: Sequence[float]) -> np.ndarray:
+    # Peak and trough of every dosing interval (the last interval runs to the end of the curve).
+    if not len(times):
+        return np.zeros(0, dtype=int)
+    starts = np.searchsorted(times, np.asarray(sorted(dose_times), dtype=float) - 1e-9)
+    starts = np.unique(starts[starts < len(times)])
+    if not len(starts):
+        return np.zeros(0, dtype=int)
+    stops = np.append(starts[1:], len(times))
+    # A trough is the last sample before the next dose, not just the next dose's first sample.
+    stops_inclusive = np.minimum(stops + 1, len(times))
+    keep = []
+    for start, stop in zip(starts, stops_inclusive):
+        segment = conc[start:stop]
+        keep.append(start + int(np.argmax(segment)))
+        keep.append(start + int(np.argmin(segment)))
+    return np.asarray(keep, dtype=int)
+
+
+def downsample_indices(
+    times: Sequence[float],
+    series: Sequence[Sequence[float]],
+    max_points: int = DEFAULT_MAX_CURVE_POINTS,
+    dose_times: Optional[Sequence[float]] = None,
+) -> np.ndarray:
+    # Min/max-per-bucket over each series, plus the endpoints and every dose's peak and
+    # trough, which are kept even when they alone exceed max_points.
+    t = np.asarray(times, dtype=float)
+    n = len(t)
+    if n <= max(max_points, 2):
+        return np.arange(n)
+    curves = [np.asarray(s, dtype=float) for s in series]
+
+    required = [np.array([0, n - 1])]
+    for curve in curves:
+        required.append(dose_extrema_indices(t, curve, dose_times or []))
+    keep = np.unique(np.concatenate(required))
+
+    n_buckets = (max_points - len(keep)) // (2 * max(len(curves), 1))
+    if n_buckets > 0:
+        bucket = np.minimum((np.arange(n) * n_buckets) // n, n_buckets - 1)
+        first = np.searchsorted(bucket, np.arange(n_buckets))
+        picks = [keep]
+        for curve in curves:
+            # Stable sort by (bucket, value): each bucket's first row is its min, last is its max.
+            order = np.lexsort((curve, bucket))
+            last = np.append(first[1:], n) - 1
+            picks.append(order[first])
+            picks.append(order[last])
+        keep = np.unique(np.concatenate(picks))
+    return keep
+
+
+def downsample_curve(
+    times: Sequence[float],
+    conc: Sequence[float],
+    max_points: int = DEFAULT_MAX_CURVE_POINTS,
+    dose_times: Optional[Sequence[float]] = None,
+) -> tuple[List[float], List[float]]:
+    idx = downsample_indices(times, [conc], max_points, dose_times)
+    return np.asarray(times, dtype=float)[idx].tolist(), np.asarray(conc, dtype=float)[idx].tolist()
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .pharmacokinetics import _BATCH_MAX_CELLS, _resolve_one_compartment_params, _sample_times
+
+
+DEFAULT_VARIABILITY_CV = {
+    "clearance": 0.30,
+    "volume": 0.25,
+    "absorption": 0.40,
+    "bioavailability": 0.10,
+}
+PERCENTILES = (5.0, 50.0, 95.0)
+
+
+def sample_population_parameters(
+    drug_params: Dict[str, Optional[float]],
+    n_subjects: int,
+    absorption_rate_hr: Optional[float] = None,
+    variability_cv: Optional[Dict[str, float]] = None,
+    seed: Optional[int] = 0,
+) -> Dict[str, np.ndarray]:
+    # Log-normal between-subject variability: theta_i = theta * exp(eta_i),
+    # eta_i ~ N(0, omega^2) with omega^2 = ln(1 + CV^2), so CV is the spread on the natural scale.
+    if n_subjects < 1:
+        raise ValueError("n_subjects must be >= 1")
+    CL, Vd, F, _ = _resolve_one_compartment_params(drug_params, absorption_rate_hr)
+    cv = {**DEFAULT_VARIABILITY_CV, **(variability_cv or {})}
+    rng = np.random.default_rng(seed)
+
+    def log_normal(typical: float, key: str) -> np.ndarray:
+        omega = np.sqrt(np.log1p(max(cv[key], 0.0) ** 2))
+        return typical * np.exp(rng.normal(0.0, omega, n_subjects) if omega > 0 else np.zeros(n_subjects))
+
+    def logit_normal(typical: float, key: str) -> np.ndarray:
+        # F is bounded by 1, so it varies on the logit scale: the median stays at the typical
+        # value instead of being dragged down by clipping. omega = CV / (1 - F) makes the
+        # natural-scale CV approximately cv (delta method). F = 1 (IV) has no variability.
+        omega = max(cv[key], 0.0) / (1.0 - typical) if 0.0 < typical < 1.0 else 0.0
+        if omega == 0.0:
+            return np.full(n_subjects, typical)
+        logit = np.log(typical / (1.0 - typical)) + rng.normal(0.0, omega, n_subjects)
+        return 1.0 / (1.0 + np.exp(-logit))
+
+    sampled = {
+        "clearance_L_per_hr": log_normal(CL, "clearance"),
+        "Vd_L": log_normal(Vd, "volume"),
+        "bioavailability": logit_normal(F, "bioavailability"),
+    }
+    if absorption_rate_hr is not None:
+        sampled["absorption_rate_hr"] = log_normal(absorption_rate_hr, "absorption")
+    return sampled
+
+
+def batch_concentrations(
+    times: np.ndarray,
+    sampled: Dict[str, np.ndarray],
+    dose_mg: float,
+    interval_hr: float,
+    num_doses: int,
+) -> np.ndarray:
+    # Concentrations for every parameter set at `times` as one (time x subject) array.
+    kel = sampled["clearance_L_per_hr"] / sampled["Vd_L"]
+    ka = sampled.get("absorption_rate_hr")
+    given = np.clip(np.floor((times + 1e-9) / interval_hr) + 1, 0, num_doses)[:, None]
+    since_last = np.maximum(times[:, None] - (given - 1) * interval_hr, 0.0)
+
+    def accumulated(k: np.ndarray) -> np.ndarray:
+        return np.expm1(-k * given * interval_hr) / np.expm1(-k * interval_hr) * np.exp(-k * since_last)
+
+    scale = sampled["bioavailability"] * dose_mg / sampled["Vd_L"]
+    if ka is None:
+        return scale * accumulated(kel)
+    # The Bateman form is singular at ka == kel; its limit is reached by a tiny offset.
+    ka = np.where(np.abs(ka - kel) <= 1e-9 * np.maximum(ka, kel), kel * (1.0 + 1e-6), ka)
+    return scale * ka / (ka - kel) * (accumulated(kel) - accumulated(ka))
+
+
+def _population_block(
+    times: np.ndarray,
+    sampled: Dict[str, np.ndarray],
+    dose_mg: float,
+    interval_hr: float,
+    num_doses: int,
+    lower_mg_l: Optional[float],
+    upper_mg_l: Optional[float],
+) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    # One block of the time axis, reduced to percentile bands and the fraction of
+    # subjects inside the window.
+    conc = batch_concentrations(times, sampled, dose_mg, interval_hr, num_doses)
+    bands = np.percentile(conc, PERCENTILES, axis=1)
+    prob_within = None
+    if lower_mg_l is not None and upper_mg_l is not None:
+        prob_within = np.mean((conc >= lower_mg_l) & (conc <= upper_mg_l), axis=1)
+    return bands, prob_within
+
+
+def simulate_population(
+    drug_params: Dict[str, Optional[float]],
+    dosing_mg: float,
+    dosing_interval_hr: float,
+    num_doses: int,
+    n_subjects: int = 1000,
+    absorption_rate_hr: Optional[float] = None,
+    variability_cv: Optional[Dict[str, float]] = None,
+    therapeutic_min_mg_per_L: Optional[float] = None,
+    therapeutic_max_mg_per_L: Optional[float] = None,
+    t_end_hr: Optional[float] = None,
+    dt_hr: float = 0.1,
+    seed: Optional[int] = 0,
+) -> Dict[str, Any]:
+    # Subjects are sampled once up front and the time axis is split into blocks, so memory
+    # stays at one block. Callers offload the whole call with run_cpu_bound; no pool is
+    # started per request.
+    _, _, _, half = _resolve_one_compartment_params(drug_params, absorption_rate_hr)
+    sampled = sample_population_parameters(
+        drug_params, n_subjects, absorption_rate_hr, variability_cv, seed
+    )
+    if t_end_hr is None:
+        t_end_hr = (num_doses * dosing_interval_hr) + (5.0 * half)
+    times = _sample_times(t_end_hr, dt_hr)
+
+    block_len = max(1, _BATCH_MAX_CELLS // n_subjects)
+    results = [
+        _population_block(
+            times[start:start + block_len],
+            sampled,
+            dosing_mg,
+            dosing_interval_hr,
+            num_doses,
+            therapeutic_min_mg_per_L,
+            therapeutic_max_mg_per_L,
+        )
+        for start in range(0, len(times), block_len)
+    ]
+
+    bands = np.concatenate([r[0] for r in results], axis=1)
+    prob_within: Optional[List[float]] = None
+    if therapeutic_min_mg_per_L is not None and therapeutic_max_mg_per_L is not None:
+        prob_within = np.concatenate([r[1] for r in results]).tolist()
+
+    return {
+        "times_hr": times.tolist(),
+        "p05_mg_per_L": bands[0].tolist(),
+        "p50_mg_per_L": bands[1].tolist(),
+        "p95_mg_per_L": bands[2].tolist(),
+        "prob_within_window": prob_within,
+        "n_subjects": n_subjects,
+        "seed": seed,
+        "sampled_parameter_medians": {k: float(np.median(v)) for k, v in sampled.items()},
+    }
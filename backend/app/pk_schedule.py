@@ -0,0 +1,263 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .pharmacokinetics import (
+    _BATCH_MAX_CELLS,
+    _is_two_compartment,
+    _resolve_one_compartment_params,
+    _sample_times,
+    _single_dose_concentration,
+)
+from .pk_scoring import TherapeuticTargets, evaluate_therapeutic_window_batch, summarize_distribution
+
+
+DOSE_ROUTES = ("oral", "iv")
+
+Administration = Tuple[float, float, str]
+
+
+def _validate_administrations(administrations: Sequence[Administration]) -> List[Administration]:
+    out: List[Administration] = []
+    for time_hr, amount_mg, route in administrations:
+        if route not in DOSE_ROUTES:
+            raise ValueError(f"Unknown route '{route}' (expected one of {', '.join(DOSE_ROUTES)})")
+        if time_hr < 0 or amount_mg < 0:
+            raise ValueError("Administration time_hr and amount_mg must be >= 0")
+        out.append((float(time_hr), float(amount_mg), route))
+    return out
+
+
+def _route_params(
+    drug_params: Dict[str, Optional[float]],
+    administrations: Sequence[Administration],
+    absorption_rate_hr: Optional[float],
+) -> Tuple[float, float, Dict[str, Tuple[float, Optional[float]]], float]:
+    # IV doses go straight into the central compartment (F = 1, no absorption); oral doses
+    # use the medication's F and ka.
+    if _is_two_compartment(drug_params):
+        raise ValueError("Explicit administration schedules support one-compartment medications only")
+    has_oral = any(route == "oral" for _, _, route in administrations)
+    if has_oral and absorption_rate_hr is None:
+        raise ValueError("absorption_rate_hr is required for oral administrations")
+    CL, Vd, F, half = _resolve_one_compartment_params(drug_params, absorption_rate_hr if has_oral else None)
+    return CL / Vd, Vd, {"oral": (F, absorption_rate_hr), "iv": (1.0, None)}, half
+
+
+class ScheduledTimecourse:
+    # Concentrations on a fixed grid as a sum of per-administration contributions. Replacing,
+    # adding or removing one administration only subtracts/adds that dose's own curve.
+    def __init__(
+        self,
+        drug_params: Dict[str, Optional[float]],
+        administrations: Sequence[Administration],
+        absorption_rate_hr: Optional[float] = None,
+        t_end_hr: Optional[float] = None,
+        dt_hr: float = 0.1,
+    ):
+        self.administrations = _validate_administrations(administrations)
+        self.drug_params = drug_params
+        self.absorption_rate_hr = absorption_rate_hr
+        self.kel, self.Vd, self.routes, half = _route_params(
+            drug_params, self.administrations, absorption_rate_hr
+        )
+        if t_end_hr is None:
+            last = max((t for t, _, _ in self.administrations), default=0.0)
+            t_end_hr = last + 5.0 * half
+        self.times = _sample_times(t_end_hr, dt_hr)
+        self.conc = np.zeros_like(self.times)
+        for administration in self.administrations:
+            self._apply(administration, 1.0)
+
+    def _apply(self, administration: Administration, sign: float) -> None:
+        time_hr, amount_mg, route = administration
+        F, ka = self.routes[route]
+        start = int(np.searchsorted(self.times, time_hr - 1e-9))
+        if start >= len(self.times) or amount_mg == 0:
+            return
+        tau = np.maximum(self.times[start:] - time_hr, 0.0)
+        self.conc[start:] += sign * _single_dose_concentration(tau, amount_mg, self.kel, self.Vd, F, ka)
+
+    def _validated(self, administration: Administration) -> Administration:
+        (new,) = _validate_administrations([administration])
+        if new[2] == "oral" and not any(route == "oral" for _, _, route in self.administrations):
+            # The first oral dose needs F and ka, which an IV-only schedule never resolved.
+            # Only the oral entry changes; IV contributions already summed stay valid.
+            _, _, routes, _ = _route_params(self.drug_params, [new], self.absorption_rate_hr)
+            self.routes["oral"] = routes["oral"]
+        return new
+
+    def replace(self, index: int, administration: Administration) -> None:
+        new = self._validated(administration)
+        self._apply(self.administrations[index], -1.0)
+        self.administrations[index] = new
+        self._apply(new, 1.0)
+
+    def add(self, administration: Administration) -> None:
+        new = self._validated(administration)
+        self.administrations.append(new)
+        self._apply(new, 1.0)
+
+    def remove(self, index: int) -> None:
+        self._apply(self.administrations.pop(index), -1.0)
+
+    def timecourse(self) -> Tuple[List[float], List[float]]:
+        # Subtraction can leave -1e-17 style residue where a removed dose was the only one.
+        return self.times.tolist(), np.maximum(self.conc, 0.0).tolist()
+
+
+def predict_concentration_for_schedule(
+    drug_params: Dict[str, Optional[float]],
+    administrations: Sequence[Administration],
+    absorption_rate_hr: Optional[float] = None,
+    t_end_hr: Optional[float] = None,
+    dt_hr: float = 0.1,
+) -> Tuple[List[float], List[float]]:
+    return ScheduledTimecourse(drug_params, administrations, absorption_rate_hr, t_end_hr, dt_hr).timecourse()
+
+
+def sample_adherence(
+    num_doses: int,
+    interval_hr: float,
+    n_trials: int,
+    p_missed: float = 0.1,
+    p_late: float = 0.0,
+    late_max_hr: float = 4.0,
+    p_double_after_miss: float = 0.0,
+    seed: Optional[int] = 0,
+) -> Tuple[np.ndarray, np.ndarray]:
+    # (trial x dose) times and dose multipliers. A missed dose is skipped (multiplier 0);
+    # with p_double_after_miss the next dose is taken twice. Late doses are delayed
+    # uniformly up to late_max_hr but never past the next scheduled dose.
+    for name, p in (("p_missed", p_missed), ("p_late", p_late), ("p_double_after_miss", p_double_after_miss)):
+        if not 0.0 <= p <= 1.0:
+            raise ValueError(f"{name} must be within [0, 1]")
+    if n_trials < 1:
+        raise ValueError("n_trials must be >= 1")
+    rng = np.random.default_rng(seed)
+    scheduled = np.arange(num_doses) * interval_hr
+    missed = rng.random((n_trials, num_doses)) < p_missed
+    late = (rng.random((n_trials, num_doses)) < p_late) & ~missed
+    delay = np.where(late, rng.uniform(0.0, min(late_max_hr, interval_hr * 0.999), (n_trials, num_doses)), 0.0)
+
+    multiplier = np.where(missed, 0.0, 1.0)
+    doubled = np.zeros_like(missed)
+    doubled[:, 1:] = missed[:, :-1] & ~missed[:, 1:] & (rng.random((n_trials, num_doses - 1)) < p_double_after_miss)
+    multiplier = multiplier + doubled
+    return scheduled[None, :] + delay, multiplier
+
+
+def _accumulated_exponential(
+    times: np.ndarray,
+    dose_times: np.ndarray,
+    multiplier: np.ndarray,
+    interval_hr: float,
+    k: float,
+) -> np.ndarray:
+    # sum_d m_d * exp(-k (t - t_d)) over doses already taken, as (trial x time). Dose d always
+    # falls in [d*tau, (d+1)*tau), so at time t in window j every dose before j has been taken
+    # and dose j has been taken iff t_j <= t. The earlier doses collapse into a carried sum R_j
+    # referenced to j*tau, which keeps every exponent bounded and costs O(trials x (doses + times)).
+    n_trials, n_doses = dose_times.shape
+    decay = np.exp(-k * interval_hr)
+    carried = np.zeros((n_trials, n_doses))
+    for d in range(n_doses - 1):
+        offset = dose_times[:, d] - d * interval_hr
+        carried[:, d + 1] = decay * (carried[:, d] + multiplier[:, d] * np.exp(k * offset))
+    window = np.clip(np.floor((times + 1e-9) / interval_hr).astype(int), 0, n_doses - 1)
+    since_window = times - window * interval_hr
+    current = dose_times[:, window]
+    taken = current <= times[None, :] + 1e-9
+    own = np.where(taken, multiplier[:, window] * np.exp(-k * np.maximum(times[None, :] - current, 0.0)), 0.0)
+    return carried[:, window] * np.exp(-k * since_window)[None, :] + own
+
+
+def _adherence_concentrations(
+    times: np.ndarray,
+    dose_times: np.ndarray,
+    multiplier: np.ndarray,
+    interval_hr: float,
+    dose_mg: float,
+    kel: float,
+    Vd: float,
+    F: float,
+    ka: Optional[float],
+) -> np.ndarray:
+    scale = F * dose_mg / Vd
+    if ka is None:
+        return scale * _accumulated_exponential(times, dose_times, multiplier, interval_hr, kel)
+    # The Bateman form is singular at ka == kel; its limit is reached by a tiny offset.
+    if abs(ka - kel) <= 1e-9 * max(ka, kel):
+        ka = kel * (1.0 + 1e-6)
+    return scale * ka / (ka - kel) * (
+        _accumulated_exponential(times, dose_times, multiplier, interval_hr, kel)
+        - _accumulated_exponential(times, dose_times, multiplier, interval_hr, ka)
+    )
+
+
+def simulate_adherence(
+    drug_params: Dict[str, Optional[float]],
+    dose_mg: float,
+    interval_hr: float,
+    num_doses: int,
+    therapeutic_min_mg_per_L: float,
+    therapeutic_max_mg_per_L: float,
+    absorption_rate_hr: Optional[float] = None,
+    route: Optional[str] = None,
+    n_trials: int = 1000,
+    p_missed: float = 0.1,
+    p_late: float = 0.0,
+    late_max_hr: float = 4.0,
+    p_double_after_miss: float = 0.0,
+    dt_hr: float = 0.1,
+    seed: Optional[int] = 0,
+    targets: Optional[TherapeuticTargets] = None,
+) -> Dict[str, Any]:
+    # Every trial shares one grid and is evaluated in one vectorized pass; trials are chunked
+    # so the working set stays under _BATCH_MAX_CELLS.
+    targets = targets or TherapeuticTargets()
+    route = route or ("oral" if absorption_rate_hr is not None else "iv")
+    kel, Vd, routes, _ = _route_params(
+        drug_params, _validate_administrations([(0.0, dose_mg, route)]), absorption_rate_hr
+    )
+    F, ka = routes[route]
+    therapy_end = interval_hr * num_doses
+    times = _sample_times(therapy_end, dt_hr)
+    dose_times, multiplier = sample_adherence(
+        num_doses, interval_hr, n_trials, p_missed, p_late, late_max_hr, p_double_after_miss, seed
+    )
+    # Row 0 is perfect adherence, the reference the trials are compared against.
+    dose_times = np.vstack([np.arange(num_doses) * interval_hr, dose_times])
+    multiplier = np.vstack([np.ones(num_doses), multiplier])
+
+    rows = len(dose_times)
+    pct = {k: np.empty(rows) for k in ("pct_below", "pct_within", "pct_above")}
+    evaluable = np.empty(rows, dtype=bool)
+    chunk = max(1, _BATCH_MAX_CELLS // len(times))
+    for start in range(0, rows, chunk):
+        stop = min(rows, start + chunk)
+        conc = _adherence_concentrations(
+            times, dose_times[start:stop], multiplier[start:stop], interval_hr, dose_mg, kel, Vd, F, ka
+        )
+        scored = evaluate_therapeutic_window_batch(
+            times, conc, therapeutic_min_mg_per_L, therapeutic_max_mg_per_L,
+            t_start_hr=0.0, t_end_hr=therapy_end, targets=targets,
+        )
+        for k in pct:
+            pct[k][start:stop] = scored[k]
+        evaluable[start:stop] = scored["evaluable"]
+
+    trials = slice(1, None)
+    within = pct["pct_within"][trials][evaluable[trials]]
+    return {
+        "n_trials": n_trials,
+        "perfect_adherence_pct_within": float(pct["pct_within"][0]),
+        "pct_within_distribution": summarize_distribution(within),
+        "pct_below_distribution": summarize_distribution(pct["pct_below"][trials][evaluable[trials]]),
+        "pct_above_distribution": summarize_distribution(pct["pct_above"][trials][evaluable[trials]]),
+        "probability_meeting_target": float(np.mean(within >= targets.min_pct_within)) if len(within) else None,
+        "mean_pct_within_shift": float(within.mean() - pct["pct_within"][0]) if len(within) else None,
+        "mean_doses_missed": float(np.mean((multiplier[trials] == 0).sum(axis=1))),
+    }
@@ -3,6 +3,8 @@ from __future__ import annotations
 from dataclasses import dataclass
 from typing import Any, Dict, List, Optional
 
+import numpy as np
+
 
 @dataclass(frozen=True)
 class TherapeuticTargets:
@@ -12,6 +14,7 @@ class TherapeuticTargets:
 
 
 DEFAULT_TARGETS = TherapeuticTargets()
+DISTRIBUTION_PERCENTILES = (5.0, 25.0, 50.0, 75.0, 95.0)
 
 
 def evaluate_therapeutic_window(
@@ -68,23 +71,7 @@ def evaluate_therapeutic_window(
     pct_within = 100.0 * within / total
     pct_above = 100.0 * above / total
 
-    below_gap_pct = max(0.0, pct_below - targets.max_pct_below)
-    above_gap_pct = max(0.0, pct_above - targets.max_pct_above)
-    within_gap_pct = max(0.0, targets.min_pct_within - pct_within)
-
-    below_score = below_gap_pct / targets.max_pct_below if targets.max_pct_below > 0 else 0.0
-    above_score = above_gap_pct / targets.max_pct_above if targets.max_pct_above > 0 else 0.0
-    within_score = within_gap_pct / targets.min_pct_within if targets.min_pct_within > 0 else 0.0
-    off_score = max(below_score, above_score, within_score)
-
-    if off_score == 0.0:
-        risk = "NONE"
-    elif off_score <= 0.5:
-        risk = "LOW"
-    elif off_score <= 1.5:
-        risk = "MODERATE"
-    else:
-        risk = "HIGH"
+    exposure = classify_window_exposure(pct_below, pct_within, pct_above, targets)
 
     alerts: List[str] = []
     if pct_above > targets.max_pct_above:
@@ -114,6 +101,35 @@ def evaluate_therapeutic_window(
         "target_below_pct": targets.max_pct_below,
         "target_above_pct": targets.max_pct_above,
         "target_within_pct": targets.min_pct_within,
+        **exposure,
+    }
+
+
+def classify_window_exposure(
+    pct_below: float,
+    pct_within: float,
+    pct_above: float,
+    targets: TherapeuticTargets = DEFAULT_TARGETS,
+) -> Dict[str, Any]:
+    below_gap_pct = max(0.0, pct_below - targets.max_pct_below)
+    above_gap_pct = max(0.0, pct_above - targets.max_pct_above)
+    within_gap_pct = max(0.0, targets.min_pct_within - pct_within)
+
+    below_score = below_gap_pct / targets.max_pct_below if targets.max_pct_below > 0 else 0.0
+    above_score = above_gap_pct / targets.max_pct_above if targets.max_pct_above > 0 else 0.0
+    within_score = within_gap_pct / targets.min_pct_within if targets.min_pct_within > 0 else 0.0
+    off_score = max(below_score, above_score, within_score)
+
+    if off_score == 0.0:
+        risk = "NONE"
+    elif off_score <= 0.5:
+        risk = "LOW"
+    elif off_score <= 1.5:
+        risk = "MODERATE"
+    else:
+        risk = "HIGH"
+
+    return {
         "below_gap_pct": below_gap_pct,
         "above_gap_pct": above_gap_pct,
         "within_gap_pct": within_gap_pct,
@@ -122,6 +138,125 @@ def evaluate_therapeutic_window(
     }
 
 
+def evaluate_therapeutic_window_batch(
+    times_hr: np.ndarray,
+    conc_mg_per_L: np.ndarray,
+    lower_mg_per_L: float,
+    upper_mg_per_L: float,
+    t_start_hr: Optional[float] = None,
+    t_end_hr: Optional[np.ndarray | float] = None,
+    targets: TherapeuticTargets = DEFAULT_TARGETS,
+) -> Dict[str, np.ndarray]:
+    # Same segment-midpoint scoring as evaluate_therapeutic_window, for a
+    # (curves x time) array sharing one time grid. t_end_hr may differ per curve.
+    conc = np.atleast_2d(np.asarray(conc_mg_per_L, dtype=float))
+    times = np.asarray(times_hr, dtype=float)
+    n_rows = conc.shape[0]
+    zeros = np.zeros(n_rows)
+    if (
+        times.size < 2
+        or conc.shape[1] != times.size
+        or lower_mg_per_L < 0
+        or upper_mg_per_L <= lower_mg_per_L
+    ):
+        return {"pct_below": zeros, "pct_within": zeros, "pct_above": zeros, "evaluable": zeros > 0}
+
+    weights = _segment_weights(times, n_rows, t_start_hr, t_end_hr)
+    c_mid = 0.5 * (conc[:, :-1] + conc[:, 1:])
+    is_below = c_mid < lower_mg_per_L
+    is_above = c_mid > upper_mg_per_L
+
+    total = weights.sum(axis=1)
+    below = np.where(is_below, weights, 0.0).sum(axis=1)
+    above = np.where(is_above, weights, 0.0).sum(axis=1)
+    within = np.where(~is_below & ~is_above, weights, 0.0).sum(axis=1)
+
+    evaluable = total > 0
+    safe_total = np.where(evaluable, total, 1.0)
+    return {
+        "pct_below": np.where(evaluable, 100.0 * below / safe_total, 0.0),
+        "pct_within": np.where(evaluable, 100.0 * within / safe_total, 0.0),
+        "pct_above": np.where(evaluable, 100.0 * above / safe_total, 0.0),
+        "evaluable": evaluable,
+    }
+
+
+def best_scale_for_window(
+    times_hr: np.ndarray,
+    unit_conc_mg_per_L: np.ndarray,
+    lower_mg_per_L: float,
+    upper_mg_per_L: float,
+    t_start_hr: Optional[float] = None,
+    t_end_hr: Optional[float] = None,
+    reference_scale: Optional[float] = None,
+) -> Optional[float]:
+    # For a curve that is linear in dose, segment i of scale*c is within the window exactly when
+    # lower/c_i <= scale <= upper/c_i. The best scale maximises the overlapping segment time;
+    # ties prefer less time above, then less time below, then the scale nearest reference_scale.
+    times = np.asarray(times_hr, dtype=float)
+    conc = np.asarray(unit_conc_mg_per_L, dtype=float)
+    if times.size < 2 or conc.size != times.size or lower_mg_per_L < 0 or upper_mg_per_L <= lower_mg_per_L:
+        return None
+
+    weights = _segment_weights(times, 1, t_start_hr, t_end_hr)[0]
+    c_mid = 0.5 * (conc[:-1] + conc[1:])
+    keep = (weights > 0) & (c_mid > 0)
+    if not keep.any():
+        return None
+    w = weights[keep]
+    lo = lower_mg_per_L / c_mid[keep]
+    hi = upper_mg_per_L / c_mid[keep]
+
+    lo_order = np.argsort(lo, kind="stable")
+    lo_sorted = lo[lo_order]
+    lo_cum = np.concatenate(([0.0], np.cumsum(w[lo_order])))
+    hi_order = np.argsort(hi, kind="stable")
+    hi_sorted = hi[hi_order]
+    hi_cum = np.concatenate(([0.0], np.cumsum(w[hi_order])))
+
+    def coverage(scale: np.ndarray) -> np.ndarray:
+        entered = lo_cum[np.searchsorted(lo_sorted, scale, side="right")]
+        left = hi_cum[np.searchsorted(hi_sorted, scale, side="left")]
+        return entered - left
+
+    # Coverage only increases at a lower bound, so its maximum is attained at one of them.
+    starts = np.unique(lo_sorted)
+    cov = coverage(starts)
+    best = cov.max()
+    starts = starts[cov >= best - 1e-12 * max(best, 1.0)]
+    ends = hi_sorted[np.minimum(np.searchsorted(hi_sorted, starts, side="left"), hi_sorted.size - 1)]
+    ends = np.maximum(ends, starts)
+
+    if reference_scale is not None and reference_scale > 0:
+        chosen = np.clip(reference_scale, starts, ends)
+        distance = np.abs(chosen - reference_scale)
+    else:
+        chosen = 0.5 * (starts + ends)
+        distance = np.zeros_like(chosen)
+    above = hi_cum[np.searchsorted(hi_sorted, chosen, side="left")]
+    below = lo_cum[-1] - lo_cum[np.searchsorted(lo_sorted, chosen, side="right")]
+
+    pick = np.lexsort((distance, below, above))[0]
+    return float(chosen[pick])
+
+
+def _segment_weights(
+    times: np.ndarray,
+    n_rows: int,
+    t_start_hr: Optional[float],
+    t_end_hr: Optional[np.ndarray | float],
+) -> np.ndarray:
+    dt = np.diff(times)
+    mid_t = 0.5 * (times[:-1] + times[1:])
+    usable = np.broadcast_to(dt > 0, (n_rows, dt.size))
+    if t_start_hr is not None:
+        usable = usable & (mid_t >= t_start_hr)
+    if t_end_hr is not None:
+        t_end = np.broadcast_to(np.asarray(t_end_hr, dtype=float), (n_rows,))
+        usable = usable & (mid_t[None, :] <= t_end[:, None])
+    return np.where(usable, dt, 0.0)
+
+
 def _empty_eval(message: str, targets: TherapeuticTargets) -> Dict[str, Any]:
     return {
         "pct_below": 0.0,
@@ -140,3 +275,11 @@ def _empty_eval(message: str, targets: TherapeuticTargets) -> Dict[str, Any]:
         "off_score": 0.0,
         "ade_risk_level": "UNKNOWN",
     }
+
+
+def summarize_distribution(values: np.ndarray) -> Dict[str, Optional[float]]:
+    values = np.asarray(values, dtype=float)
+    if not len(values):
+        return {"mean": None, **{f"p{int(p)}": None for p in DISTRIBUTION_PERCENTILES}}
+    pcts = np.percentile(values, DISTRIBUTION_PERCENTILES)
+    return {"mean": float(values.mean()), **{f"p{int(p)}": float(v) for p, v in zip(DISTRIBUTION_PERCENTILES, pcts)}}
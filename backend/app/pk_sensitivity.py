@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .pharmacokinetics import _is_two_compartment, _resolve_one_compartment_params, _sample_times
+from .pk_population import batch_concentrations
+from .pk_scoring import evaluate_therapeutic_window_batch
+
+
+SENSITIVITY_PARAMETERS = ("half_life_hr", "clearance_L_per_hr", "Vd_L", "bioavailability", "absorption_rate_hr")
+DEFAULT_SENSITIVITY_FACTORS = (0.8, 0.9, 1.1, 1.2)
+
+
+def _perturbed_parameter_sets(
+    CL: float,
+    Vd: float,
+    F: float,
+    ka: Optional[float],
+    factors: Sequence[float],
+) -> tuple[list[tuple[str, float]], Dict[str, np.ndarray]]:
+    # Row 0 is the baseline. Half-life is perturbed at fixed Vd (so CL moves with it);
+    # CL and Vd are perturbed with the other held fixed.
+    rows: list[tuple[str, float]] = [("baseline", 1.0)]
+    cl, vd, f, k_abs = [CL], [Vd], [F], [ka]
+    for name in SENSITIVITY_PARAMETERS:
+        if name == "absorption_rate_hr" and ka is None:
+            continue
+        for factor in factors:
+            rows.append((name, factor))
+            scale = {name: factor}
+            cl.append(CL * scale.get("clearance_L_per_hr", 1.0) / scale.get("half_life_hr", 1.0))
+            vd.append(Vd * scale.get("Vd_L", 1.0))
+            f.append(F * scale.get("bioavailability", 1.0))
+            k_abs.append(ka * scale.get("absorption_rate_hr", 1.0) if ka is not None else None)
+
+    sets = {
+        "clearance_L_per_hr": np.array(cl),
+        "Vd_L": np.array(vd),
+        "bioavailability": np.array(f),
+    }
+    if ka is not None:
+        sets["absorption_rate_hr"] = np.array(k_abs)
+    return rows, sets
+
+
+def _elasticity(value: float, baseline: float, factor: float) -> Optional[float]:
+    if baseline == 0 or factor == 1.0:
+        return None
+    return float(((value - baseline) / baseline) / (factor - 1.0))
+
+
+def compute_local_sensitivity(
+    drug_params: Dict[str, Optional[float]],
+    dosing_mg: float,
+    dosing_interval_hr: float,
+    num_doses: int,
+    absorption_rate_hr: Optional[float] = None,
+    factors: Sequence[float] = DEFAULT_SENSITIVITY_FACTORS,
+    therapeutic_min_mg_per_L: Optional[float] = None,
+    therapeutic_max_mg_per_L: Optional[float] = None,
+    dt_hr: float = 0.1,
+) -> Dict[str, Any]:
+    # Every perturbation is one column of a single (time x parameter set) evaluation.
+    # Metrics cover the dosing period: Cmax and AUC over [0, therapy end], Cmin is the
+    # trough at the end of the last interval.
+    if _is_two_compartment(drug_params):
+        raise ValueError("Sensitivity analysis supports one-compartment medications only")
+    if any(f <= 0 for f in factors):
+        raise ValueError("Perturbation factors must be > 0")
+    CL, Vd, F, _ = _resolve_one_compartment_params(drug_params, absorption_rate_hr)
+    rows, sets = _perturbed_parameter_sets(CL, Vd, F, absorption_rate_hr, factors)
+
+    therapy_end = dosing_interval_hr * num_doses
+    times = _sample_times(therapy_end, dt_hr)
+    conc = batch_concentrations(times, sets, dosing_mg, dosing_interval_hr, num_doses).T
+
+    cmax = conc.max(axis=1)
+    cmin = conc[:, -1]
+    auc = np.sum(0.5 * (conc[:, 1:] + conc[:, :-1]) * np.diff(times), axis=1)
+    pct_within = None
+    if therapeutic_min_mg_per_L is not None and therapeutic_max_mg_per_L is not None:
+        pct_within = evaluate_therapeutic_window_batch(
+            times,
+            conc,
+            therapeutic_min_mg_per_L,
+            therapeutic_max_mg_per_L,
+            t_start_hr=0.0,
+            t_end_hr=therapy_end,
+        )["pct_within"]
+
+    metrics = {"cmax_mg_l": cmax, "cmin_mg_l": cmin, "auc_mg_h_l": auc}
+    if pct_within is not None:
+        metrics["pct_within"] = pct_within
+    baseline = {name: float(values[0]) for name, values in metrics.items()}
+
+    perturbations: Dict[str, List[Dict[str, Any]]] = {}
+    for i, (name, factor) in enumerate(rows[1:], start=1):
+        entry: Dict[str, Any] = {"factor": factor}
+        for metric, values in metrics.items():
+            entry[metric] = float(values[i])
+            entry[f"elasticity_{metric}"] = _elasticity(float(values[i]), baseline[metric], factor)
+        perturbations.setdefault(name, []).append(entry)
+
+    return {
+        "baseline": baseline,
+        "perturbations": perturbations,
+        "factors": list(factors),
+    }
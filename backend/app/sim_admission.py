@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+import numpy as np
+
+from .sim_executor import default_pool_workers
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, retry_after_s: int, reason: str):
+        super().__init__(reason)
+        self.retry_after_s = retry_after_s
+        self.reason = reason
+
+
+class AdmissionController:
+    # At most max_concurrent callers run; up to max_queue more wait (FIFO) for a slot and
+    # everyone beyond that is turned away immediately, so admitted latency stays bounded.
+    def __init__(
+        self,
+        max_concurrent: int,
+        max_queue: int,
+        queue_timeout_s: float = 10.0,
+        min_retry_after_s: int = 1,
+        window: int = 512,
+    ):
+        if max_concurrent < 1:
+            raise ValueError("max_concurrent must be >= 1")
+        self.max_concurrent = max_concurrent
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout_s = queue_timeout_s
+        self.min_retry_after_s = min_retry_after_s
+        self._cond = threading.Condition()
+        self._waiting: "deque[object]" = deque()
+        self._in_flight = 0
+        self._admitted = 0
+        self._rejected_full = 0
+        self._rejected_timeout = 0
+        self._peak_queue_depth = 0
+        self._wait_s: "deque[float]" = deque(maxlen=window)
+        self._service_s: "deque[float]" = deque(maxlen=window)
+
+    def _retry_after_s(self) -> int:
+        # Time for the current queue plus one more request to drain at the observed service rate.
+        service = float(np.mean(self._service_s)) if self._service_s else 1.0
+        backlog = len(self._waiting) + self._in_flight + 1
+        estimate = service * backlog / self.max_concurrent
+        return max(self.min_retry_after_s, int(math.ceil(estimate)))
+
+    def _acquire(self, wait: bool = False) -> float:
+        # wait=True is for background work with nobody to send a 429 to: it joins the same FIFO
+        # but is never turned away and never times out.
+        started = time.monotonic()
+        with self._cond:
+            if self._in_flight < self.max_concurrent and not self._waiting:
+                self._in_flight += 1
+                self._admitted += 1
+                self._wait_s.append(0.0)
+                return 0.0
+            if not wait and len(self._waiting) >= self.max_queue:
+                self._rejected_full += 1
+                raise AdmissionRejected(self._retry_after_s(), "Simulation queue is full")
+
+            ticket = object()
+            self._waiting.append(ticket)
+            self._peak_queue_depth = max(self._peak_queue_depth, len(self._waiting))
+            deadline = None if wait else started + self.queue_timeout_s
+            try:
+                while self._waiting[0] is not ticket or self._in_flight >= self.max_concurrent:
+                    if deadline is None:
+                        self._cond.wait()
+                        continue
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._rejected_timeout += 1
+                        raise AdmissionRejected(self._retry_after_s(), "Timed out waiting for a simulation slot")
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting.remove(ticket)
+                # Whoever is now at the head may be able to go.
+                self._cond.notify_all()
+            self._in_flight += 1
+            self._admitted += 1
+            waited = time.monotonic() - started
+            self._wait_s.append(waited)
+            return waited
+
+    def _release(self, service_s: float) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            self._service_s.append(service_s)
+            self._cond.notify_all()
+
+    @contextmanager
+    def admit(self, wait: bool = False) -> Iterator[float]:
+        waited = self._acquire(wait)
+        started = time.monotonic()
+        try:
+            yield waited
+        finally:
+            self._release(time.monotonic() - started)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            waits = np.asarray(self._wait_s, dtype=float)
+            service = np.asarray(self._service_s, dtype=float)
+            return {
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "in_flight": self._in_flight,
+                "queue_depth": len(self._waiting),
+                "peak_queue_depth": self._peak_queue_depth,
+                "admitted": self._admitted,
+                "rejected_queue_full": self._rejected_full,
+                "rejected_timeout": self._rejected_timeout,
+                "wait_s_mean": float(waits.mean()) if len(waits) else 0.0,
+                "wait_s_p95": float(np.percentile(waits, 95)) if len(waits) else 0.0,
+                "wait_s_max": float(waits.max()) if len(waits) else 0.0,
+                "service_s_mean": float(service.mean()) if len(service) else 0.0,
+            }
+
+
+def _default_max_concurrent() -> int:
+    configured: Optional[str] = os.getenv("SIM_MAX_CONCURRENT")
+    if configured:
+        return int(configured)
+    return default_pool_workers() or (os.cpu_count() or 2)
+
+
+SIMULATION_ADMISSION = AdmissionController(
+    max_concurrent=_default_max_concurrent(),
+    max_queue=int(os.getenv("SIM_MAX_QUEUE", "8")),
+    queue_timeout_s=float(os.getenv("SIM_QUEUE_TIMEOUT_S", "10")),
+)
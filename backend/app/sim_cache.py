@@ -0,0 +1,284 @@
+from __future__ import annotations
+
+import dataclasses
+import functools
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_DISK_MAX_BYTES = 1024 * 1024 * 1024
+DEFAULT_DISK_MAX_ENTRIES = 50_000
+# Every worker process writes to the same directory; the disk index is rebuilt this often.
+_DISK_RESCAN_INTERVAL_S = 300.0
+
+
+def _canonical(value: Any) -> Any:
+    # Equal inputs must hash equally: 300 and 300.0 mg are the same dose, and dict order,
+    # dataclasses and numpy scalars should not leak into the key.
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (int, float, Decimal, np.integer, np.floating)):
+        return float(value)
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_canonical(v) for v in value]
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return _canonical(dataclasses.asdict(value))
+    return str(value)
+
+
+def cache_key(namespace: str, payload: Any) -> str:
+    body = json.dumps(_canonical(payload), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{namespace}|{body}".encode()).hexdigest()
+
+
+def _estimate_nbytes(value: Any) -> int:
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_estimate_nbytes(k) + _estimate_nbytes(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        if value and all(type(v) is float for v in value):
+            size += len(value) * sys.getsizeof(0.0)
+        else:
+            size += sum(_estimate_nbytes(v) for v in value)
+    elif isinstance(value, np.ndarray):
+        size += value.nbytes
+    return size
+
+
+class SimulationCache:
+    # Memory tier (LRU within max_bytes) in front of an optional disk tier shared by all
+    # processes, LRU by file mtime within disk_max_bytes / disk_max_entries. With a process
+    # pool each worker has its own memory tier; run_cpu_bound folds the workers' hit/miss
+    # counters back into the parent's with absorb().
+    def __init__(
+        self,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        persist_dir: Optional[str] = None,
+        disk_max_bytes: int = DEFAULT_DISK_MAX_BYTES,
+        disk_max_entries: int = DEFAULT_DISK_MAX_ENTRIES,
+    ):
+        self.max_bytes = max_bytes
+        self.persist_dir = Path(persist_dir) if persist_dir else None
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_max_entries = disk_max_entries
+        self._entries: "OrderedDict[str, tuple[Any, int]]" = OrderedDict()
+        self._bytes = 0
+        # key -> file size, least recently used first.
+        self._disk_index: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        self._disk_scanned_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        if self.persist_dir is not None:
+            self.persist_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, key: str) -> tuple[bool, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[0]
+
+        value = self._read_disk(key)
+        if value is not None:
+            self._store(key, value)
+            with self._lock:
+                self.hits += 1
+                self.disk_hits += 1
+            return True, value
+
+        with self._lock:
+            self.misses += 1
+        return False, None
+
+    def put(self, key: str, value: Any) -> None:
+        self._store(key, value)
+        self._write_disk(key, value)
+
+    def _store(self, key: str, value: Any) -> None:
+        nbytes = _estimate_nbytes(value)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (value, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes and self._entries:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+
+    def _disk_path(self, key: str) -> Optional[Path]:
+        return self.persist_dir / f"{key}.pkl.z" if self.persist_dir is not None else None
+
+    def _read_disk(self, key: str) -> Any:
+        path = self._disk_path(key)
+        if path is None or not path.exists():
+            return None
+        try:
+            value = pickle.loads(zlib.decompress(path.read_bytes()))
+            # mtime doubles as the last-used time, so other processes see the hit too.
+            os.utime(path)
+        except Exception:
+            return None
+        with self._lock:
+            if key in self._disk_index:
+                self._disk_index.move_to_end(key)
+        return value
+
+    def _write_disk(self, key: str, value: Any) -> None:
+        path = self._disk_path(key)
+        if path is None:
+            return
+        try:
+            blob = zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), 6)
+            if len(blob) > self.disk_max_bytes:
+                return
+            tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_bytes(blob)
+            os.replace(tmp, path)
+        except OSError:
+            return
+        with self._lock:
+            self._rescan_disk_if_due()
+            self._track_disk(key, len(blob))
+            while self._disk_index and (
+                self._disk_bytes > self.disk_max_bytes or len(self._disk_index) > self.disk_max_entries
+            ):
+                evicted, size = self._disk_index.popitem(last=False)
+                self._disk_bytes -= size
+                self.disk_evictions += 1
+                path = self._disk_path(evicted)
+                assert path is not None
+                path.unlink(missing_ok=True)
+
+    def _track_disk(self, key: str, size: int) -> None:
+        previous = self._disk_index.pop(key, None)
+        if previous is not None:
+            self._disk_bytes -= previous
+        self._disk_index[key] = size
+        self._disk_bytes += size
+
+    def _rescan_disk_if_due(self) -> None:
+        now = time.monotonic()
+        if self._disk_scanned_at is not None and now - self._disk_scanned_at < _DISK_RESCAN_INTERVAL_S:
+            return
+        assert self.persist_dir is not None
+        self._disk_scanned_at = now
+        found = []
+        for path in self.persist_dir.glob("*.pkl.z"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            found.append((stat.st_mtime, path.name[: -len(".pkl.z")], stat.st_size))
+        self._disk_index.clear()
+        self._disk_bytes = 0
+        for _, key, size in sorted(found):
+            self._track_disk(key, size)
+
+    def counters(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "evictions": self.evictions,
+                "disk_evictions": self.disk_evictions,
+            }
+
+    def absorb(self, delta: Dict[str, int]) -> None:
+        # Counter changes made by a worker process on the parent's behalf.
+        with self._lock:
+            self.hits += delta.get("hits", 0)
+            self.misses += delta.get("misses", 0)
+            self.disk_hits += delta.get("disk_hits", 0)
+            self.evictions += delta.get("evictions", 0)
+            self.disk_evictions += delta.get("disk_evictions", 0)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = self.misses = self.disk_hits = self.evictions = self.disk_evictions = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "persistent": self.persist_dir is not None,
+                "disk_entries": len(self._disk_index),
+                "disk_bytes": self._disk_bytes,
+                "disk_evictions": self.disk_evictions,
+            }
+
+
+def memoize(
+    cache: SimulationCache,
+    namespace: str,
+    copy_result: Callable[[Any], Any] = lambda value: value,
+) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    # Keys cover every bound argument (defaults included). Cached values are shared, so
+    # copy_result hands callers their own mutable containers.
+    def decorator(fn: Callable[..., Any]) -> Callable[..., Any]:
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not cache.enabled:
+                return fn(*args, **kwargs)
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = cache_key(namespace, bound.arguments)
+            hit, value = cache.get(key)
+            if not hit:
+                value = fn(*args, **kwargs)
+                cache.put(key, value)
+            return copy_result(value)
+
+        return wrapper
+
+    return decorator
+
+
+SIMULATION_CACHE = SimulationCache(
+    max_bytes=int(os.getenv("SIM_CACHE_MAX_BYTES", str(DEFAULT_MAX_BYTES))),
+    persist_dir=os.getenv("SIM_CACHE_DIR") or None,
+    disk_max_bytes=int(os.getenv("SIM_CACHE_DISK_MAX_BYTES", str(DEFAULT_DISK_MAX_BYTES))),
+    disk_max_entries=int(os.getenv("SIM_CACHE_DISK_MAX_ENTRIES", str(DEFAULT_DISK_MAX_ENTRIES))),
+)
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+
+from .sim_cache import SIMULATION_CACHE
+
+
+logger = logging.getLogger(__name__)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _warm_worker() -> None:
+    # Pay the numpy/scipy import and first-call costs once per worker, not on a request.
+    from .pharmacokinetics import predict_concentration_timecourse
+
+    predict_concentration_timecourse(
+        {"half_life_hr": 6.0, "Vd_L": 40.0, "bioavailability": 1.0},
+        100.0,
+        12.0,
+        2,
+        absorption_rate_hr=1.0,
+    )
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+def _run_counted(fn: Callable[..., Any], args: tuple, kwargs: dict) -> tuple[Any, Dict[str, int]]:
+    # Runs in a worker: the memoized calls inside fn hit the worker's SIMULATION_CACHE, so the
+    # counter changes travel back with the result for the parent to absorb.
+    before = SIMULATION_CACHE.counters()
+    result = fn(*args, **kwargs)
+    after = SIMULATION_CACHE.counters()
+    return result, {name: after[name] - before[name] for name in after}
+
+
+def _create_pool(workers: int) -> ProcessPoolExecutor:
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_warm_worker,
+    )
+    # Workers start lazily; one task each brings them all up now.
+    for future in [pool.submit(_ping) for _ in range(workers)]:
+        future.result()
+    return pool
+
+
+def default_pool_workers() -> int:
+    # SIM_POOL_WORKERS=0 keeps simulation work inline in the request thread.
+    configured = os.getenv("SIM_POOL_WORKERS", "").strip()
+    if configured:
+        return int(configured)
+    return min(4, os.cpu_count() or 1)
+
+
+def start_simulation_pool(workers: Optional[int] = None) -> Optional[ProcessPoolExecutor]:
+    # Spawned (not forked) workers: the server process has threads and open DB connections.
+    global _pool, _pool_workers
+    if workers is None:
+        workers = default_pool_workers()
+    if workers <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = _create_pool(workers)
+            _pool_workers = workers
+    return _pool
+
+
+def _replace_broken_pool(broken: ProcessPoolExecutor) -> Optional[ProcessPoolExecutor]:
+    # A worker died (OOM, native crash) and took the whole executor with it. Only the first
+    # caller to notice rebuilds it; the others pick up the replacement.
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            logger.warning("Simulation process pool broke; restarting %d workers", _pool_workers)
+            broken.shutdown(wait=False, cancel_futures=True)
+            _pool = _create_pool(_pool_workers)
+        return _pool
+
+
+def shutdown_simulation_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+
+
+def _submit(pool: ProcessPoolExecutor, fn: Callable[..., Any], args: tuple, kwargs: dict) -> Any:
+    result, cache_delta = pool.submit(_run_counted, fn, args, kwargs).result()
+    SIMULATION_CACHE.absorb(cache_delta)
+    return result
+
+
+def run_cpu_bound(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    # fn and its arguments must be picklable; callers keep DB sessions in the request thread.
+    pool = _pool
+    if pool is None:
+        return fn(*args, **kwargs)
+    try:
+        return _submit(pool, fn, args, kwargs)
+    except BrokenProcessPool:
+        pool = _replace_broken_pool(pool)
+    # Retried once on a fresh pool; a task that keeps killing its worker fails the request.
+    if pool is None:
+        return fn(*args, **kwargs)
+    return _submit(pool, fn, args, kwargs)
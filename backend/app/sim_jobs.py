@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+@dataclass
+class SimulationJob:
+    id: str
+    kind: str
+    stages: List[Dict[str, Any]]
+    status: str = "queued"
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Any = None
+    error: Optional[str] = None
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "stages": [dict(stage) for stage in self.stages],
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+        }
+
+
+class JobQueue:
+    # In-process worker queue. Jobs are lost on restart; callers resubmit from the inputs.
+    def __init__(self, workers: int = 2, max_pending: int = 100, retain_s: float = 3600.0):
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.retain_s = retain_s
+        self._jobs: "OrderedDict[str, SimulationJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _pool(self) -> ThreadPoolExecutor:
+        # Created under the lock so concurrent first submits share one executor and `workers`
+        # stays the real concurrency bound.
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="sim-job")
+            return self._executor
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.retain_s
+        for job_id in [
+            j.id for j in self._jobs.values() if j.finished_at is not None and j.finished_at < cutoff
+        ]:
+            del self._jobs[job_id]
+
+    def _mark_stage(self, job: SimulationJob, name: str) -> None:
+        now = time.time()
+        with self._lock:
+            for stage in job.stages:
+                if stage["status"] == "running":
+                    stage["status"] = "done"
+                    stage["finished_at"] = now
+            for stage in job.stages:
+                if stage["name"] == name:
+                    stage["status"] = "running"
+                    stage["started_at"] = now
+                    return
+            job.stages.append({"name": name, "status": "running", "started_at": now, "finished_at": None})
+
+    def _run(self, job: SimulationJob, fn: Callable[..., Any], args: tuple, kwargs: dict) -> None:
+        with self._lock:
+            job.status = "running"
+            job.started_at = time.time()
+        try:
+            result = fn(*args, on_stage=lambda name: self._mark_stage(job, name), **kwargs)
+        except Exception as exc:
+            with self._lock:
+                for stage in job.stages:
+                    if stage["status"] == "running":
+                        stage["status"] = "failed"
+                        stage["finished_at"] = time.time()
+                job.error = str(exc) or exc.__class__.__name__
+                job.status = "failed"
+                job.finished_at = time.time()
+            logger.exception("Simulation job %s failed", job.id)
+            return
+        with self._lock:
+            for stage in job.stages:
+                if stage["status"] == "running":
+                    stage["status"] = "done"
+                    stage["finished_at"] = time.time()
+            job.result = result
+            job.status = "succeeded"
+            job.finished_at = time.time()
+
+    def submit(
+        self,
+        kind: str,
+        stages: List[str],
+        fn: Callable[..., Any],
+        *args: Any,
+        **kwargs: Any,
+    ) -> SimulationJob:
+        # fn receives on_stage(name) to report progress; unknown stage names are appended.
+        with self._lock:
+            self._prune()
+            pending = sum(1 for j in self._jobs.values() if j.status in ("queued", "running"))
+            if pending >= self.max_pending:
+                raise JobQueueFull(f"{pending} simulation jobs already pending")
+            job = SimulationJob(
+                id=str(uuid.uuid4()),
+                kind=kind,
+                stages=[
+                    {"name": name, "status": "pending", "started_at": None, "finished_at": None}
+                    for name in stages
+                ],
+            )
+            self._jobs[job.id] = job
+        self._pool().submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def get(self, job_id: str) -> Optional[SimulationJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def describe(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.summary() if job is not None else None
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+SIMULATION_JOBS = JobQueue(
+    workers=int(os.getenv("SIM_JOB_WORKERS", "2")),
+    max_pending=int(os.getenv("SIM_JOB_MAX_PENDING", "100")),
+    retain_s=float(os.getenv("SIM_JOB_RETAIN_S", "3600")),
+)
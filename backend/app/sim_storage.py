@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import struct
+import zlib
+from typing import Any, List, Sequence, Tuple
+
+import numpy as np
+
+from .models import Simulation
+
+
+# Layout: magic | flags | t0 | dt | n | zlib(byte-shuffled values).
+# Uniform grids store only (t0, dt, n); otherwise the times follow the concentrations.
+CURVE_MAGIC = b"PKC1"
+_HEADER = struct.Struct("<4sBddI")
+_FLAG_FLOAT32 = 0x01
+_FLAG_EXPLICIT_TIMES = 0x02
+
+
+def _shuffle(values: np.ndarray) -> bytes:
+    # Group the k-th byte of every value together; exponents and high mantissa bytes
+    # repeat along a smooth curve, which zlib then compresses far better.
+    raw = np.ascontiguousarray(values).view(np.uint8).reshape(len(values), values.itemsize)
+    return raw.T.tobytes()
+
+
+def _unshuffle(data: bytes, dtype: np.dtype, n: int) -> np.ndarray:
+    raw = np.frombuffer(data, dtype=np.uint8).reshape(dtype.itemsize, n)
+    return np.ascontiguousarray(raw.T).view(dtype).reshape(n)
+
+
+def _uniform_grid(times: np.ndarray) -> Tuple[float, float] | None:
+    if len(times) < 2:
+        return (float(times[0]) if len(times) else 0.0), 0.0
+    t0, dt = float(times[0]), float(times[1] - times[0])
+    if dt <= 0:
+        return None
+    grid = np.round(t0 + np.arange(len(times)) * dt, 6)
+    return (t0, dt) if np.array_equal(grid, times) else None
+
+
+def encode_curve(
+    times_hr: Sequence[float],
+    conc_mg_per_L: Sequence[float],
+    use_float32: bool = False,
+) -> bytes:
+    times = np.asarray(times_hr, dtype=np.float64)
+    conc = np.asarray(conc_mg_per_L, dtype=np.float32 if use_float32 else np.float64)
+    if len(times) != len(conc):
+        raise ValueError("times_hr and conc_mg_per_L lengths must match")
+
+    flags = _FLAG_FLOAT32 if use_float32 else 0
+    grid = _uniform_grid(times)
+    payload = _shuffle(conc)
+    if grid is None:
+        flags |= _FLAG_EXPLICIT_TIMES
+        grid = (0.0, 0.0)
+        payload += _shuffle(times)
+    header = _HEADER.pack(CURVE_MAGIC, flags, grid[0], grid[1], len(times))
+    return header + zlib.compress(payload, 6)
+
+
+def decode_curve(blob: bytes) -> Tuple[List[float], List[float]]:
+    magic, flags, t0, dt, n = _HEADER.unpack_from(blob)
+    if magic != CURVE_MAGIC:
+        raise ValueError("Unrecognized curve encoding")
+    payload = zlib.decompress(blob[_HEADER.size:])
+    dtype = np.dtype(np.float32 if flags & _FLAG_FLOAT32 else np.float64)
+    conc_bytes = dtype.itemsize * n
+    conc = _unshuffle(payload[:conc_bytes], dtype, n).astype(np.float64)
+    if flags & _FLAG_EXPLICIT_TIMES:
+        times = _unshuffle(payload[conc_bytes:], np.dtype(np.float64), n)
+    else:
+        times = np.round(t0 + np.arange(n) * dt, 6)
+    return times.tolist(), conc.tolist()
+
+
+def store_curve(sim: Simulation, times_hr: Sequence[float], conc_mg_per_L: Sequence[float]) -> None:
+    sim.sim_curve = encode_curve(times_hr, conc_mg_per_L)
+    sim_results: dict[str, Any] = dict(sim.sim_results or {})
+    sim_results.pop("times_hr", None)
+    sim_results.pop("conc_mg_per_L", None)
+    sim_results["curve_encoding"] = CURVE_MAGIC.decode()
+    sim.sim_results = sim_results
+
+
+def load_curve(sim: Simulation) -> Tuple[List[float], List[float]]:
+    # Rows written before the binary column keep their curve as JSON lists.
+    if sim.sim_curve:
+        return decode_curve(bytes(sim.sim_curve))
+    sim_results: dict[str, Any] = sim.sim_results or {}
+    return sim_results.get("times_hr", []) or [], sim_results.get("conc_mg_per_L", []) or []
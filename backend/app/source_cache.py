@@ -0,0 +1,237 @@
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+
+DEFAULT_TTL_S = 7 * 24 * 3600
+# "Not found" answers are cached too, but go stale sooner so newly published labels show up.
+DEFAULT_NEGATIVE_TTL_S = 24 * 3600
+NEGATIVE_STATUS = frozenset({404, 410})
+# Stale entries are still served while they revalidate, but not forever.
+DEFAULT_MAX_AGE_S = 30 * 24 * 3600
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_ENTRIES = 5000
+# Other workers may share the directory; the size index is rebuilt from disk this often.
+_RESCAN_INTERVAL_S = 300.0
+# Response headers needed to serve a cached body and to revalidate it later.
+_KEPT_HEADERS = ("content-type", "etag", "last-modified")
+
+
+def normalize_lookup_value(value: Any) -> str:
+    # Drug names arrive as "Lithium Carbonate", "lithium  carbonate", ...; the sources treat
+    # them the same, so the response cache and fetch coalescing do too.
+    return " ".join(str(value).split()).casefold()
+
+
+def source_cache_key(url: str, params: Optional[dict] = None, headers: Optional[dict] = None) -> str:
+    payload = {
+        "url": url,
+        "params": {str(k): normalize_lookup_value(v) for k, v in sorted((params or {}).items())},
+        "accept": (headers or {}).get("Accept"),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def default_cache_directory() -> str:
+    # Per-user and private (see SourceResponseCache), never a shared temp directory.
+    base = os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "capstone-source-cache")
+
+
+def _encode_entry(entry: Dict[str, Any]) -> bytes:
+    # JSON rather than pickle: anything that can write to the directory must not be able to
+    # make the API execute code when the entry is read back.
+    payload = {**entry, "body": base64.b64encode(entry["body"]).decode("ascii")}
+    return zlib.compress(json.dumps(payload, separators=(",", ":")).encode(), 6)
+
+
+def _decode_entry(blob: bytes) -> Dict[str, Any]:
+    payload = json.loads(zlib.decompress(blob))
+    return {
+        "status_code": int(payload["status_code"]),
+        "headers": {str(k): str(v) for k, v in payload["headers"].items()},
+        "body": base64.b64decode(payload["body"]),
+        "stored_at": float(payload["stored_at"]),
+    }
+
+
+class SourceResponseCache:
+    # Raw label-source responses as zlib-compressed JSON, one file per key, in a directory only
+    # the API user can read or write (created 0700). Without a directory the
+    # cache lives in memory only. Bounded by max_bytes / max_entries (oldest written evicted
+    # first); entries older than max_age_s are pruned. Disk I/O is blocking: async callers
+    # run these methods in a thread.
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        ttl_s: float = DEFAULT_TTL_S,
+        negative_ttl_s: float = DEFAULT_NEGATIVE_TTL_S,
+        max_age_s: float = DEFAULT_MAX_AGE_S,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ):
+        self.directory = Path(directory) if directory else None
+        self.ttl_s = ttl_s
+        self.negative_ttl_s = min(negative_ttl_s, ttl_s)
+        self.max_age_s = max(max_age_s, ttl_s)
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._memory: Dict[str, bytes] = {}
+        # key -> (written_at, size), oldest first.
+        self._index: "OrderedDict[str, Tuple[float, int]]" = OrderedDict()
+        self._index_bytes = 0
+        self._scanned_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self.evictions = 0
+        if self.directory is not None:
+            self.directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_s > 0
+
+    def _path(self, key: str) -> Path:
+        assert self.directory is not None
+        return self.directory / f"{key}.resp.z"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        if self.directory is None:
+            with self._lock:
+                blob = self._memory.get(key)
+        else:
+            try:
+                blob = self._path(key).read_bytes()
+            except OSError:
+                blob = None
+        if blob is None:
+            return None
+        try:
+            entry = _decode_entry(blob)
+        except (ValueError, KeyError, TypeError, AttributeError, zlib.error):
+            return None
+        if time.time() - entry["stored_at"] >= self.max_age_s:
+            self._remove(key)
+            return None
+        return entry
+
+    def put(self, key: str, status_code: int, headers: Dict[str, str], body: bytes) -> Dict[str, Any]:
+        entry = {
+            "status_code": status_code,
+            "headers": {k: v for k, v in headers.items() if k.lower() in _KEPT_HEADERS},
+            "body": body,
+            "stored_at": time.time(),
+        }
+        self._write(key, entry)
+        return entry
+
+    def touch(self, key: str, entry: Dict[str, Any]) -> None:
+        # A 304 revalidation: same body, fresh again.
+        self._write(key, {**entry, "stored_at": time.time()})
+
+    def _write(self, key: str, entry: Dict[str, Any]) -> None:
+        blob = _encode_entry(entry)
+        if self.directory is None:
+            with self._lock:
+                self._memory[key] = blob
+                self._track(key, entry["stored_at"], len(blob))
+                self._enforce_budget()
+            return
+        path = self._path(key)
+        try:
+            tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_bytes(blob)
+            os.replace(tmp, path)
+        except OSError:
+            return
+        with self._lock:
+            self._rescan_if_due()
+            self._track(key, entry["stored_at"], len(blob))
+            self._enforce_budget()
+
+    def _track(self, key: str, written_at: float, size: int) -> None:
+        previous = self._index.pop(key, None)
+        if previous is not None:
+            self._index_bytes -= previous[1]
+        self._index[key] = (written_at, size)
+        self._index_bytes += size
+
+    def _rescan_if_due(self) -> None:
+        now = time.monotonic()
+        if self._scanned_at is not None and now - self._scanned_at < _RESCAN_INTERVAL_S:
+            return
+        assert self.directory is not None
+        self._scanned_at = now
+        found = []
+        for path in self.directory.glob("*.resp.z"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            found.append((stat.st_mtime, path.name[: -len(".resp.z")], stat.st_size))
+        self._index.clear()
+        self._index_bytes = 0
+        for written_at, key, size in sorted(found):
+            self._track(key, written_at, size)
+
+    def _enforce_budget(self) -> None:
+        cutoff = time.time() - self.max_age_s
+        while self._index:
+            key, (written_at, _) = next(iter(self._index.items()))
+            over_budget = self._index_bytes > self.max_bytes or len(self._index) > self.max_entries
+            if written_at >= cutoff and not over_budget:
+                break
+            self._drop(key)
+            self.evictions += 1
+
+    def _drop(self, key: str) -> None:
+        _, size = self._index.pop(key, (0.0, 0))
+        self._index_bytes -= size
+        if self.directory is None:
+            self._memory.pop(key, None)
+        else:
+            self._path(key).unlink(missing_ok=True)
+
+    def _remove(self, key: str) -> None:
+        with self._lock:
+            if key in self._index:
+                self._drop(key)
+            elif self.directory is None:
+                self._memory.pop(key, None)
+            else:
+                self._path(key).unlink(missing_ok=True)
+
+    def is_fresh(self, entry: Dict[str, Any]) -> bool:
+        ttl = self.negative_ttl_s if entry["status_code"] in NEGATIVE_STATUS else self.ttl_s
+        return time.time() - entry["stored_at"] < ttl
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._index), "bytes": self._index_bytes, "evictions": self.evictions}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._index.clear()
+            self._index_bytes = 0
+            if self.directory is not None:
+                for path in self.directory.glob("*.resp.z"):
+                    path.unlink(missing_ok=True)
+
+
+SOURCE_CACHE = SourceResponseCache(
+    directory=os.getenv("SOURCE_CACHE_DIR") or default_cache_directory(),
+    ttl_s=float(os.getenv("SOURCE_CACHE_TTL_S", str(DEFAULT_TTL_S))),
+    negative_ttl_s=float(os.getenv("SOURCE_CACHE_NEGATIVE_TTL_S", str(DEFAULT_NEGATIVE_TTL_S))),
+    max_age_s=float(os.getenv("SOURCE_CACHE_MAX_AGE_S", str(DEFAULT_MAX_AGE_S))),
+    max_bytes=int(os.getenv("SOURCE_CACHE_MAX_BYTES", str(DEFAULT_MAX_BYTES))),
+    max_entries=int(os.getenv("SOURCE_CACHE_MAX_ENTRIES", str(DEFAULT_MAX_ENTRIES))),
+)
@@ -0,0 +1,410 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Coroutine, Dict, Iterator, Optional, Set
+
+import httpx
+
+from .source_cache import NEGATIVE_STATUS, SOURCE_CACHE, SourceResponseCache, source_cache_key
+
+
+RETRYABLE_STATUS = frozenset({429, 500, 502, 503, 504})
+
+# Monotonic deadline shared by every request made in the current context (tasks inherit it).
+_DEADLINE: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("source_fetch_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, host: str, retry_in_s: float):
+        super().__init__(f"{host} is cooling down for {retry_in_s:.0f}s after repeated failures")
+        self.host = host
+        self.retry_in_s = retry_in_s
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float]) -> Iterator[Optional[float]]:
+    # Nested scopes can only shorten the budget.
+    if seconds is None:
+        yield _DEADLINE.get()
+        return
+    current = _DEADLINE.get()
+    deadline = time.monotonic() + seconds
+    if current is not None:
+        deadline = min(deadline, current)
+    token = _DEADLINE.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _DEADLINE.reset(token)
+
+
+def remaining_budget() -> Optional[float]:
+    deadline = _DEADLINE.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+class CircuitBreaker:
+    # Opens after failure_threshold consecutive failures; after cooldown_s one trial request is
+    # let through (half-open) and its outcome closes or re-opens the circuit.
+    def __init__(self, failure_threshold: int = 3, cooldown_s: float = 60.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown_s = cooldown_s
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.cooldown_s else "open"
+
+    def before_request(self, host: str) -> None:
+        state = self.state
+        if state == "open" or (state == "half_open" and self.trial_in_flight):
+            assert self.opened_at is not None
+            raise CircuitOpenError(host, max(0.0, self.opened_at + self.cooldown_s - time.monotonic()))
+        if state == "half_open":
+            self.trial_in_flight = True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.trial_in_flight or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self.trial_in_flight = False
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    # Retry-After is either delta-seconds or an HTTP date.
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def _header_dict(response: httpx.Response) -> Dict[str, str]:
+    return {k.lower(): v for k, v in response.headers.items()}
+
+
+def _cacheable(response: Optional[httpx.Response]) -> bool:
+    return response is not None and (response.is_success or response.status_code in NEGATIVE_STATUS)
+
+
+def _usable(response: Optional[httpx.Response]) -> Optional[httpx.Response]:
+    # Callers only ever see data or None; a definitive "not found" is None like any other miss.
+    if response is None or not (response.is_success or response.status_code == 304):
+        return None
+    return response
+
+
+class SourceHttpClient:
+    # One long-lived AsyncClient on a dedicated event loop thread, so keep-alive connections
+    # to the label sources survive across requests. Sync code submits coroutines with run().
+    def __init__(
+        self,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry_s: float = 30.0,
+        per_host_limit: int = 4,
+        retries: int = 3,
+        backoff_s: float = 0.5,
+        max_retry_after_s: float = 10.0,
+        breaker_threshold: int = 3,
+        breaker_cooldown_s: float = 60.0,
+        user_agent: Optional[str] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        cache: Optional[SourceResponseCache] = None,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry_s,
+        )
+        self.per_host_limit = max(1, per_host_limit)
+        self.retries = max(0, retries)
+        self.backoff_s = backoff_s
+        self.max_retry_after_s = max_retry_after_s
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown_s = breaker_cooldown_s
+        self.user_agent = user_agent
+        self.transport = transport
+        self.cache = cache
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._revalidating: Set[str] = set()
+        self._background: Set[asyncio.Task] = set()
+        self.requests = 0
+        self.retried = 0
+        self.failures = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.revalidations = 0
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="source-http", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def run(self, coro: Coroutine[Any, Any, Any], timeout: Optional[float] = None) -> Any:
+        loop = self._ensure_loop()
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            raise RuntimeError("SourceHttpClient.run() cannot block its own event loop; await the coroutine")
+        return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout)
+
+    def _http(self) -> httpx.AsyncClient:
+        # Only touched from the client's own loop.
+        if self._client is None:
+            headers = {"User-Agent": self.user_agent} if self.user_agent else None
+            self._client = httpx.AsyncClient(
+                limits=self.limits,
+                headers=headers,
+                follow_redirects=True,
+                transport=self.transport,
+            )
+        return self._client
+
+    def _slot(self, host: str) -> asyncio.Semaphore:
+        slot = self._host_slots.get(host)
+        if slot is None:
+            slot = self._host_slots[host] = asyncio.Semaphore(self.per_host_limit)
+        return slot
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = self._breakers[host] = CircuitBreaker(self.breaker_threshold, self.breaker_cooldown_s)
+        return breaker
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> Optional[float]:
+        # Full jitter on exponential backoff; a server-supplied Retry-After wins (plus jitter so
+        # parallel callers do not return in lockstep) unless it asks for longer than we wait.
+        if retry_after is not None:
+            if retry_after > self.max_retry_after_s:
+                return None
+            return retry_after + random.uniform(0.0, self.backoff_s)
+        return random.uniform(0.0, self.backoff_s * (2 ** attempt))
+
+    async def get(
+        self,
+        url: str,
+        params: Optional[dict] = None,
+        headers: Optional[dict] = None,
+        timeout: Optional[float] = None,
+    ) -> Optional[httpx.Response]:
+        # None means "no data": a non-retryable error, or retries exhausted. Cached responses are
+        # served even when stale; a stale entry is revalidated in the background. 404/410 are
+        # cached as well (with a shorter TTL), so a drug one source lacks is not re-fetched on
+        # every lookup. Raises CircuitOpenError for a cooling-down host and DeadlineExceeded once
+        # the budget is spent.
+        if self.cache is None or not self.cache.enabled:
+            return _usable(await self._fetch(url, params, headers, timeout))
+        key = source_cache_key(url, params, headers)
+        # Cache reads and writes touch the disk; keep them off the shared event loop.
+        entry = await asyncio.to_thread(self.cache.get, key)
+        if entry is None:
+            self.cache_misses += 1
+            response = await self._fetch(url, params, headers, timeout)
+            if _cacheable(response):
+                await asyncio.to_thread(
+                    self.cache.put, key, response.status_code, _header_dict(response), response.content
+                )
+            return _usable(response)
+
+        self.cache_hits += 1
+        if not self.cache.is_fresh(entry) and key not in self._revalidating:
+            self._revalidating.add(key)
+            task = asyncio.get_running_loop().create_task(
+                self._revalidate(key, entry, url, params, headers, timeout)
+            )
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+        if entry["status_code"] in NEGATIVE_STATUS:
+            return None
+        return httpx.Response(
+            entry["status_code"],
+            headers=entry["headers"],
+            content=entry["body"],
+            request=httpx.Request("GET", url, params=params),
+        )
+
+    async def _revalidate(
+        self,
+        key: str,
+        entry: Dict[str, Any],
+        url: str,
+        params: Optional[dict],
+        headers: Optional[dict],
+        timeout: Optional[float],
+    ) -> None:
+        assert self.cache is not None
+        conditional = dict(headers or {})
+        if entry["headers"].get("etag"):
+            conditional["If-None-Match"] = entry["headers"]["etag"]
+        if entry["headers"].get("last-modified"):
+            conditional["If-Modified-Since"] = entry["headers"]["last-modified"]
+        try:
+            try:
+                response = await self._fetch(url, params, conditional, timeout)
+            except (CircuitOpenError, DeadlineExceeded):
+                return
+            if response is not None and response.status_code == 304:
+                await asyncio.to_thread(self.cache.touch, key, entry)
+            elif _cacheable(response):
+                await asyncio.to_thread(
+                    self.cache.put, key, response.status_code, _header_dict(response), response.content
+                )
+            else:
+                return
+            self.revalidations += 1
+        finally:
+            self._revalidating.discard(key)
+
+    async def _fetch(
+        self,
+        url: str,
+        params: Optional[dict],
+        headers: Optional[dict],
+        timeout: Optional[float],
+    ) -> Optional[httpx.Response]:
+        # Returns any definitive answer (success, 304 or a non-retryable error status); None
+        # once retries are exhausted.
+        client = self._http()
+        host = httpx.URL(url).host
+        slot = self._slot(host)
+        breaker = self.breaker(host)
+        breaker.before_request(host)
+        try:
+            return await self._fetch_with_retries(client, url, params, headers, timeout, host, slot, breaker)
+        finally:
+            # A cancelled or deadline-aborted half-open trial must not leave the circuit stuck.
+            breaker.trial_in_flight = False
+
+    async def _fetch_with_retries(
+        self,
+        client: httpx.AsyncClient,
+        url: str,
+        params: Optional[dict],
+        headers: Optional[dict],
+        timeout: Optional[float],
+        host: str,
+        slot: asyncio.Semaphore,
+        breaker: CircuitBreaker,
+    ) -> Optional[httpx.Response]:
+        transport_failed = False
+        for attempt in range(self.retries + 1):
+            retry_after: Optional[float] = None
+            budget = remaining_budget()
+            if budget is not None and budget <= 0:
+                if transport_failed:
+                    # The host timed out or refused; count it even though the budget ended the retries.
+                    breaker.record_failure()
+                raise DeadlineExceeded(host)
+            call_timeout = timeout if budget is None else min(timeout or budget, budget)
+            async with slot:
+                self.requests += 1
+                try:
+                    response = await client.get(url, params=params, headers=headers, timeout=call_timeout)
+                    transport_failed = False
+                except httpx.TransportError:
+                    response = None
+                    transport_failed = True
+            if response is not None:
+                if response.status_code not in RETRYABLE_STATUS:
+                    # Any definitive answer (including 404) means the host itself is healthy.
+                    breaker.record_success()
+                    if not (response.is_success or response.status_code == 304):
+                        self.failures += 1
+                    return response
+                retry_after = _parse_retry_after(response.headers.get("Retry-After"))
+            delay = self._backoff(attempt, retry_after) if attempt < self.retries else None
+            if delay is None:
+                break
+            budget = remaining_budget()
+            if budget is not None and delay >= budget:
+                # No time left to retry: the host failed and the caller ran out of budget.
+                breaker.record_failure()
+                self.failures += 1
+                raise DeadlineExceeded(host)
+            self.retried += 1
+            await asyncio.sleep(delay)
+        breaker.record_failure()
+        self.failures += 1
+        return None
+
+    async def drain(self) -> None:
+        # Wait for background revalidations; used on shutdown and in tests.
+        while self._background:
+            await asyncio.gather(*list(self._background), return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "retried": self.retried,
+            "failures": self.failures,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "revalidations": self.revalidations,
+            "hosts": sorted(self._host_slots),
+            "circuits": {host: breaker.state for host, breaker in self._breakers.items()},
+            "cache": self.cache.stats() if self.cache is not None else None,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.drain(), loop).result(30)
+        client, self._client = self._client, None
+        if client is not None:
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop).result(5)
+        self._host_slots.clear()
+        loop.call_soon_threadsafe(loop.stop)
+
+
+SOURCE_HTTP = SourceHttpClient(
+    max_connections=int(os.getenv("SOURCE_HTTP_MAX_CONNECTIONS", "20")),
+    max_keepalive_connections=int(os.getenv("SOURCE_HTTP_MAX_KEEPALIVE", "10")),
+    per_host_limit=int(os.getenv("SOURCE_HTTP_PER_HOST_LIMIT", "4")),
+    retries=int(os.getenv("SOURCE_HTTP_RETRIES", "3")),
+    backoff_s=float(os.getenv("SOURCE_HTTP_BACKOFF_S", "0.5")),
+    max_retry_after_s=float(os.getenv("SOURCE_HTTP_MAX_RETRY_AFTER_S", "10")),
+    breaker_threshold=int(os.getenv("SOURCE_BREAKER_THRESHOLD", "3")),
+    breaker_cooldown_s=float(os.getenv("SOURCE_BREAKER_COOLDOWN_S", "60")),
+    cache=SOURCE_CACHE,
+)
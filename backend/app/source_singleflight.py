@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import copy
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Callable, ContextManager, Dict, Iterator, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+
+from .source_cache import normalize_lookup_value
+
+
+logger = logging.getLogger(__name__)
+
+
+def _advisory_key(key: str) -> int:
+    # pg advisory locks take a signed 64-bit key.
+    return int.from_bytes(hashlib.sha256(f"source-fetch:{key}".encode()).digest()[:8], "big", signed=True)
+
+
+@contextmanager
+def advisory_lock(engine: Engine, key: str, wait_s: float) -> Iterator[bool]:
+    # Cross-worker lock on a PostgreSQL session advisory lock; the server does the waiting,
+    # bounded by lock_timeout. Best effort: yields False (and the caller fetches anyway) on
+    # other databases, on errors, or when wait_s runs out.
+    if engine.dialect.name != "postgresql":
+        yield False
+        return
+    lock_id = _advisory_key(key)
+    try:
+        conn = engine.connect()
+    except Exception:
+        logger.warning("Source fetch lock unavailable; fetching without it", exc_info=True)
+        yield False
+        return
+    acquired = False
+    try:
+        # SET LOCAL only lasts for this transaction; the session-level lock outlives it.
+        conn.execute(text(f"SET LOCAL lock_timeout = '{max(1, int(wait_s * 1000))}ms'"))
+        conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": lock_id})
+        conn.commit()
+        acquired = True
+    except DBAPIError:
+        conn.rollback()
+        logger.info("Source fetch lock for %r not acquired within %.1fs; fetching without it", key, wait_s)
+    try:
+        yield acquired
+    finally:
+        try:
+            if acquired:
+                conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": lock_id})
+                conn.commit()
+        finally:
+            conn.close()
+
+
+class SingleFlight:
+    # One in-flight call per key: the first caller runs fn, concurrent callers for the same key
+    # wait for its result (or exception). Each caller gets its own deep copy, since callers
+    # mutate the returned dict. With cross_worker_lock the leader also serialises with other
+    # processes; a worker that waited then usually finds the responses in the shared source cache.
+    def __init__(self, cross_worker_lock: Optional[Callable[[str], ContextManager[Any]]] = None):
+        self.cross_worker_lock = cross_worker_lock
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        key = normalize_lookup_value(key)
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            return copy.deepcopy(future.result())
+        try:
+            if self.cross_worker_lock is None:
+                result = fn()
+            else:
+                with self.cross_worker_lock(key):
+                    result = fn()
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return copy.deepcopy(result)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": sorted(self._inflight)}
+
+
+def _db_fetch_lock(key: str) -> ContextManager[bool]:
+    from .core.db import engine
+    from .pharmacokinetics import SOURCE_FETCH_DEADLINE_S
+
+    # Waiting longer than one full fetch would mean the holder is stuck; go ahead without it.
+    return advisory_lock(engine, key, SOURCE_FETCH_DEADLINE_S + 2.0)
+
+
+SOURCE_FETCHES = SingleFlight(
+    cross_worker_lock=_db_fetch_lock
+    if os.getenv("SOURCE_FETCH_DB_LOCK", "").strip().lower() == "true"
+    else None,
+)
@@ -216,7 +216,7 @@ export default function PatientSimulations() {
             <ResponsiveContainer width="100%" height="100%">
               <LineChart data={chartData}>
                 <CartesianGrid strokeDasharray="3 3" />
-                <XAxis dataKey="time" />
+                <XAxis dataKey="time" type="number" domain={["dataMin", "dataMax"]} />
                 <YAxis />
                 <Tooltip />
                 <Line type="monotone" dataKey="conc" dot={false} strokeWidth={2} />
@@ -1259,6 +1259,8 @@ export default function Simulation() {
                   <CartesianGrid strokeDasharray="3 3" />
                   <XAxis
                     dataKey="time"
+                    type="number"
+                    domain={["dataMin", "dataMax"]}
                     label={{
                       value: "Time (hr)",
                       position: "insideBottom",